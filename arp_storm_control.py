@@ -1,75 +1,79 @@
-+# Copyright (C) 2011 Nippon Telegraph and Telephone Corporation.
-+#
-+# Licensed under the Apache License, Version 2.0 (the "License");
-+# you may not use this file except in compliance with the License.
-+# You may obtain a copy of the License at
-+#
-+#    http://www.apache.org/licenses/LICENSE-2.0
-+#
-+# Unless required by applicable law or agreed to in writing, software
-+# distributed under the License is distributed on an "AS IS" BASIS,
-+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
-+# implied.
-+# See the License for the specific language governing permissions and
-+# limitations under the License.
-+#
-+# Contributor:Li Cheng @BUPT
-+# Homepage:www.muzixing.com
-+# Time:2014/10/19
-+#
-+
-+from ryu.base import app_manager
-+from ryu.controller import ofp_event
-+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
-+from ryu.controller.handler import set_ev_cls
-+from ryu.ofproto import ofproto_v1_3
-+from ryu.lib.packet import packet
-+from ryu.lib.packet import ethernet
-+from ryu.lib.packet import arp
-+from ryu.lib.packet import ipv6
-+from ryu.lib import mac
-+
-+
-+class SimpleARPProxy13(app_manager.RyuApp):
-+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
-+
-+    def __init__(self, *args, **kwargs):
-+        super(SimpleARPProxy13, self).__init__(*args, **kwargs)
-+        self.mac_to_port = {}
-+        self.arp_table = {}
-+        self.sw = {}
-+
-+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
-+    def switch_features_handler(self, ev):
-+        datapath = ev.msg.datapath
-+        ofproto = datapath.ofproto
-+        parser = datapath.ofproto_parser
-+
-+        # install table-miss flow entry
-+        #
-+        # We specify NO BUFFER to max_len of the output action due to
-+        # OVS bug. At this moment, if we specify a lesser number, e.g.,
-+        # 128, OVS will send Packet-In with invalid buffer_id and
-+        # truncated packet data. In that case, we cannot output packets
-+        # correctly.
-+
-+        match = parser.OFPMatch()
-+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
-+                                          ofproto.OFPCML_NO_BUFFER)]
-+        self.add_flow(datapath, 0, match, actions)
-+
-+    def add_flow(self, datapath, priority, match, actions):
-+        ofproto = datapath.ofproto
-+        parser = datapath.ofproto_parser
-+
-+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
-+                                             actions)]
-+
-+        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-+                                idle_timeout=5, hard_timeout=15,
-+                                match=match, instructions=inst)
-+        datapath.send_msg(mod)
-+
+# Copyright (C) 2011 Nippon Telegraph and Telephone Corporation.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# Contributor:Li Cheng @BUPT
+# Homepage:www.muzixing.com
+# Time:2014/10/19
+#
+
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
+from ryu.controller.handler import set_ev_cls
+from ryu.ofproto import ofproto_v1_3
+from ryu.lib.packet import packet
+from ryu.lib.packet import ethernet
+from ryu.lib.packet import arp
+from ryu.lib import mac
+# Ethernet/ARP header parsing without decoding the whole packet
+from packet_header import ETH_TYPE_ARP
+from packet_header import ETH_TYPE_IPV6
+from packet_header import parse_arp
+from packet_header import parse_eth
+
+
+class SimpleARPProxy13(app_manager.RyuApp):
+    OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(SimpleARPProxy13, self).__init__(*args, **kwargs)
+        self.mac_to_port = {}
+        self.arp_table = {}
+        self.sw = {}
+
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        datapath = ev.msg.datapath
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        # install table-miss flow entry
+        #
+        # We specify NO BUFFER to max_len of the output action due to
+        # OVS bug. At this moment, if we specify a lesser number, e.g.,
+        # 128, OVS will send Packet-In with invalid buffer_id and
+        # truncated packet data. In that case, we cannot output packets
+        # correctly.
+
+        match = parser.OFPMatch()
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
+                                          ofproto.OFPCML_NO_BUFFER)]
+        self.add_flow(datapath, 0, match, actions)
+
+    def add_flow(self, datapath, priority, match, actions):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
+                                             actions)]
+
+        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
+                                idle_timeout=5, hard_timeout=15,
+                                match=match, instructions=inst)
+        datapath.send_msg(mod)
+
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
         msg = ev.msg
@@ -78,19 +82,22 @@
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        eth = parse_eth(msg.data)
+        if eth is None:
+            return None
         dst = eth.dst
         src = eth.src
         dpid = datapath.id
 
-        if pkt.get_protocol(ipv6.ipv6):  # Drop the IPV6 Packets.
+        if eth.ethertype == ETH_TYPE_IPV6:  # Drop the IPV6 Packets.
             match = parser.OFPMatch(eth_type=eth.ethertype)
             actions = []
             self.add_flow(datapath, 1, match, actions)
             return None
 
-        arp_pkt = pkt.get_protocol(arp.arp)
+        arp_pkt = None
+        if eth.ethertype == ETH_TYPE_ARP:
+            arp_pkt = parse_arp(msg.data, eth.offset)
         if arp_pkt:
             self.arp_table[arp_pkt.src_ip] = src  # ARP learning
 
@@ -103,7 +110,7 @@
         if dst in self.mac_to_port[dpid]:
             out_port = self.mac_to_port[dpid][dst]
         else:
-            if self.arp_handler(msg):  # 1:reply or drop;  0: flood
+            if self.arp_handler(msg, eth, arp_pkt):  # 1:reply or drop
                 return None
             else:
                 out_port = ofproto.OFPP_FLOOD
@@ -122,19 +129,15 @@
                                   in_port=in_port, actions=actions, data=data)
         datapath.send_msg(out)
 
-    def arp_handler(self, msg):
+    def arp_handler(self, msg, eth, arp_pkt):
+        """ eth and arp_pkt are the headers parsed by the packet in """
         datapath = msg.datapath
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
-        arp_pkt = pkt.get_protocol(arp.arp)
-
-        if eth:
-            eth_dst = eth.dst
-            eth_src = eth.src
+        eth_dst = eth.dst
+        eth_src = eth.src
 
         # Break the loop for avoiding ARP broadcast storm
         if eth_dst == mac.BROADCAST_STR and arp_pkt:
@@ -149,10 +152,6 @@
 
         # Try to reply arp request
         if arp_pkt:
-            hwtype = arp_pkt.hwtype
-            proto = arp_pkt.proto
-            hlen = arp_pkt.hlen
-            plen = arp_pkt.plen
             opcode = arp_pkt.opcode
             arp_src_ip = arp_pkt.src_ip
             arp_dst_ip = arp_pkt.dst_ip
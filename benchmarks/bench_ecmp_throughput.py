@@ -0,0 +1,114 @@
+#!/usr/bin/python
+"""
+    Aggregate throughput of concurrent flows with and without ECMP.
+
+    The controller runs against a fake FinalTopo network (fake_network.py)
+    in the label mode. HOSTS hosts are attached to the switches (like h1
+    and h2 in finalTopo.py) and FLOWS random (src, dst) pairs on different
+    switches send one long lived iperf-like flow each. The path of every
+    flow is the one its frames take in the fake switches (the select
+    groups hash the flows with ECMP_FORWARDING). Every link (and host
+    port) has LINK_CAPACITY Mbit/s in each direction, shared by its flows
+    with a max-min fair allocation (TCP like): the aggregate is the sum
+    of the flow rates. The results are averaged over SEEDS random sets
+    of pairs.
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/bench_ecmp_throughput.py [flows...]
+"""
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from fake_network import FINAL_TOPO_SWITCHES
+from fake_network import FakeNetwork
+from fake_network import mac
+
+FLOWS = [10, 20, 50, 100]
+HOSTS = 64
+LINK_CAPACITY = 100.0
+SEEDS = 5
+MODE = controller.FORWARD_LABEL
+
+
+def max_min_rates(flow_links, capacity):
+    """ Max-min fair rate of each flow (progressive filling)
+
+    flow_links maps each flow to the links it crosses.
+    """
+    remaining = {}
+    users = {}
+    for flow, links in flow_links.items():
+        for link in links:
+            remaining[link] = capacity
+            users.setdefault(link, set()).add(flow)
+    rates = {}
+    while len(rates) < len(flow_links):
+        # The link with the smallest fair share is the next bottleneck
+        link = min((link for link in users if users[link]),
+                   key=lambda link: remaining[link] / len(users[link]))
+        share = remaining[link] / len(users[link])
+        for flow in list(users[link]):
+            rates[flow] = share
+            for other in flow_links[flow]:
+                remaining[other] -= share
+                users[other].discard(flow)
+    return rates
+
+
+def run(ecmp, flows, seed=0):
+    controller.FORWARDING_MODE = MODE
+    controller.ECMP_FORWARDING = ecmp
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app)
+    macs = [mac(i) for i in range(HOSTS)]
+    for i, host in enumerate(macs):
+        net.attach(host, FINAL_TOPO_SWITCHES[i % len(FINAL_TOPO_SWITCHES)])
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    rnd = random.Random(seed)
+    pairs = set()
+    while len(pairs) < flows:
+        src, dst = rnd.sample(macs, 2)
+        if net.hosts[src][0] != net.hosts[dst][0]:
+            pairs.add((src, dst))
+    flow_links = {}
+    for src, dst in sorted(pairs):
+        # The first frame installs the ingress flow
+        net.send(src, dst)
+        if net.send(src, dst) != [dst]:
+            raise RuntimeError('%s -> %s not delivered' % (src, dst))
+        flow_links[(src, dst)] = [('host', src), ('host', dst)] + net.hops
+    rates = max_min_rates(flow_links, LINK_CAPACITY)
+    loads = {}
+    for links in flow_links.values():
+        for link in links[2:]:
+            loads[link] = loads.get(link, 0) + 1
+    return {'aggregate': sum(rates.values()),
+            'min': min(rates.values()),
+            'links': len(loads),
+            'max_load': max(loads.values())}
+
+
+def main(sizes):
+    print('%s mode, %d hosts, %d Mbit/s links, mean of %d runs' % (
+        MODE, HOSTS, LINK_CAPACITY, SEEDS))
+    print('%6s %6s %12s %10s %8s %10s' % (
+        'flows', 'ecmp', 'aggregate', 'min flow', 'links', 'max load'))
+    for flows in sizes:
+        for ecmp in (False, True):
+            results = [run(ecmp, flows, seed) for seed in range(SEEDS)]
+            mean = dict((key, float(sum(result[key] for result in results)) /
+                         len(results)) for key in results[0])
+            print('%6d %6s %12.1f %10.1f %8.1f %10.1f' % (
+                flows, 'on' if ecmp else 'off', mean['aggregate'],
+                mean['min'], mean['links'], mean['max_load']))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or FLOWS)
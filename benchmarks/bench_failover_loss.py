@@ -0,0 +1,100 @@
+#!/usr/bin/python
+"""
+    Packet loss when a FinalTopo link goes down, with and without the
+    fast failover groups (FAST_FAILOVER).
+
+    The controller runs against a fake FinalTopo network (fake_network.py).
+    HOSTS hosts on random switches and access points exchange traffic with
+    PEERS random peers each, then one switch to switch link goes down
+    (each link in turn, on a new network). Every pair sends one packet
+    while the controller is not yet told (the port status and LLDP delay:
+    only the switches can react) and one packet once the controller has
+    handled the link down. Packets not delivered to their destination are
+    lost.
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/bench_failover_loss.py
+"""
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from fake_network import FINAL_TOPO_APS
+from fake_network import FINAL_TOPO_LINKS
+from fake_network import FINAL_TOPO_SWITCHES
+from fake_network import FakeNetwork
+from fake_network import mac
+
+HOSTS = 20
+PEERS = 4
+# (forwarding mode, fast failover)
+CONFIGS = [(controller.FORWARD_HOST, False),
+           (controller.FORWARD_PIPELINE, False),
+           (controller.FORWARD_PIPELINE, True),
+           (controller.FORWARD_LABEL, False),
+           (controller.FORWARD_LABEL, True)]
+SWITCH_LINKS = [(u, v) for u, v in FINAL_TOPO_LINKS
+                if u in FINAL_TOPO_SWITCHES and v in FINAL_TOPO_SWITCHES]
+
+
+def send_all(net, pairs):
+    """ Send one packet per pair, returns the number lost """
+    return sum(1 for src, dst in pairs if dst not in net.send(src, dst))
+
+
+def run(mode, failover, link, seed=0):
+    controller.FORWARDING_MODE = mode
+    controller.FAST_FAILOVER = failover
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app)
+    rnd = random.Random(seed)
+    macs = [mac(i) for i in range(HOSTS)]
+    for host in macs:
+        net.attach(host, rnd.choice(FINAL_TOPO_SWITCHES + FINAL_TOPO_APS))
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    pairs = set()
+    for host in macs:
+        for peer in rnd.sample([peer for peer in macs if peer != host],
+                               PEERS):
+            pairs.update([(host, peer), (peer, host)])
+    pairs = sorted(pairs)
+    # Install the flows
+    send_all(net, pairs)
+    if send_all(net, pairs):
+        raise RuntimeError('Packets lost before the link down')
+    u_port, v_port = net.link_down(link[0], link[1], notify=False)
+    window = send_all(net, pairs)
+    net.notify_link_down(link[0], u_port, link[1], v_port)
+    packet_ins = net.packet_ins
+    after = send_all(net, pairs)
+    return {'pairs': len(pairs),
+            'window': window,
+            'after': after,
+            'packet_ins': net.packet_ins - packet_ins}
+
+
+def main():
+    print('%d links down in turn, %d hosts, %d peers per host' % (
+        len(SWITCH_LINKS), HOSTS, PEERS))
+    print('%9s %9s %12s %12s %12s' % (
+        'mode', 'failover', 'window loss', 'after loss', 'packets in'))
+    for mode, failover in CONFIGS:
+        total = {'pairs': 0, 'window': 0, 'after': 0, 'packet_ins': 0}
+        for link in SWITCH_LINKS:
+            result = run(mode, failover, link)
+            for key in total:
+                total[key] += result[key]
+        print('%9s %9s %11.2f%% %11.2f%% %12d' % (
+            mode, 'on' if failover else 'off',
+            100.0 * total['window'] / total['pairs'],
+            100.0 * total['after'] / total['pairs'], total['packet_ins']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+"""
+    Flows per switch in each forwarding mode of controller.py.
+
+    The controller runs against a fake FinalTopo network (fake_network.py).
+    Hosts are attached to the access points (ap*) and each one sends a
+    broadcast (to be learned) and one packet to PEERS random hosts. The
+    flows of every switch are counted, table-miss flows excluded.
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/bench_flow_count.py [hosts...]
+"""
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from fake_network import FINAL_TOPO_APS
+from fake_network import FakeNetwork
+from fake_network import mac
+
+HOSTS = [10, 100, 1000]
+PEERS = 10
+MODES = [controller.FORWARD_HOST, controller.FORWARD_PIPELINE,
+         controller.FORWARD_LABEL]
+CORE = [1, 6]
+
+
+def run(mode, hosts, seed=0):
+    controller.FORWARDING_MODE = mode
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    # Do not limit the packets in of the benchmark
+    app.limiter = None
+    net = FakeNetwork(app)
+    macs = [mac(i) for i in range(hosts)]
+    for i, host in enumerate(macs):
+        net.attach(host, FINAL_TOPO_APS[i % len(FINAL_TOPO_APS)])
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    rnd = random.Random(seed)
+    for host in macs:
+        for peer in rnd.sample(macs, min(PEERS, hosts - 1) + 1):
+            if peer != host:
+                net.send(host, peer)
+    flow_mods = sum(datapath.counts.get('OFPFlowMod', 0)
+                    for datapath in net.dps.values())
+    return net.flow_counts(), flow_mods
+
+
+def main(sizes):
+    print('%6s %9s %8s %8s %8s %8s %8s %10s' % (
+        'hosts', 'mode', 'total', 'max', 'mean', 's1', 's6', 'flow mods'))
+    for hosts in sizes:
+        for mode in MODES:
+            counts, flow_mods = run(mode, hosts)
+            total = sum(counts.values())
+            print('%6d %9s %8d %8d %8.1f %8d %8d %10d' % (
+                hosts, mode, total, max(counts.values()),
+                float(total) / len(counts), counts[CORE[0]], counts[CORE[1]],
+                flow_mods))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or HOSTS)
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+"""
+    Outage of each handover of the mobility.py workload, with and without
+    the make-before-break handover (MAKE_BEFORE_BREAK).
+
+    Same scenario as mobility.py on a fake FinalTopo (fake_network.py):
+    h0 streams to the other hosts over TCP and, in turns, a client moves
+    to a random AP port (10-20). Time goes in rounds: h0 sends one segment
+    to every client and a client ACKs only the segments it receives (a
+    starved TCP receiver is silent). After a move the rounds go on until
+    the segment to the moved client is forwarded by the switches again
+    (no packet in). Per handover:
+        lost: segments to the client not delivered
+        rounds: rounds until the flows carry the stream again
+        trips: controller round trips of the first segment delivered
+            (in sequence: the outage is about trips * controller RTT)
+        packet in: packets in raised meanwhile
+        copies: segments delivered to other hosts (floods)
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/bench_handover_outage.py [moves] [hosts]
+"""
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from fake_network import FINAL_TOPO_APS
+from fake_network import FINAL_TOPO_SWITCHES
+from fake_network import FakeNetwork
+from fake_network import mac
+
+MOVES = 100
+HOST_NUMBER = 9
+# Rounds between moves, and the most rounds waited after a move
+ROUNDS = 5
+MAX_ROUNDS = 20
+# mobility.py moves the hosts to ap2 ... ap9 (not ap10)
+MOVE_APS = FINAL_TOPO_APS[:-1]
+
+
+def stream_round(net, server, clients):
+    """ One segment to every client and the ACKs, returns the receivers
+    of each segment and its trips to the controller """
+    received = {}
+    for host in clients:
+        receivers = net.send(server, host)
+        received[host] = (receivers, net.trips.get(host))
+        if host in receivers:
+            net.send(host, server)
+    return received
+
+
+def run(make_before_break, moves, hosts, seed=0):
+    controller.MAKE_BEFORE_BREAK = make_before_break
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app)
+    rnd = random.Random(seed)
+    macs = [mac(i) for i in range(hosts)]
+    server, clients = macs[0], macs[1:]
+    for host in macs:
+        net.attach(host, rnd.choice(FINAL_TOPO_SWITCHES))
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    for _ in range(ROUNDS):
+        stream_round(net, server, clients)
+    total = {'lost': 0, 'rounds': 0, 'trips': 0, 'packet_ins': 0,
+             'copies': 0}
+    for move in range(moves):
+        client = clients[move % len(clients)]
+        ap = rnd.choice(MOVE_APS)
+        used = set(port for dpid, port in net.hosts.values() if dpid == ap)
+        port = rnd.choice([port for port in range(10, 21)
+                           if port not in used])
+        packet_ins = net.packet_ins
+        net.move(client, ap, port)
+        trips = None
+        for rounds in range(1, MAX_ROUNDS + 1):
+            before = net.packet_ins
+            received, segment_trips = stream_round(net, server,
+                                                   [client])[client]
+            if client not in received:
+                total['lost'] += 1
+            elif trips is None:
+                trips = segment_trips
+            total['copies'] += len([host for host in received
+                                    if host != client])
+            if client in received and net.packet_ins == before:
+                break
+        total['rounds'] += rounds
+        total['trips'] += trips or 0
+        total['packet_ins'] += net.packet_ins - packet_ins
+        for _ in range(ROUNDS):
+            stream_round(net, server, clients)
+    return dict((key, float(value) / moves) for key, value in total.items())
+
+
+def main(moves, hosts):
+    print('%d hosts, %d moves, per handover:' % (hosts, moves))
+    print('%18s %8s %8s %8s %10s %8s' % (
+        'handover', 'lost', 'rounds', 'trips', 'packet in', 'copies'))
+    for make_before_break in (False, True):
+        result = run(make_before_break, moves, hosts)
+        print('%18s %8.2f %8.2f %8.2f %10.2f %8.2f' % (
+            'make-before-break' if make_before_break else 'break-first',
+            result['lost'], result['rounds'], result['trips'],
+            result['packet_ins'], result['copies']))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else MOVES,
+         args[1] if len(args) > 1 else HOST_NUMBER)
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+"""
+    Packets lost after wireless re-associations (no port status), with
+    and without the host relocation (HOST_RELOCATION).
+
+    Same scenario as mobility.py on a fake FinalTopo (fake_network.py),
+    but the moves are silent (fake_network.roam): the old port stays up,
+    like an access point that does not report a station leaving. After a
+    move the client sends a gratuitous ARP (a broadcast) and h0 sends
+    PACKETS packets to every client. Then a client flaps between two
+    ports FLAPS times, sending one frame on each, to count the relocations
+    let through by the rate limit.
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/bench_host_relocation.py [moves] [hosts]
+"""
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from fake_network import FINAL_TOPO_APS
+from fake_network import FINAL_TOPO_SWITCHES
+from fake_network import FakeNetwork
+from fake_network import mac
+
+MOVES = 100
+HOST_NUMBER = 9
+PACKETS = 10
+FLAPS = 100
+MODES = [controller.FORWARD_HOST, controller.FORWARD_PIPELINE,
+         controller.FORWARD_LABEL]
+# mobility.py moves the hosts to ap2 ... ap9 (not ap10)
+MOVE_APS = FINAL_TOPO_APS[:-1]
+
+
+def run(mode, relocation, moves, hosts, seed=0):
+    controller.FORWARDING_MODE = mode
+    controller.HOST_RELOCATION = relocation
+    # The fake network reports the links as soon as the switches enter
+    controller.RELOCATION_SETTLE = 0
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app)
+    rnd = random.Random(seed)
+    macs = [mac(i) for i in range(hosts)]
+    server, clients = macs[0], macs[1:]
+    for host in macs:
+        net.attach(host, rnd.choice(FINAL_TOPO_SWITCHES))
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    start = net.packet_ins
+    lost = 0
+    for move in range(moves):
+        client = clients[move % len(clients)]
+        net.roam(client, rnd.choice(MOVE_APS))
+        # Relocations a second apart (the rate limit is for the flaps)
+        app.relocation_buckets.clear()
+        net.send(client, 'ff:ff:ff:ff:ff:ff', eth_type=0x0806)
+        for _ in range(PACKETS):
+            for host in clients:
+                if host not in net.send(server, host):
+                    lost += 1
+    packet_ins = net.packet_ins - start
+    relocations = app.relocations
+    client = clients[0]
+    ports = [net.hosts[client], (MOVE_APS[0], net.free_port(MOVE_APS[0]))]
+    for flap in range(FLAPS):
+        net.roam(client, *ports[flap % 2])
+        net.send(client, 'ff:ff:ff:ff:ff:ff', eth_type=0x0806)
+    return {'lost': lost,
+            'sent': moves * PACKETS * len(clients),
+            'packet_ins': packet_ins,
+            'relocations': relocations,
+            'flap_relocations': app.relocations - relocations}
+
+
+def main(moves, hosts):
+    print('%d hosts, %d silent moves, %d packets per client between moves, '
+          '%d flaps' % (hosts, moves, PACKETS, FLAPS))
+    print('%9s %11s %8s %10s %12s %10s' % (
+        'mode', 'relocation', 'lost', 'packet in', 'relocations',
+        'on flaps'))
+    for mode in MODES:
+        for relocation in (False, True):
+            result = run(mode, relocation, moves, hosts)
+            print('%9s %11s %7.2f%% %10d %12d %10d' % (
+                mode, 'on' if relocation else 'off',
+                100.0 * result['lost'] / result['sent'],
+                result['packet_ins'], result['relocations'],
+                result['flap_relocations']))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else MOVES,
+         args[1] if len(args) > 1 else HOST_NUMBER)
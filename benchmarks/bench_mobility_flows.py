@@ -0,0 +1,157 @@
+#!/usr/bin/python
+"""
+    Flow table occupancy and packets in of the mobility.py workload,
+    with per in_port flows and with dst only flows (DST_ONLY_FLOWS).
+
+    Same scenario as mobility.py on a fake FinalTopo (fake_network.py):
+    HOST_NUMBER hosts on random switches, h0 streams to the other hosts
+    (which send ACKs back) and, in turns, a client moves to a random AP
+    port (10-20). Between moves every client gets PACKETS packets. Each
+    pair gets its flows on its first packet in and a move reinstalls all
+    the paths of the client, so the dst only flows save flows but no
+    packet in there.
+
+    The packets in they save are the ones of new sources toward a
+    destination that already has flows: in the fan-in scenario
+    FAN_IN_SOURCES hosts on random switches start one after the other to
+    send to one sink (no reply). With per in_port flows the first packet
+    of each source misses on its ingress switch. With dst only flows it
+    only misses when the switch is not on the tree of the sink yet.
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/bench_mobility_flows.py [moves] [hosts]
+"""
+import logging
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from fake_network import FINAL_TOPO_APS
+from fake_network import FINAL_TOPO_SWITCHES
+from fake_network import FakeNetwork
+from fake_network import mac
+
+MOVES = 100
+HOST_NUMBER = 9
+PACKETS = 10
+# mobility.py moves the hosts to ap2 ... ap9 (not ap10)
+MOVE_APS = FINAL_TOPO_APS[:-1]
+FAN_IN_SOURCES = 50
+
+
+def run(dst_only, moves, hosts, seed=0):
+    controller.DST_ONLY_FLOWS = dst_only
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app)
+    rnd = random.Random(seed)
+    macs = [mac(i) for i in range(hosts)]
+    server, clients = macs[0], macs[1:]
+    for host in macs:
+        net.attach(host, rnd.choice(FINAL_TOPO_SWITCHES))
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    start = net.packet_ins
+    peak = 0
+    lost = 0
+    flooded = 0
+    for move in range(moves):
+        client = clients[move % len(clients)]
+        ap = rnd.choice(MOVE_APS)
+        used = set(port for dpid, port in net.hosts.values() if dpid == ap)
+        port = rnd.choice([port for port in range(10, 21)
+                           if port not in used])
+        net.move(client, ap, port)
+        for _ in range(PACKETS):
+            for host in clients:
+                for src, dst in ((server, host), (host, server)):
+                    received = net.send(src, dst)
+                    if dst not in received:
+                        lost += 1
+                    elif len(received) > 1:
+                        flooded += 1
+        peak = max(peak, sum(net.flow_counts().values()))
+    counts = net.flow_counts()
+    return {'packet_ins': net.packet_ins - start,
+            'lost': lost,
+            'flooded': flooded,
+            'total': sum(counts.values()),
+            'max': max(counts.values()),
+            'peak': peak}
+
+
+def run_fan_in(dst_only, sources, seed=0):
+    controller.DST_ONLY_FLOWS = dst_only
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app)
+    rnd = random.Random(seed)
+    macs = [mac(i) for i in range(sources + 1)]
+    sink = macs[0]
+    for host in macs:
+        net.attach(host, rnd.choice(FINAL_TOPO_SWITCHES + FINAL_TOPO_APS))
+    for host in macs:
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+    start = net.packet_ins
+    lost = 0
+    for host in macs[1:]:
+        for _ in range(PACKETS):
+            if sink not in net.send(host, sink):
+                lost += 1
+    counts = net.flow_counts()
+    return {'packet_ins': net.packet_ins - start,
+            'lost': lost,
+            'total': sum(counts.values())}
+
+
+def reduction(before, after):
+    if not before:
+        return 0.0
+    return 100.0 * (before - after) / before
+
+
+def main(moves, hosts):
+    print('%d hosts, %d moves, %d packets per client between moves' %
+          (hosts, moves, PACKETS))
+    print('%10s %10s %10s %8s %8s %8s %8s %8s' % (
+        'flows', 'packet in', 'per move', 'lost', 'flooded', 'total', 'max',
+        'peak'))
+    results = {}
+    for dst_only in (False, True):
+        result = results[dst_only] = run(dst_only, moves, hosts)
+        print('%10s %10d %10.1f %8d %8d %8d %8d %8d' % (
+            'dst' if dst_only else 'in_port', result['packet_ins'],
+            float(result['packet_ins']) / moves, result['lost'],
+            result['flooded'], result['total'], result['max'],
+            result['peak']))
+    before, after = results[False], results[True]
+    print('packet in reduction: %.1f%%' % reduction(before['packet_ins'],
+                                                    after['packet_ins']))
+    print('flow reduction: %.1f%%' % reduction(before['total'],
+                                               after['total']))
+    print('')
+    print('fan-in: %d sources to one sink, %d packets each' % (
+        FAN_IN_SOURCES, PACKETS))
+    print('%10s %10s %10s %8s %8s' % ('flows', 'packet in', 'per source',
+                                      'lost', 'total'))
+    for dst_only in (False, True):
+        result = results[dst_only] = run_fan_in(dst_only, FAN_IN_SOURCES)
+        print('%10s %10d %10.2f %8d %8d' % (
+            'dst' if dst_only else 'in_port', result['packet_ins'],
+            float(result['packet_ins']) / FAN_IN_SOURCES, result['lost'],
+            result['total']))
+    before, after = results[False], results[True]
+    print('packet in reduction: %.1f%%' % reduction(before['packet_ins'],
+                                                    after['packet_ins']))
+    print('flow reduction: %.1f%%' % reduction(before['total'],
+                                               after['total']))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else MOVES,
+         args[1] if len(args) > 1 else HOST_NUMBER)
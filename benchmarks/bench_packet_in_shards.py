@@ -0,0 +1,124 @@
+#!/usr/bin/python
+"""
+    Packets in per second of controller.py (host mode) routed on the hub
+    loop and by 1, 2, 4 ... worker processes (PACKET_IN_WORKERS).
+
+    The controller runs against a fake network (fake_network.py) of
+    SWITCHES randomly wired switches with HOSTS hosts. The fake datapaths
+    only serialize and count the messages (like a Ryu Datapath with the
+    switch on the other end of the socket), the packets in go straight to
+    the handler: PACKETS packets in between random host pairs, each one
+    raised by the edge switch of the source. At most BACKLOG packets in
+    wait for the workers, like a datapath socket the controller does not
+    read while it is busy.
+
+    Reported per run: packets in per second (wall clock), FlowMods sent,
+    the CPU seconds of the controller process and of the busiest worker,
+    and the packets in per second with one core per process, the packets
+    over the busiest of these CPU times. The wall clock rate only scales
+    with as many cores as processes (the count is printed).
+
+    Needs Ryu (eventlet). Run from the repository root:
+        python benchmarks/bench_packet_in_shards.py [workers...]
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import controller
+from shard import cpu_time
+from fake_network import FakeNetwork
+from fake_network import Packet
+from fake_network import mac
+from fake_network import random_links
+
+SWITCHES = 100
+HOSTS = 400
+PACKETS = 20000
+BACKLOG = 1000
+WORKERS = [0, 1, 2, 4]
+
+
+def setup(workers):
+    controller.FORWARDING_MODE = controller.FORWARD_HOST
+    controller.PACKET_IN_WORKERS = workers
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app, random_links(SWITCHES), apply=False)
+    rnd = random.Random(0)
+    for i in range(HOSTS):
+        net.attach(mac(i), rnd.randint(1, SWITCHES))
+    # The controller learns the hosts from their broadcasts
+    for i in range(HOSTS):
+        dpid, port = net.hosts[mac(i)]
+        net.packet_in(net.dps[dpid], port,
+                      Packet(mac(i), 'ff:ff:ff:ff:ff:ff'))
+    return app, net
+
+
+def flow_mods(net):
+    return sum(datapath.counts.get('OFPFlowMod', 0)
+               for datapath in net.dps.values())
+
+
+def run(workers):
+    app, net = setup(workers)
+    rnd = random.Random(1)
+    hosts = sorted(net.hosts)
+    packets = []
+    for _ in range(PACKETS):
+        src, dst = rnd.sample(hosts, 2)
+        dpid, port = net.hosts[src]
+        packets.append((net.dps[dpid], port, Packet(src, dst)))
+    shards = app.shards
+    mods = flow_mods(net)
+    worker_cpu = list(shards.cpu) if shards else []
+    gc.collect()
+    gc.disable()
+    start = time.time()
+    start_cpu = cpu_time()
+    for datapath, port, pkt in packets:
+        net.packet_in(datapath, port, pkt)
+        if shards is not None and shards.pending >= BACKLOG:
+            shards.wait(BACKLOG // 2)
+    if shards is not None:
+        shards.wait()
+    elapsed = time.time() - start
+    main_cpu = cpu_time() - start_cpu
+    gc.enable()
+    busiest = 0.0
+    if shards is not None:
+        busiest = max(cpu - before
+                      for cpu, before in zip(shards.cpu, worker_cpu))
+        shards.close()
+    return {'rate': PACKETS / elapsed,
+            'flow_mods': flow_mods(net) - mods,
+            'main_cpu': main_cpu,
+            'worker_cpu': busiest,
+            'core_rate': PACKETS / max(main_cpu, busiest),
+            'stale': app.stale_packet_ins}
+
+
+def main(counts):
+    print('%d switches, %d hosts, %d packets in, %d CPUs' % (
+        SWITCHES, HOSTS, PACKETS, multiprocessing.cpu_count()))
+    print('%8s %12s %10s %9s %11s %14s %6s' % (
+        'workers', 'packet in/s', 'FlowMods', 'main CPU', 'worker CPU',
+        'per core in/s', 'stale'))
+    for workers in counts:
+        result = run(workers)
+        print('%8s %12.0f %10d %9.2f %11s %14.0f %6d' % (
+            workers or 'hub', result['rate'], result['flow_mods'],
+            result['main_cpu'],
+            '%.2f' % result['worker_cpu'] if workers else '-',
+            result['core_rate'], result['stale']))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or WORKERS)
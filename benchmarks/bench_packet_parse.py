@@ -0,0 +1,97 @@
+#!/usr/bin/python
+"""
+    Packet in parsing cost: ryu.lib.packet vs. packet_header.
+
+    "before" is what the packet in handlers did: a full
+    packet.Packet(msg.data) decode and get_protocols()/get_protocol().
+    "after" reads only the Ethernet (and ARP) headers with
+    packet_header.parse_eth / parse_arp. Rates are parses per second,
+    i.e. the packet-in rate the parsing alone allows.
+
+    Run from the repository root:
+        python benchmarks/bench_packet_parse.py
+"""
+import os
+import sys
+import time
+
+from ryu.lib.packet import arp
+from ryu.lib.packet import ethernet
+from ryu.lib.packet import ipv4
+from ryu.lib.packet import lldp
+from ryu.lib.packet import packet
+from ryu.lib.packet import tcp
+from ryu.ofproto import ether
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from packet_header import ETH_TYPE_ARP
+from packet_header import parse_arp
+from packet_header import parse_eth
+
+ROUNDS = 20000
+SRC = '00:00:00:00:00:01'
+DST = '00:00:00:00:00:02'
+
+
+def build(*protocols):
+    pkt = packet.Packet()
+    for proto in protocols:
+        pkt.add_protocol(proto)
+    pkt.serialize()
+    return bytes(pkt.data)
+
+
+def frames():
+    tcp_frame = build(ethernet.ethernet(DST, SRC, ether.ETH_TYPE_IP),
+                      ipv4.ipv4(src='10.0.0.1', dst='10.0.0.2', proto=6),
+                      tcp.tcp(src_port=5000, dst_port=8080),
+                      b'x' * 1000)
+    arp_frame = build(ethernet.ethernet('ff:ff:ff:ff:ff:ff', SRC,
+                                        ether.ETH_TYPE_ARP),
+                      arp.arp_ip(arp.ARP_REQUEST, SRC, '10.0.0.1',
+                                 '00:00:00:00:00:00', '10.0.0.2'))
+    tlvs = (lldp.ChassisID(subtype=lldp.ChassisID.SUB_LOCALLY_ASSIGNED,
+                           chassis_id=b'dpid:0000000000000001'),
+            lldp.PortID(subtype=lldp.PortID.SUB_PORT_COMPONENT,
+                        port_id=b'\x00\x00\x00\x01'),
+            lldp.TTL(ttl=120),
+            lldp.End())
+    lldp_frame = build(ethernet.ethernet(lldp.LLDP_MAC_NEAREST_BRIDGE, SRC,
+                                         ether.ETH_TYPE_LLDP),
+                       lldp.lldp(tlvs))
+    return [('ipv4/tcp', tcp_frame), ('arp', arp_frame),
+            ('lldp', lldp_frame)]
+
+
+def before(data):
+    pkt = packet.Packet(data)
+    eth = pkt.get_protocols(ethernet.ethernet)[0]
+    arp_pkt = pkt.get_protocol(arp.arp)
+    return eth.dst, eth.src, eth.ethertype, arp_pkt
+
+
+def after(data):
+    eth = parse_eth(data)
+    arp_pkt = None
+    if eth.ethertype == ETH_TYPE_ARP:
+        arp_pkt = parse_arp(data, eth.offset)
+    return eth.dst, eth.src, eth.ethertype, arp_pkt
+
+
+def rate(func, data, rounds=ROUNDS):
+    start = time.time()
+    for _ in range(rounds):
+        func(data)
+    return rounds / (time.time() - start)
+
+
+def main():
+    print('%-10s %16s %16s %8s' % ('frame', 'before (pkt/s)', 'after (pkt/s)',
+                                   'speedup'))
+    for name, data in frames():
+        old, new = rate(before, data), rate(after, data)
+        print('%-10s %16.0f %16.0f %7.1fx' % (name, old, new, new / old))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+"""
+    Hub loop lag of controller.py while the routes are recomputed, with
+    the routes computed on the hub loop and in a worker thread
+    (ASYNC_ROUTES).
+
+    The controller runs in the label mode against a fake network
+    (fake_network.py) of SWITCHES randomly wired switches with HOSTS
+    hosts. For DURATION seconds, three green threads share the hub loop:
+        load: synthetic packets in, RATE per second (random host pairs)
+        churn: a random switch link goes down (or back up) every
+            CHURN_INTERVAL seconds, the routes are recomputed
+        probe: sleeps PROBE_INTERVAL seconds in a loop, the lag is how
+            late it wakes up (an echo request would wait as long)
+    Reported: the packets in handled per second, the lag percentiles (ms)
+    and the route computations (completed, stale results dropped). The
+    cyclic garbage collector is off meanwhile (GC_ENABLED): its full
+    collections of the fake flow tables stall the loop for hundreds of ms
+    in both runs and would hide the route computations. The worker
+    process only helps with a spare CPU core (the count is printed).
+
+    Needs Ryu (eventlet). Run from the repository root:
+        python benchmarks/bench_route_offload.py [switches] [rate]
+"""
+import gc
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from ryu.lib import hub
+import controller
+from fake_network import FakeNetwork
+from fake_network import Packet
+from fake_network import mac
+from fake_network import random_links
+
+SWITCHES = 400
+HOSTS = 200
+RATE = 10000
+DURATION = 6.0
+CHURN_INTERVAL = 1.0
+PROBE_INTERVAL = 0.001
+GC_ENABLED = False
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def settle(app):
+    while app.route_worker.busy:
+        hub.sleep(0.01)
+
+
+class Load(object):
+    """ The three green threads of a run """
+
+    def __init__(self, net, rate, seed=0):
+        self.net = net
+        self.rate = rate
+        self.rnd = random.Random(seed)
+        self.hosts = sorted(net.hosts)
+        self.links = sorted(set(
+            tuple(sorted((u, v))) for (u, _), (v, _)
+            in net.links.items()))
+        self.handled = 0
+        self.lags = []
+        self.running = True
+
+    def load(self):
+        start = time.time()
+        while self.running:
+            due = int((time.time() - start) * self.rate)
+            # At most 1 ms of packets at once when late
+            for _ in range(min(due - self.handled, self.rate // 1000)):
+                src, dst = self.rnd.sample(self.hosts, 2)
+                dpid, port = self.net.hosts[src]
+                datapath = self.net.dps[dpid]
+                self.net.packet_in(datapath, port, Packet(src, dst))
+                datapath.packet_outs = []
+                self.handled += 1
+            hub.sleep(0.001 if due <= self.handled else 0)
+
+    def churn(self):
+        down = None
+        while self.running:
+            hub.sleep(CHURN_INTERVAL)
+            if down is None:
+                u, v = self.rnd.choice(self.links)
+                u_port, v_port = self.net.link_down(u, v)
+                down = (u, u_port, v, v_port)
+            else:
+                self.net.link_up(*down)
+                down = None
+
+    def probe(self):
+        while self.running:
+            start = time.time()
+            hub.sleep(PROBE_INTERVAL)
+            self.lags.append(time.time() - start - PROBE_INTERVAL)
+
+
+def run(async_routes, switches, rate):
+    controller.FORWARDING_MODE = controller.FORWARD_LABEL
+    # The setup (one route update per link) coalesces in the worker
+    controller.ASYNC_ROUTES = True
+    app = controller.SimpleSwitch13()
+    app.logger.setLevel(logging.WARNING)
+    app.limiter = None
+    net = FakeNetwork(app, random_links(switches))
+    settle(app)
+    rnd = random.Random(0)
+    for i in range(HOSTS):
+        net.attach(mac(i), rnd.randint(1, switches))
+    for i in range(HOSTS):
+        net.send(mac(i), 'ff:ff:ff:ff:ff:ff')
+    controller.ASYNC_ROUTES = async_routes
+    stale = app.stale_routes
+    completed = app.route_worker.completed
+    load = Load(net, rate)
+    threads = [hub.spawn(load.load), hub.spawn(load.churn),
+               hub.spawn(load.probe)]
+    if not GC_ENABLED:
+        gc.disable()
+    start = time.time()
+    hub.sleep(DURATION)
+    load.running = False
+    hub.joinall(threads)
+    elapsed = time.time() - start
+    gc.enable()
+    settle(app)
+    app.route_worker.close()
+    return {'handled': load.handled / elapsed,
+            'p50': 1000 * percentile(load.lags, 0.5),
+            'p99': 1000 * percentile(load.lags, 0.99),
+            'max': 1000 * max(load.lags),
+            'computed': app.route_worker.completed - completed,
+            'stale': app.stale_routes - stale}
+
+
+def main(switches, rate):
+    print('%d switches, %d hosts, %d packets in/s offered, a link change '
+          'every %.1f s, %.0f s, %d CPUs' % (
+              switches, HOSTS, rate, CHURN_INTERVAL, DURATION,
+              multiprocessing.cpu_count()))
+    print('%8s %12s %9s %9s %9s %9s %7s' % (
+        'routes', 'packet in/s', 'lag p50', 'lag p99', 'lag max', 'computed',
+        'stale'))
+    for async_routes in (False, True):
+        result = run(async_routes, switches, rate)
+        print('%8s %12.0f %9.2f %9.2f %9.2f %9s %7d' % (
+            'worker' if async_routes else 'hub', result['handled'],
+            result['p50'], result['p99'], result['max'],
+            result['computed'] if async_routes else '-', result['stale']))
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(args[0] if args else SWITCHES, args[1] if len(args) > 1 else RATE)
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+"""
+    Spanning tree update cost: full rebuild vs. incremental.
+
+    For each size, a random connected topology (a ring plus random extra
+    links, mean degree ~4 like FinalTopo) gets a sequence of link down /
+    link up events. After each event the tree is either rebuilt with
+    nx.minimum_spanning_tree (what controller.py did) or updated with
+    DynamicSpanningTree.
+
+    Run from the repository root:
+        python benchmarks/bench_spanning_tree.py [sizes...]
+"""
+import os
+import random
+import sys
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from spanning_tree import DynamicSpanningTree
+
+SIZES = [100, 1000, 5000]
+EVENTS = 200
+REBUILD_EVENTS = 20
+
+
+def random_topology(n, seed=0):
+    rnd = random.Random(seed)
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n))
+    for i in range(n):
+        graph.add_edge(i, (i + 1) % n)
+    while graph.number_of_edges() < 2 * n:
+        u, v = rnd.randrange(n), rnd.randrange(n)
+        if u != v:
+            graph.add_edge(u, v)
+    return graph
+
+
+def link_events(graph, count, seed=0):
+    """ (down, link) events, every link down is followed by its link up """
+    rnd = random.Random(seed)
+    edges = list(graph.edges())
+    events = []
+    for _ in range(count // 2):
+        edge = rnd.choice(edges)
+        events.append((True, edge))
+        events.append((False, edge))
+    return events
+
+
+def bench_rebuild(graph, events):
+    start = time.time()
+    for down, (u, v) in events:
+        if down:
+            graph.remove_edge(u, v)
+        else:
+            graph.add_edge(u, v)
+        nx.minimum_spanning_tree(graph)
+    return (time.time() - start) / len(events)
+
+
+def bench_incremental(graph, events):
+    tree = DynamicSpanningTree()
+    for u, v in graph.edges():
+        tree.add_edge(u, v)
+    changed = 0
+    start = time.time()
+    for down, (u, v) in events:
+        if down:
+            changed += len(tree.remove_edge(u, v))
+        else:
+            changed += len(tree.add_edge(u, v))
+    elapsed = (time.time() - start) / len(events)
+    return elapsed, float(changed) / len(events)
+
+
+def main(sizes):
+    print('%8s %8s %14s %14s %8s %12s' % ('switches', 'links', 'rebuild (ms)',
+                                          'incr. (ms)', 'speedup',
+                                          'changed dps'))
+    for n in sizes:
+        graph = random_topology(n)
+        rebuild = bench_rebuild(graph.copy(),
+                                link_events(graph, REBUILD_EVENTS))
+        incr, changed = bench_incremental(graph, link_events(graph, EVENTS))
+        print('%8d %8d %14.3f %14.4f %7.0fx %12.1f' % (
+            n, graph.number_of_edges(), rebuild * 1000, incr * 1000,
+            rebuild / incr if incr else 0, changed))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+"""
+    Memory and routing latency of the network graph of controller.py:
+    networkx DiGraph against TopologyStore (SPARSE_TOPOLOGY).
+
+    Every topology has NODES nodes, one switch for HOSTS_PER_SWITCH hosts.
+    The switches form a random connected graph (a random tree plus extra
+    links, DEGREE links per switch on average) and every host hangs from
+    a random switch, with the node and edge attributes the controller
+    sets. Measured on each graph:
+        memory: bytes of the graph objects (CSR arrays included)
+        path: one host to host shortest path (path_cache.get)
+        tree: the paths of every node to a host (get_tree_path)
+        lengths: hop counts of every node to a switch (ECMP next hops)
+        all pairs: hop counts of every pair (ALL_PAIRS_MAX nodes at most)
+    Latencies are the mean of QUERIES queries, in milliseconds.
+
+    Needs networkx, numpy and scipy. Run from the repository root:
+        python benchmarks/bench_topology_store.py [nodes...]
+"""
+import gc
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import networkx as nx
+import numpy as np
+from topology_store import TopologyStore
+from topology_store import shortest_path
+from topology_store import shortest_path_length
+
+NODES = [1000, 2000, 5000, 10000]
+HOSTS_PER_SWITCH = 4
+DEGREE = 4
+QUERIES = 20
+ALL_PAIRS_MAX = 2000
+
+
+def topology(nodes, seed=0):
+    """ Return the nodes and edges ((u, v, port)) of a random topology """
+    rnd = random.Random(seed)
+    switches = list(range(1, nodes // (HOSTS_PER_SWITCH + 1) + 1))
+    hosts = ['00:00:00:%02x:%02x:%02x' % (i >> 16, (i >> 8) & 0xff,
+                                          i & 0xff)
+             for i in range(nodes - len(switches))]
+    ports = dict((dpid, 0) for dpid in switches)
+    links = set()
+    for i, dpid in enumerate(switches[1:], 1):
+        links.add((switches[rnd.randrange(i)], dpid))
+    while len(links) < len(switches) * DEGREE // 2:
+        u, v = rnd.sample(switches, 2)
+        if (v, u) not in links:
+            links.add((u, v))
+    edges = []
+    for u, v in sorted(links):
+        ports[u] += 1
+        ports[v] += 1
+        edges.append((u, v, ports[u]))
+        edges.append((v, u, ports[v]))
+    for host in hosts:
+        dpid = rnd.choice(switches)
+        ports[dpid] += 1
+        edges.append((host, dpid, ports[dpid]))
+        edges.append((dpid, host, ports[dpid]))
+    return switches, hosts, edges
+
+
+def build(graph, switches, hosts, edges):
+    for dpid in switches:
+        graph.add_node(dpid, n_type='switch', has_host='false')
+    for host in hosts:
+        graph.add_node(host, n_type='host')
+    for u, v, port in edges:
+        graph.add_edge(u, v, {'port': port})
+    return graph
+
+
+def deep_size(obj, seen=None):
+    """ Bytes of obj and of everything it references """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_size(item, seen)
+    elif hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+def mean_ms(function, args):
+    start = time.time()
+    for arg in args:
+        function(*arg)
+    return 1000.0 * (time.time() - start) / len(args)
+
+
+def run(graph, switches, hosts, rnd):
+    pairs = [tuple(rnd.sample(hosts, 2)) for _ in range(QUERIES)]
+    targets = [(rnd.choice(hosts),) for _ in range(QUERIES)]
+    egresses = [(rnd.choice(switches),) for _ in range(QUERIES)]
+    result = {
+        'path': mean_ms(lambda src, dst: shortest_path(graph, src, dst),
+                        pairs),
+        'tree': mean_ms(lambda dst: shortest_path(graph, target=dst),
+                        targets),
+        'lengths': mean_ms(
+            lambda dst: shortest_path_length(graph, target=dst), egresses),
+        'all_pairs': None}
+    nodes = len(switches) + len(hosts)
+    if nodes <= ALL_PAIRS_MAX:
+        if isinstance(graph, TopologyStore):
+            result['all_pairs'] = mean_ms(graph.distance_matrix, [()])
+        else:
+            result['all_pairs'] = mean_ms(
+                lambda: nx.all_pairs_shortest_path_length(graph), [()])
+    result['memory'] = deep_size(graph)
+    return result
+
+
+def main(sizes):
+    print('%d hosts per switch, %d links per switch, mean of %d queries '
+          '(ms)' % (HOSTS_PER_SWITCH, DEGREE, QUERIES))
+    print('%6s %9s %10s %8s %9s %9s %9s %10s' % (
+        'nodes', 'graph', 'memory KB', 'build', 'path', 'tree', 'lengths',
+        'all pairs'))
+    for nodes in sizes:
+        switches, hosts, edges = topology(nodes)
+        for name, cls in (('networkx', nx.DiGraph),
+                          ('csr', TopologyStore)):
+            gc.collect()
+            start = time.time()
+            graph = build(cls(), switches, hosts, edges)
+            built = 1000.0 * (time.time() - start)
+            result = run(graph, switches, hosts, random.Random(nodes))
+            all_pairs = result['all_pairs']
+            print('%6d %9s %10d %8.1f %9.2f %9.2f %9.2f %10s' % (
+                nodes, name, result['memory'] // 1024, built,
+                result['path'], result['tree'], result['lengths'],
+                '%.1f' % all_pairs if all_pairs is not None else '-'))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or NODES)
@@ -0,0 +1,778 @@
+"""
+    Fake OpenFlow 1.3 network to drive the controllers without Mininet.
+
+    FakeDatapath keeps the flow and group tables built by the messages a
+    controller sends and forwards packets through them (the fields used by
+    the controllers only: in_port, Ethernet addresses, VLAN and metadata).
+    FakeNetwork wires the datapaths (FinalTopo by default), sends the
+    switch and link events to the handlers of a Ryu app (its set_ev_cls
+    methods, as the Ryu event loop does), answers its topology requests
+    (ryu.topology.api get_switch / get_link) and moves packets between
+    switches and hosts, raising packets in on table misses and applying
+    the PacketOuts of the app.
+
+    Used by the benchmark scripts of this directory.
+"""
+import collections
+import inspect
+import random
+import struct
+import time
+
+from ryu.controller import ofp_event
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+from ryu.topology import event
+from ryu.topology import switches
+
+from packet_header import ETH_TYPE_ARP
+from packet_header import parse_arp
+
+ofp = ofproto_v1_3
+parser = ofproto_v1_3_parser
+
+# FinalTopo switch links and access points (finalTopo.py, mobility.py)
+FINAL_TOPO_LINKS = [
+    (7, 1), (7, 2), (1, 2), (1, 8), (1, 3), (1, 6), (8, 3), (2, 5), (2, 4),
+    (3, 5), (3, 4), (4, 9), (4, 6), (5, 6), (5, 0x10), (9, 6), (0x10, 6),
+    (0x1002, 2), (0x1003, 3), (0x1004, 4), (0x1005, 5), (0x1007, 7),
+    (0x1008, 8), (0x1009, 9), (0x1010, 0x10)]
+FINAL_TOPO_SWITCHES = [1, 2, 3, 4, 5, 6, 7, 8, 9, 0x10]
+FINAL_TOPO_APS = [0x1002, 0x1003, 0x1004, 0x1005, 0x1007, 0x1008, 0x1009,
+                  0x1010]
+# Packets crossing more switches are dropped (loops)
+MAX_HOPS = 64
+# Copies of a frame processed by the switches before the rest is dropped
+# (floods on loops)
+MAX_COPIES = 10000
+
+
+def random_links(count, degree=4, seed=0):
+    """ Links of count switches (dpid 1 to count) wired at random
+
+    A random tree (so the switches are connected) plus extra links, degree
+    links per switch on average.
+    """
+    rnd = random.Random(seed)
+    links = set()
+    for dpid in range(2, count + 1):
+        links.add((rnd.randint(1, dpid - 1), dpid))
+    while len(links) < count * degree // 2:
+        u, v = rnd.sample(range(1, count + 1), 2)
+        if (v, u) not in links:
+            links.add((u, v))
+    return sorted(links)
+
+
+def fat_tree_links(k=4):
+    """ Links of a k-ary fat tree (k even)
+
+    (k/2)^2 core switches (dpid 1 ...), then k pods of k/2 aggregation
+    and k/2 edge switches. The hosts go on the edge switches, see
+    fat_tree_edges.
+    """
+    half = k // 2
+    cores = list(range(1, half * half + 1))
+    links = []
+    dpid = len(cores)
+    for pod in range(k):
+        aggs = list(range(dpid + 1, dpid + half + 1))
+        edges = list(range(dpid + half + 1, dpid + k + 1))
+        dpid += k
+        for i, agg in enumerate(aggs):
+            for core in cores[i * half:(i + 1) * half]:
+                links.append((core, agg))
+            for edge in edges:
+                links.append((agg, edge))
+    return links
+
+
+def fat_tree_edges(k=4):
+    """ dpids of the edge switches of fat_tree_links(k) """
+    half = k // 2
+    return [half * half + pod * k + half + i + 1
+            for pod in range(k) for i in range(half)]
+
+
+def mac(i):
+    """ MAC address of the host number i (learned by the controllers) """
+    return '00:00:00:%02x:%02x:%02x' % ((i >> 16) & 0xff, (i >> 8) & 0xff,
+                                        i & 0xff)
+
+
+def ip(i):
+    """ IPv4 address of the host number i """
+    return '10.%d.%d.%d' % ((i >> 16) & 0xff, (i >> 8) & 0xff, i & 0xff)
+
+
+def mac_bytes(address):
+    return struct.pack('!6B', *[int(x, 16) for x in address.split(':')])
+
+
+def ip_bytes(address):
+    return struct.pack('!4B', *[int(x) for x in address.split('.')])
+
+
+class Packet(object):
+    """ Header fields of a frame
+
+    arp is (opcode, src_ip, dst_ip, dst_mac) for an ARP frame (the
+    sender MAC is eth_src).
+    """
+    __slots__ = ('eth_src', 'eth_dst', 'eth_type', 'vlan_vid', 'metadata',
+                 'arp')
+
+    def __init__(self, eth_src, eth_dst, eth_type=0x0800, vlan_vid=None,
+                 arp=None):
+        self.eth_src = eth_src
+        self.eth_dst = eth_dst
+        self.eth_type = eth_type
+        self.vlan_vid = vlan_vid
+        self.metadata = 0
+        self.arp = arp
+
+    @classmethod
+    def arp_request(cls, src, src_ip, dst_ip):
+        """ Broadcast ARP request of src for dst_ip """
+        return cls(src, 'ff:ff:ff:ff:ff:ff', ETH_TYPE_ARP,
+                   arp=(1, src_ip, dst_ip, '00:00:00:00:00:00'))
+
+    def copy(self):
+        pkt = Packet(self.eth_src, self.eth_dst, self.eth_type,
+                     self.vlan_vid, self.arp)
+        pkt.metadata = self.metadata
+        return pkt
+
+    def data(self):
+        """ The frame bytes (a packet in payload) """
+        header = mac_bytes(self.eth_dst) + mac_bytes(self.eth_src)
+        if self.vlan_vid is not None:
+            header += struct.pack('!HH', 0x8100, self.vlan_vid & 0x0fff)
+        header += struct.pack('!H', self.eth_type)
+        if self.arp is None:
+            return header + b'\x00' * 46
+        opcode, src_ip, dst_ip, dst_mac = self.arp
+        payload = (struct.pack('!HHBBH', 1, 0x0800, 6, 4, opcode) +
+                   mac_bytes(self.eth_src) + ip_bytes(src_ip) +
+                   mac_bytes(dst_mac) + ip_bytes(dst_ip))
+        return header + payload + b'\x00' * (46 - len(payload))
+
+    @classmethod
+    def from_data(cls, data):
+        dst, src, eth_type = struct.unpack_from('!6s6sH', data, 0)
+        vlan_vid = None
+        offset = 14
+        if eth_type == 0x8100:
+            tci, eth_type = struct.unpack_from('!HH', data, 14)
+            vlan_vid = tci & 0x0fff
+            offset += 4
+        arp = None
+        if eth_type == ETH_TYPE_ARP:
+            header = parse_arp(data, offset)
+            if header is not None:
+                arp = (header.opcode, header.src_ip, header.dst_ip,
+                       header.dst_mac)
+        fmt = '%02x:%02x:%02x:%02x:%02x:%02x'
+        return cls(fmt % struct.unpack('!6B', src),
+                   fmt % struct.unpack('!6B', dst), eth_type, vlan_vid, arp)
+
+    def flow_hash(self):
+        return hash((self.eth_src, self.eth_dst))
+
+
+def _value_mask(value):
+    if isinstance(value, tuple):
+        return value
+    return value, None
+
+
+def match_packet(match, in_port, pkt):
+    """ True if the OFPMatch fields (items) match the packet """
+    for field, value in match:
+        value, mask = _value_mask(value)
+        if field == 'in_port':
+            if in_port != value:
+                return False
+        elif field == 'vlan_vid':
+            vid = (ofp.OFPVID_NONE if pkt.vlan_vid is None
+                   else pkt.vlan_vid | ofp.OFPVID_PRESENT)
+            if mask is not None:
+                vid &= mask
+                value &= mask
+            if vid != value:
+                return False
+        elif field == 'metadata':
+            mask = 0xffffffffffffffff if mask is None else mask
+            if pkt.metadata & mask != value & mask:
+                return False
+        elif getattr(pkt, field, None) != value:
+            return False
+    return True
+
+
+class FlowEntry(object):
+    __slots__ = ('priority', 'match', 'instructions', 'cookie', 'packets',
+                 'eth_dst')
+
+    def __init__(self, mod):
+        self.priority = mod.priority
+        self.match = tuple(sorted(mod.match.items()))
+        self.instructions = mod.instructions
+        self.cookie = mod.cookie
+        self.packets = 0
+        # Flows are looked up by eth_dst first
+        self.eth_dst = dict(self.match).get('eth_dst')
+
+
+class FakeDatapath(object):
+    """ Datapath keeping (and applying) the flow and group tables
+
+    With apply False the messages are only serialized and counted, like a
+    Ryu Datapath writing to a switch that is not there (throughput runs).
+    """
+
+    def __init__(self, dpid, ports, apply=True):
+        self.id = dpid
+        self.apply_msgs = apply
+        self.ofproto = ofp
+        self.ofproto_parser = parser
+        self.ports = dict((port, None) for port in ports)
+        # table_id -> {(priority, match): FlowEntry}
+        self.tables = {}
+        # table_id -> {eth_dst (None: any): {(priority, match): FlowEntry}}
+        self.by_dst = {}
+        # group_id -> (type, buckets)
+        self.groups = {}
+        # Ports that are down (fast-failover watch ports)
+        self.down = set()
+        # Messages received, by type name
+        self.counts = {}
+        # PacketOuts not yet applied by the network
+        self.packet_outs = []
+        # Bytes of the messages serialized (apply False) or sent raw
+        self.sent_bytes = 0
+
+    def send_msg(self, msg):
+        if not self.apply_msgs:
+            msg.set_xid(0)
+            msg.serialize()
+            self.send(msg.buf)
+            return
+        name = type(msg).__name__
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if isinstance(msg, parser.OFPFlowMod):
+            self.flow_mod(msg)
+        elif isinstance(msg, parser.OFPGroupMod):
+            self.group_mod(msg)
+        elif isinstance(msg, parser.OFPPacketOut):
+            self.packet_outs.append(msg)
+
+    def send(self, buf):
+        """ A serialized message (Datapath.send), decoded when applied """
+        self.sent_bytes += len(buf)
+        if not self.apply_msgs:
+            name = ofp_msg_name(buf)
+            self.counts[name] = self.counts.get(name, 0) + 1
+            return
+        version, msg_type, msg_len, xid = struct.unpack_from(
+            ofp.OFP_HEADER_PACK_STR, buf)
+        if msg_type == ofp.OFPT_PACKET_OUT:
+            msg = parse_packet_out(self, buf)
+        else:
+            msg = parser.msg_parser(self, version, msg_type, msg_len, xid,
+                                    buf)
+        self.send_msg(msg)
+
+    def send_packet_out(self, buffer_id=0xffffffff, in_port=None,
+                        actions=None, data=None):
+        """ Same as Datapath.send_packet_out """
+        if in_port is None:
+            in_port = ofp.OFPP_CONTROLLER
+        self.send_msg(parser.OFPPacketOut(self, buffer_id, in_port,
+                                          actions or [], data))
+
+    def flow_mod(self, mod):
+        if mod.command in (ofp.OFPFC_ADD, ofp.OFPFC_MODIFY,
+                           ofp.OFPFC_MODIFY_STRICT):
+            entry = FlowEntry(mod)
+            key = (entry.priority, entry.match)
+            self.tables.setdefault(mod.table_id, {})[key] = entry
+            self.by_dst.setdefault(mod.table_id, {}).setdefault(
+                entry.eth_dst, {})[key] = entry
+            return
+        strict = mod.command == ofp.OFPFC_DELETE_STRICT
+        fields = tuple(sorted(mod.match.items()))
+        for table_id, table in self.tables.items():
+            if mod.table_id not in (ofp.OFPTT_ALL, table_id):
+                continue
+            for key, entry in list(table.items()):
+                if strict:
+                    if key != (mod.priority, fields):
+                        continue
+                elif not set(fields) <= set(entry.match):
+                    continue
+                if (entry.cookie & mod.cookie_mask !=
+                        mod.cookie & mod.cookie_mask):
+                    continue
+                del table[key]
+                del self.by_dst[table_id][entry.eth_dst][key]
+
+    def group_mod(self, mod):
+        if mod.command == ofp.OFPGC_DELETE:
+            if mod.group_id == ofp.OFPG_ALL:
+                self.groups.clear()
+            else:
+                self.groups.pop(mod.group_id, None)
+        else:
+            self.groups[mod.group_id] = (mod.type, mod.buckets)
+
+    def flow_count(self):
+        """ Number of flows (table-miss flows excluded) """
+        return sum(1 for table in self.tables.values()
+                   for priority, _ in table if priority > 0)
+
+    def lookup(self, table_id, in_port, pkt):
+        best = None
+        index = self.by_dst.get(table_id, {})
+        for eth_dst in (pkt.eth_dst, None):
+            for entry in index.get(eth_dst, {}).values():
+                if best is not None and entry.priority <= best.priority:
+                    continue
+                if match_packet(entry.match, in_port, pkt):
+                    best = entry
+        return best
+
+    def process(self, in_port, pkt):
+        """ Run the packet through the tables, returns [(port, packet)] """
+        outputs = []
+        table_id = 0
+        while True:
+            entry = self.lookup(table_id, in_port, pkt)
+            if entry is None:
+                return outputs
+            entry.packets += 1
+            goto = None
+            for inst in entry.instructions:
+                if isinstance(inst, parser.OFPInstructionActions):
+                    outputs.extend(self.apply(inst.actions, in_port, pkt))
+                elif isinstance(inst, parser.OFPInstructionWriteMetadata):
+                    mask = inst.metadata_mask
+                    pkt.metadata = ((pkt.metadata & ~mask) |
+                                    (inst.metadata & mask))
+                elif isinstance(inst, parser.OFPInstructionGotoTable):
+                    goto = inst.table_id
+            if goto is None:
+                return outputs
+            table_id = goto
+
+    def apply(self, actions, in_port, pkt):
+        """ Apply an action list, returns [(port, packet)] """
+        outputs = []
+        for action in actions:
+            if isinstance(action, parser.OFPActionOutput):
+                port = action.port
+                if port in (ofp.OFPP_FLOOD, ofp.OFPP_ALL):
+                    outputs.extend((other, pkt.copy()) for other
+                                   in sorted(self.ports) if other != in_port)
+                    continue
+                if port == ofp.OFPP_IN_PORT:
+                    port = in_port
+                elif port == in_port:
+                    continue
+                outputs.append((port, pkt.copy()))
+            elif isinstance(action, parser.OFPActionGroup):
+                outputs.extend(self.group(action.group_id, in_port, pkt))
+            elif isinstance(action, parser.OFPActionPushVlan):
+                pkt.vlan_vid = 0
+            elif isinstance(action, parser.OFPActionPopVlan):
+                pkt.vlan_vid = None
+            elif isinstance(action, parser.OFPActionSetField):
+                if action.key == 'vlan_vid':
+                    pkt.vlan_vid = action.value & 0x0fff
+                else:
+                    setattr(pkt, action.key, action.value)
+        return outputs
+
+    def group(self, group_id, in_port, pkt):
+        group = self.groups.get(group_id)
+        if group is None:
+            return []
+        group_type, buckets = group
+        if group_type == ofp.OFPGT_SELECT:
+            live = [bucket for bucket in buckets if self.live(bucket)]
+            if not live:
+                return []
+            buckets = [live[pkt.flow_hash() % len(live)]]
+        elif group_type == ofp.OFPGT_FF:
+            live = [bucket for bucket in buckets if self.live(bucket)]
+            buckets = live[:1]
+        outputs = []
+        for bucket in buckets:
+            outputs.extend(self.apply(bucket.actions, in_port, pkt.copy()))
+        return outputs
+
+    def live(self, bucket):
+        watch = getattr(bucket, 'watch_port', ofp.OFPP_ANY)
+        return watch in (ofp.OFPP_ANY, None) or watch not in self.down
+
+
+# OpenFlow message type -> class name (OFPT_GROUP_MOD -> OFPGroupMod)
+MSG_NAMES = dict(
+    (value, 'OFP' + ''.join(word.capitalize() for word in name[5:].split('_')))
+    for name, value in vars(ofp).items() if name.startswith('OFPT_'))
+
+
+def ofp_msg_name(buf):
+    """ Class name of the OpenFlow message serialized in buf
+
+    The multipart requests are all named OFPMultipartRequest.
+    """
+    msg_type = struct.unpack_from('!B', buf, 1)[0]
+    return MSG_NAMES.get(msg_type, str(msg_type))
+
+
+def parse_packet_out(datapath, buf):
+    """ Decode a serialized PacketOut (the Ryu parser only encodes it) """
+    buffer_id, in_port, actions_len = struct.unpack_from(
+        ofp.OFP_PACKET_OUT_PACK_STR, buf, ofp.OFP_HEADER_SIZE)
+    offset = ofp.OFP_PACKET_OUT_SIZE
+    end = offset + actions_len
+    actions = []
+    while offset < end:
+        action = parser.OFPAction.parser(buf, offset)
+        actions.append(action)
+        offset += action.len
+    data = bytes(buf[end:]) or None
+    return parser.OFPPacketOut(datapath, buffer_id=buffer_id,
+                               in_port=in_port, actions=actions, data=data)
+
+
+def event_handlers(app):
+    """ Handlers of a Ryu app by event class (its set_ev_cls methods) """
+    handlers = {}
+    for _, method in inspect.getmembers(app, inspect.ismethod):
+        for ev_cls in getattr(method, 'callers', ()):
+            handlers.setdefault(ev_cls, []).append(method)
+    return handlers
+
+
+def _port(dpid, port_no):
+    ofpport = parser.OFPPort(port_no, '', '', 0, 0, 0, 0, 0, 0, 0, 0)
+    return switches.Port(dpid, ofp, ofpport)
+
+
+class FakeNetwork(object):
+    """ Fake datapaths wired together and to hosts, driving an app
+
+    With strict False the exceptions of the handlers are counted (in
+    errors, by handler name) instead of raised, like the Ryu event loop
+    logs them. With timings set to a dict, the seconds spent in each
+    call of a handler are appended to timings[handler name]. With
+    links_first, get_link already returns all the links when the
+    switches enter (apps reading the topology at switch enter, like
+    mob-controller.py), the link add events follow.
+    """
+
+    def __init__(self, app, links=FINAL_TOPO_LINKS, apply=True,
+                 strict=True, timings=None, links_first=False):
+        self.app = app
+        self.handlers = event_handlers(app)
+        self.strict = strict
+        self.errors = {}
+        self.timings = timings
+        # The app asks the fake network for the switches and links
+        app.send_request = self.topology_request
+        # Called after each packet in (e.g. to wait for the workers of
+        # the app)
+        self.settle = None
+        # (dpid, port) -> (dpid, port)
+        self.links = {}
+        # mac -> (dpid, port) and back
+        self.hosts = {}
+        self.host_ports = {}
+        self.packet_ins = 0
+        self.delivered = 0
+        self.dropped = 0
+        # Links (dpid, port) crossed by the last frame sent
+        self.hops = []
+        # Trips to the controller of the first copy of the last frame
+        # sent that reached each host
+        self.trips = {}
+        ports = {}
+        wiring = []
+        for u, v in links:
+            ports[u] = ports.get(u, 0) + 1
+            ports[v] = ports.get(v, 0) + 1
+            wiring.append((u, ports[u], v, ports[v]))
+        self.dps = dict((dpid, FakeDatapath(dpid, range(1, count + 1),
+                                            apply))
+                        for dpid, count in ports.items())
+        if links_first:
+            for u, u_port, v, v_port in wiring:
+                self.links[(u, u_port)] = (v, v_port)
+                self.links[(v, v_port)] = (u, u_port)
+        for dpid in sorted(self.dps):
+            self.switch_enter(self.dps[dpid])
+        for u, u_port, v, v_port in wiring:
+            self.add_link(u, u_port, v, v_port)
+        # Host ports are numbered after the link ports
+        self.next_port = dict((dpid, count + 1)
+                              for dpid, count in ports.items())
+
+    def dispatch(self, ev):
+        """ Call the handlers of the app for the event ev """
+        for handler in self.handlers.get(ev.__class__, ()):
+            start = time.time()
+            try:
+                handler(ev)
+            except Exception:
+                if self.strict:
+                    raise
+                name = handler.__name__
+                self.errors[name] = self.errors.get(name, 0) + 1
+            finally:
+                if self.timings is not None:
+                    self.timings.setdefault(handler.__name__, []).append(
+                        time.time() - start)
+
+    def topology_request(self, req):
+        """ Answer the requests of ryu.topology.api (get_switch, ...) """
+        if isinstance(req, event.EventSwitchRequest):
+            dpids = sorted(self.dps) if req.dpid is None else [req.dpid]
+            return event.EventSwitchReply(
+                req.src, [switches.Switch(self.dps[dpid]) for dpid in dpids
+                          if dpid in self.dps])
+        if isinstance(req, event.EventLinkRequest):
+            links = [switches.Link(_port(u, u_port), _port(v, v_port))
+                     for (u, u_port), (v, v_port) in sorted(
+                         self.links.items())
+                     if req.dpid is None or u == req.dpid]
+            return event.EventLinkReply(req.src, req.dpid, links)
+        if isinstance(req, event.EventHostRequest):
+            return event.EventHostReply(req.src, req.dpid, [])
+        raise ValueError('Unknown request %s' % (req,))
+
+    def add_switch(self, dpid, ports, apply=True):
+        """ Connect a new switch with these port numbers """
+        datapath = self.dps[dpid] = FakeDatapath(dpid, ports, apply)
+        self.next_port[dpid] = max(ports or [0]) + 1
+        self.switch_enter(datapath)
+        return datapath
+
+    def remove_switch(self, dpid):
+        """ Disconnect a switch, reported as ryu.topology does: the
+        switch leave, then the links of its ports. Its hosts go with it.
+        """
+        datapath = self.dps.pop(dpid)
+        self.dispatch(event.EventSwitchLeave(switches.Switch(datapath)))
+        for (u, u_port), (v, v_port) in sorted(self.links.items()):
+            if dpid in (u, v):
+                del self.links[(u, u_port)]
+                link = switches.Link(_port(u, u_port), _port(v, v_port))
+                self.dispatch(event.EventLinkDelete(link))
+        for host, location in list(self.hosts.items()):
+            if location[0] == dpid:
+                del self.hosts[host]
+                del self.host_ports[location]
+
+    def switch_enter(self, datapath):
+        features = parser.OFPSwitchFeatures(datapath)
+        self.dispatch(ofp_event.EventOFPSwitchFeatures(features))
+        self.dispatch(event.EventSwitchEnter(switches.Switch(datapath)))
+
+    def add_link(self, u, u_port, v, v_port):
+        self.links[(u, u_port)] = (v, v_port)
+        self.links[(v, v_port)] = (u, u_port)
+        # LLDP discovers both directions
+        for src, dst in ((_port(u, u_port), _port(v, v_port)),
+                         (_port(v, v_port), _port(u, u_port))):
+            self.dispatch(event.EventLinkAdd(switches.Link(src, dst)))
+
+    def link_event(self, u, u_port, v, v_port, up=True):
+        """ Report one direction of a link (LLDP), added or deleted """
+        link = switches.Link(_port(u, u_port), _port(v, v_port))
+        if up:
+            self.links[(u, u_port)] = (v, v_port)
+            self.dispatch(event.EventLinkAdd(link))
+        else:
+            self.links.pop((u, u_port), None)
+            self.dispatch(event.EventLinkDelete(link))
+
+    def port_status(self, dpid, port_no, reason, config=0, state=0):
+        datapath = self.dps[dpid]
+        desc = parser.OFPPort(port_no, '', '', config, state, 0, 0, 0, 0, 0,
+                              0)
+        msg = parser.OFPPortStatus(datapath, reason, desc)
+        self.dispatch(ofp_event.EventOFPPortStatus(msg))
+
+    def link_down(self, u, v, notify=True):
+        """ Take the link u - v down (both ports), returns the ports
+
+        With notify False the controller is not told yet (the switches
+        forward with the link down until notify_link_down is called).
+        """
+        for (dpid, port), peer in list(self.links.items()):
+            if dpid == u and peer[0] == v:
+                del self.links[(dpid, port)]
+                del self.links[peer]
+                self.dps[u].down.add(port)
+                self.dps[v].down.add(peer[1])
+                if notify:
+                    self.notify_link_down(u, port, v, peer[1])
+                return port, peer[1]
+        return None
+
+    def link_up(self, u, u_port, v, v_port):
+        """ Bring back a link taken down: the ports, then LLDP """
+        for dpid, port in ((u, u_port), (v, v_port)):
+            self.dps[dpid].down.discard(port)
+            self.port_status(dpid, port, ofp.OFPPR_ADD)
+        self.add_link(u, u_port, v, v_port)
+
+    def notify_link_down(self, u, u_port, v, v_port):
+        """ Report a link down: the port status and the link deletes """
+        self.port_status(u, u_port, ofp.OFPPR_DELETE)
+        self.port_status(v, v_port, ofp.OFPPR_DELETE)
+        for src, dst in ((_port(u, u_port), _port(v, v_port)),
+                         (_port(v, v_port), _port(u, u_port))):
+            self.dispatch(event.EventLinkDelete(switches.Link(src, dst)))
+
+    def free_port(self, dpid):
+        port = self.next_port[dpid]
+        self.next_port[dpid] = port + 1
+        return port
+
+    def attach(self, host, dpid, port=None):
+        """ Attach a host (mac) to a switch port (a new one by default)
+
+        The switch reports the new port (OFPPR_ADD).
+        """
+        if port is None:
+            port = self.free_port(dpid)
+        datapath = self.dps[dpid]
+        self.hosts[host] = (dpid, port)
+        self.host_ports[(dpid, port)] = host
+        datapath.down.discard(port)
+        datapath.ports[port] = None
+        self.port_status(dpid, port, ofp.OFPPR_ADD)
+        return port
+
+    def detach(self, host):
+        """ Detach a host, the switch reports the port deleted """
+        dpid, port = self.hosts.pop(host)
+        datapath = self.dps[dpid]
+        del self.host_ports[(dpid, port)]
+        del datapath.ports[port]
+        self.port_status(dpid, port, ofp.OFPPR_DELETE)
+
+    def move(self, host, dpid, port=None):
+        """ Move a host to another switch (mobility.py moveHost) """
+        self.detach(host)
+        return self.attach(host, dpid, port)
+
+    def roam(self, host, dpid, port=None):
+        """ Move a host to another switch without any port status
+
+        Like a wireless station re-associating: the old port stays up and
+        the controller only learns the move from the host frames.
+        """
+        if port is None:
+            port = self.free_port(dpid)
+        old = self.hosts[host]
+        del self.host_ports[old]
+        self.hosts[host] = (dpid, port)
+        self.host_ports[(dpid, port)] = host
+        datapath = self.dps[dpid]
+        datapath.down.discard(port)
+        datapath.ports[port] = None
+        return port
+
+    def packet_in(self, datapath, in_port, pkt):
+        self.packet_in_data(datapath, in_port, pkt.data())
+
+    def packet_in_data(self, datapath, in_port, data,
+                       buffer_id=ofp.OFP_NO_BUFFER, total_len=None,
+                       reason=ofp.OFPR_NO_MATCH, table_id=0, cookie=0):
+        """ Raise a packet in of the frame data (bytes) """
+        self.packet_ins += 1
+        if total_len is None:
+            total_len = len(data)
+        msg = parser.OFPPacketIn(
+            datapath, buffer_id=buffer_id, total_len=total_len,
+            reason=reason, table_id=table_id, cookie=cookie,
+            match=parser.OFPMatch(in_port=in_port), data=data)
+        msg.msg_len = len(data)
+        self.dispatch(ofp_event.EventOFPPacketIn(msg))
+        if self.settle is not None:
+            self.settle()
+
+    def send(self, src, dst, eth_type=0x0800, pkt=None):
+        """ Send a frame from host src to dst (a MAC, may be broadcast)
+
+        pkt is the frame (a Packet) when it is not a plain src -> dst
+        frame (e.g. an ARP request). Returns the hosts that received it.
+        """
+        dpid, port = self.hosts[src]
+        if pkt is None:
+            pkt = Packet(src, dst, eth_type)
+        queue = collections.deque([(dpid, port, pkt, 0, 0)])
+        received = []
+        self.hops = []
+        self.trips = {}
+        copies = 0
+        while queue:
+            dpid, in_port, pkt, hops, trips = queue.popleft()
+            copies += 1
+            if copies > MAX_COPIES:
+                # A flood storm
+                self.dropped += len(queue) + 1
+                break
+            if hops > MAX_HOPS:
+                self.dropped += 1
+                continue
+            datapath = self.dps[dpid]
+            for out_port, out in datapath.process(in_port, pkt):
+                if out_port == ofp.OFPP_CONTROLLER:
+                    for po_dpid, po_port, po_pkt in self.controller(
+                            datapath, in_port, out):
+                        self.forward(po_dpid, po_port, po_pkt, hops, queue,
+                                     received, trips + 1)
+                else:
+                    self.forward(dpid, out_port, out, hops, queue, received,
+                                 trips)
+        self.delivered += len(received)
+        return received
+
+    def controller(self, datapath, in_port, pkt):
+        """ Raise a packet in, returns the (dpid, port, packet) outputs
+        of the PacketOuts sent by the app """
+        self.packet_in(datapath, in_port, pkt)
+        outputs = []
+        for dp in self.dps.values():
+            packet_outs, dp.packet_outs = dp.packet_outs, []
+            for po in packet_outs:
+                po_pkt = Packet.from_data(po.data) if po.data else pkt
+                outputs.extend((dp.id, port, out) for port, out
+                               in dp.apply(po.actions, po.in_port, po_pkt))
+        return outputs
+
+    def forward(self, dpid, port, pkt, hops, queue, received, trips=0):
+        if port in self.dps[dpid].down:
+            self.dropped += 1
+            return
+        peer = self.links.get((dpid, port))
+        if peer is not None:
+            self.hops.append((dpid, port))
+            queue.append((peer[0], peer[1], pkt, hops + 1, trips))
+            return
+        host = self.host_ports.get((dpid, port))
+        if host is not None and pkt.vlan_vid is None:
+            received.append(host)
+            self.trips.setdefault(host, trips)
+        else:
+            self.dropped += 1
+
+    def flow_counts(self):
+        """ Flows installed in each switch """
+        return dict((dpid, datapath.flow_count())
+                    for dpid, datapath in self.dps.items())
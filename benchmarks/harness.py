@@ -0,0 +1,383 @@
+#!/usr/bin/python
+"""
+    Headless benchmark harness for the Ryu apps of this repository, no
+    Mininet or Open vSwitch needed (CI).
+
+    An app (controller.py SimpleSwitch13, arp_storm_control.py
+    SimpleARPProxy13 or mob-controller.py SimpleSwitch13) is driven by a
+    fake network (fake_network.py): the switch enter, features and link
+    add events of a topology (FinalTopo, a k-ary fat tree or random
+    switches), the port status of HOSTS hosts attached to it, one ARP
+    request per host (so the apps learn them), then a stream of EVENTS
+    synthetic events drawn from a mix:
+        unicast: a frame between two random hosts
+        arp: an ARP request of a host for another host
+        move: a host moves to another switch (two port status)
+    By default the frames are injected as packets in at the edge switch
+    of their source and the fake switches only serialize and count the
+    messages of the app (a load generator). With --send the frames go
+    through the flow tables built by the app and only the misses reach
+    it.
+
+    Reported: the events per second of the stream, the messages sent
+    per event of each kind (FlowMods, PacketOuts, GroupMods), and the
+    latency percentiles of every handler of the app (all the events,
+    setup included) with the exceptions raised, which the harness counts
+    and survives like the Ryu event loop. --check exits with status 1
+    when a handler raised. The messages of the worker processes and
+    threads of controller.py (PACKET_IN_WORKERS, ASYNC_ROUTES) are
+    waited for after each event.
+    mob-controller.py reads the links when the switches enter, it gets
+    them all (LINKS_FIRST).
+
+    Needs Ryu and networkx. Run from the repository root:
+        python benchmarks/harness.py --app controller --topology fattree
+        python benchmarks/harness.py --app all --topology all --events 500
+    In CI:
+        python benchmarks/harness.py --app controller --check
+"""
+import argparse
+import ast
+import imp
+import importlib
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from ryu.lib import hub
+from fake_network import FINAL_TOPO_APS
+from fake_network import FINAL_TOPO_LINKS
+from fake_network import FINAL_TOPO_SWITCHES
+from fake_network import FakeNetwork
+from fake_network import Packet
+from fake_network import fat_tree_edges
+from fake_network import fat_tree_links
+from fake_network import ip
+from fake_network import mac
+from fake_network import random_links
+
+# name -> (module, file, app class)
+APPS = {
+    'controller': ('controller', 'controller.py', 'SimpleSwitch13'),
+    'arp_proxy': ('arp_storm_control', 'arp_storm_control.py',
+                  'SimpleARPProxy13'),
+    'mob': ('mob_controller', 'mob-controller.py', 'SimpleSwitch13'),
+}
+TOPOLOGIES = ['final', 'fattree', 'random']
+HOSTS = 32
+EVENTS = 5000
+MIX = {'unicast': 80, 'arp': 15, 'move': 5}
+FAT_TREE_K = 4
+RANDOM_SWITCHES = 50
+MESSAGES = ['OFPFlowMod', 'OFPPacketOut', 'OFPGroupMod']
+# Apps reading the links at switch enter only
+LINKS_FIRST = ['mob']
+
+
+def load_app(name, options=None):
+    """ Return a new instance of the app name
+
+    options maps module constants to their values (e.g. FORWARDING_MODE
+    of controller.py), set before the app is created.
+    """
+    module_name, path, cls = APPS[name]
+    if module_name in sys.modules:
+        module = sys.modules[module_name]
+    elif '-' in path:
+        # Not an importable name
+        module = imp.load_source(module_name, os.path.join(ROOT, path))
+    else:
+        module = importlib.import_module(module_name)
+    for key, value in (options or {}).items():
+        if not hasattr(module, key):
+            raise ValueError('%s has no setting %s' % (path, key))
+        setattr(module, key, value)
+    app = getattr(module, cls)()
+    app.logger.setLevel(logging.WARNING)
+    return app
+
+
+def topology(name, size=None):
+    """ Return (links, switches the hosts attach to) of a topology """
+    if name == 'final':
+        return FINAL_TOPO_LINKS, FINAL_TOPO_APS + FINAL_TOPO_SWITCHES
+    if name == 'fattree':
+        k = size or FAT_TREE_K
+        return fat_tree_links(k), fat_tree_edges(k)
+    if name == 'random':
+        count = size or RANDOM_SWITCHES
+        return random_links(count), list(range(1, count + 1))
+    raise ValueError('Unknown topology %s' % name)
+
+
+def handler_errors(handlers):
+    """ Exceptions raised by the handlers of an app (handler_stats) """
+    return sum(stats['errors'] for stats in handlers.values())
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def settle(app):
+    """ Wait for the work controller.py left to its workers
+
+    The packets in routed by worker processes (PACKET_IN_WORKERS) and the
+    routes computed off the hub loop (ASYNC_ROUTES) send their messages
+    later, they are counted with the event that caused them.
+    """
+    shards = getattr(app, 'shards', None)
+    if shards is not None:
+        shards.wait()
+    route_worker = getattr(app, 'route_worker', None)
+    while route_worker is not None and route_worker.busy:
+        hub.sleep(0.01)
+
+
+def message_counts(net):
+    """ Messages received by all the fake switches, by type name """
+    counts = dict((name, 0) for name in MESSAGES)
+    for datapath in net.dps.values():
+        for name, count in datapath.counts.items():
+            counts[name] = counts.get(name, 0) + count
+    return counts
+
+
+class Harness(object):
+    """ One app on one topology, driven by synthetic events """
+
+    def __init__(self, app, links, edges, hosts=HOSTS, send=False, seed=0,
+                 links_first=False):
+        self.app = app
+        self.edges = edges
+        self.send_mode = send
+        self.rnd = random.Random(seed)
+        # handler name -> seconds of each call
+        self.timings = {}
+        start = time.time()
+        self.net = FakeNetwork(app, links, apply=send, strict=False,
+                               timings=self.timings,
+                               links_first=links_first)
+        if send:
+            # The frames go on with the PacketOuts of the workers
+            self.net.settle = lambda: settle(app)
+        self.macs = [mac(i) for i in range(hosts)]
+        self.ips = dict((mac(i), ip(i)) for i in range(hosts))
+        for host in self.macs:
+            self.net.attach(host, self.rnd.choice(edges))
+        for host in self.macs:
+            self.frame(host, Packet.arp_request(host, self.ips[host],
+                                                self.ips[host]))
+        settle(app)
+        self.setup_time = time.time() - start
+        # kind -> events, kind -> {message type: count}
+        self.events = {}
+        self.messages = {}
+        self.elapsed = 0.0
+
+    def frame(self, src, pkt):
+        """ A frame sent by the host src """
+        if self.send_mode:
+            self.net.send(src, pkt.eth_dst, pkt=pkt)
+            return
+        dpid, port = self.net.hosts[src]
+        self.net.packet_in(self.net.dps[dpid], port, pkt)
+
+    def event(self, kind):
+        """ Run one synthetic event of the kind (see MIX) """
+        if kind == 'unicast':
+            src, dst = self.rnd.sample(self.macs, 2)
+            self.frame(src, Packet(src, dst))
+        elif kind == 'arp':
+            src, dst = self.rnd.sample(self.macs, 2)
+            self.frame(src, Packet.arp_request(src, self.ips[src],
+                                               self.ips[dst]))
+        elif kind == 'move':
+            host = self.rnd.choice(self.macs)
+            self.net.move(host, self.rnd.choice(self.edges))
+        else:
+            raise ValueError('Unknown event %s' % kind)
+
+    def run(self, events=EVENTS, mix=None):
+        """ Run a stream of events drawn from mix (kind -> weight) """
+        mix = mix or MIX
+        kinds = sorted(mix)
+        weights = [mix[kind] for kind in kinds]
+        stream = []
+        for _ in range(events):
+            pick = self.rnd.uniform(0, sum(weights))
+            for kind, weight in zip(kinds, weights):
+                pick -= weight
+                if pick <= 0:
+                    break
+            stream.append(kind)
+        start = time.time()
+        for kind in stream:
+            before = message_counts(self.net)
+            self.event(kind)
+            settle(self.app)
+            after = message_counts(self.net)
+            self.events[kind] = self.events.get(kind, 0) + 1
+            sent = self.messages.setdefault(kind, {})
+            for name, count in after.items():
+                sent[name] = sent.get(name, 0) + count - before.get(name, 0)
+        self.elapsed += time.time() - start
+
+    def report(self):
+        """ Return the results as a dict (see main for the meaning) """
+        total = sum(self.events.values())
+        result = {
+            'switches': len(self.net.dps),
+            'links': len(self.net.links) // 2,
+            'hosts': len(self.macs),
+            'setup_seconds': self.setup_time,
+            'events': total,
+            'events_per_second': total / self.elapsed if self.elapsed else 0,
+            'packet_ins': self.net.packet_ins,
+            'kinds': {},
+            'handlers': {},
+        }
+        for kind, count in self.events.items():
+            result['kinds'][kind] = {
+                'events': count,
+                'per_event': dict((name, float(sent) / count) for name, sent
+                                  in self.messages[kind].items())}
+        result['handlers'] = handler_stats(self.timings, self.net.errors)
+        return result
+
+
+def handler_stats(timings, errors):
+    """ Calls, latency percentiles and errors of each handler """
+    stats = {}
+    for name, times in timings.items():
+        stats[name] = {
+            'calls': len(times),
+            'per_second': len(times) / sum(times) if sum(times) else 0,
+            'p50_ms': 1000 * percentile(times, 0.5),
+            'p90_ms': 1000 * percentile(times, 0.9),
+            'p99_ms': 1000 * percentile(times, 0.99),
+            'max_ms': 1000 * max(times),
+            'errors': errors.get(name, 0)}
+    return stats
+
+
+def print_report(name, topo, result):
+    print('%s on %s: %d switches, %d links, %d hosts, setup %.2f s, '
+          '%d events, %.0f events/s, %d packets in' % (
+              name, topo, result['switches'], result['links'],
+              result['hosts'], result['setup_seconds'], result['events'],
+              result['events_per_second'], result['packet_ins']))
+    print_kinds(result['kinds'])
+    print_handlers(result['handlers'])
+
+
+def print_kinds(kinds):
+    print('  %-12s %7s %11s %13s %12s' % (
+        'event', 'count', 'FlowMod/ev', 'PacketOut/ev', 'GroupMod/ev'))
+    for kind, stats in sorted(kinds.items()):
+        per_event = stats['per_event']
+        print('  %-12s %7d %11.2f %13.2f %12.2f' % (
+            kind, stats['events'], per_event.get('OFPFlowMod', 0),
+            per_event.get('OFPPacketOut', 0),
+            per_event.get('OFPGroupMod', 0)))
+
+
+def print_handlers(handlers):
+    print('  %-28s %7s %9s %8s %8s %8s %8s %7s' % (
+        'handler', 'calls', 'calls/s', 'p50 ms', 'p90 ms', 'p99 ms',
+        'max ms', 'errors'))
+    for handler, stats in sorted(handlers.items()):
+        print('  %-28s %7d %9.0f %8.3f %8.3f %8.3f %8.3f %7d' % (
+            handler, stats['calls'], stats['per_second'], stats['p50_ms'],
+            stats['p90_ms'], stats['p99_ms'], stats['max_ms'],
+            stats['errors']))
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        kind, weight = item.split('=')
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def parse_options(items):
+    options = {}
+    for item in items:
+        key, value = item.split('=', 1)
+        try:
+            options[key] = ast.literal_eval(value)
+        except (SyntaxError, ValueError):
+            # A plain string
+            options[key] = value
+    return options
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Drive a Ryu app with synthetic events, no Mininet')
+    parser.add_argument('--app', default='controller',
+                        choices=sorted(APPS) + ['all'])
+    parser.add_argument('--topology', default='final',
+                        choices=TOPOLOGIES + ['all'])
+    parser.add_argument('--size', type=int, default=None,
+                        help='fat tree k or number of random switches')
+    parser.add_argument('--hosts', type=int, default=HOSTS)
+    parser.add_argument('--events', type=int, default=EVENTS)
+    parser.add_argument('--mix', type=parse_mix, default=MIX,
+                        help='event weights, e.g. unicast=80,arp=15,move=5')
+    parser.add_argument('--send', action='store_true',
+                        help='frames go through the fake flow tables')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='module setting of the app, e.g. '
+                             'FORWARDING_MODE=label')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show what the apps print')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if a handler raised')
+    args = parser.parse_args()
+    apps = sorted(APPS) if args.app == 'all' else [args.app]
+    topologies = TOPOLOGIES if args.topology == 'all' else [args.topology]
+    options = parse_options(args.set)
+    results = []
+    errors = 0
+    for name in apps:
+        for topo in topologies:
+            links, edges = topology(topo, args.size)
+            app = load_app(name, options if name == args.app else None)
+            stdout = sys.stdout
+            if not args.verbose:
+                sys.stdout = open(os.devnull, 'w')
+            try:
+                harness = Harness(app, links, edges, args.hosts, args.send,
+                                  args.seed, name in LINKS_FIRST)
+                harness.run(args.events, args.mix)
+                # Closes the trace of EVENT_RECORD_FILE
+                app.stop()
+            finally:
+                if sys.stdout is not stdout:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+            result = harness.report()
+            result.update({'app': name, 'topology': topo})
+            results.append(result)
+            errors += handler_errors(result['handlers'])
+            print_report(name, topo, result)
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+    if args.check and errors:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+#!/usr/bin/python
+"""
+    Replay an event trace recorded by controller.py (EVENT_RECORD_FILE,
+    event_trace.py) into a Ryu app against fake datapaths, no Mininet.
+
+    The switch enter records create the fake switches (with their ports),
+    the port status, link add/delete and packet in records go to the
+    handlers of the app in the recorded order. --speed 1 keeps the
+    recorded pace, N replays N times faster and 0 (the default) as fast
+    as possible. The fake datapaths only serialize and count the messages
+    of the app. The packet in limit of controller.py applies again when
+    set (PACKET_IN_LIMIT_RATE), keep it off for fast replays.
+
+    Reported, as by harness.py: the events per second, the messages sent
+    per event of each kind and the latency percentiles of every handler
+    with the exceptions raised (--check exits with status 1 then). A
+    paced replay also reports how late the events were dispatched: near
+    0 when the app keeps up with the recorded traffic. The messages of
+    the workers of controller.py (PACKET_IN_WORKERS, ASYNC_ROUTES) are
+    waited for after each event.
+
+    Recording a mobility.py or wifi/simple-mob-scenario.py run: set
+    EVENT_RECORD_FILE in controller.py, run the controller and the
+    scenario, then stop the controller (it writes the last records). A
+    synthetic trace:
+        python benchmarks/harness.py --set EVENT_RECORD_FILE=run.trace
+
+    Needs Ryu. Run from the repository root:
+        python benchmarks/replay_trace.py run.trace --speed 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from ryu.lib import hub
+from ryu.ofproto import ofproto_v1_3 as ofp
+from event_trace import KIND_NAMES
+from event_trace import LINK_ADD
+from event_trace import LINK_DELETE
+from event_trace import PACKET_IN
+from event_trace import PORT_STATUS
+from event_trace import SWITCH_ENTER
+from event_trace import read_trace
+from fake_network import FakeNetwork
+from harness import APPS
+from harness import handler_stats
+from harness import load_app
+from harness import message_counts
+from harness import parse_options
+from harness import percentile
+from harness import print_handlers
+from harness import print_kinds
+from harness import settle
+from harness import handler_errors
+
+
+class Replay(object):
+    """ Feeds the records of a trace to an app """
+
+    def __init__(self, app):
+        self.app = app
+        # handler name -> seconds of each call
+        self.timings = {}
+        self.net = FakeNetwork(app, [], apply=False, strict=False,
+                               timings=self.timings)
+        # kind -> events, kind -> {message type: count}
+        self.events = {}
+        self.messages = {}
+        # Seconds behind the recorded pace of each event (paced replays)
+        self.lags = []
+        # Records of a switch that never entered (trace started late)
+        self.skipped = 0
+        self.recorded = 0.0
+        self.elapsed = 0.0
+
+    def dispatch(self, kind, dpid, values):
+        """ Raise the event of one record """
+        net = self.net
+        if kind == SWITCH_ENTER:
+            net.add_switch(dpid, list(values), apply=False)
+            return
+        datapath = net.dps.get(dpid)
+        if datapath is None:
+            self.skipped += 1
+            return
+        if kind == PACKET_IN:
+            (buffer_id, total_len, in_port, reason, table_id, cookie,
+             data) = values
+            net.packet_in_data(datapath, in_port, data, buffer_id,
+                               total_len, reason, table_id, cookie)
+        elif kind == PORT_STATUS:
+            reason, port_no, config, state = values
+            if reason == ofp.OFPPR_DELETE:
+                datapath.ports.pop(port_no, None)
+            else:
+                datapath.ports[port_no] = None
+            net.port_status(dpid, port_no, reason, config, state)
+        elif kind in (LINK_ADD, LINK_DELETE):
+            src_port, dst, dst_port = values
+            net.link_event(dpid, src_port, dst, dst_port, kind == LINK_ADD)
+
+    def run(self, records, speed=0):
+        """ Replay the (time, kind, dpid, values) records
+
+        speed 1 keeps the recorded pace, N is N times faster, 0 is as
+        fast as possible.
+        """
+        first = None
+        start = time.time()
+        for stamp, kind, dpid, values in records:
+            if first is None:
+                first = stamp
+            self.recorded = stamp - first
+            if speed:
+                due = start + (stamp - first) / speed
+                now = time.time()
+                if due > now:
+                    # The app green threads (log writer...) run meanwhile
+                    hub.sleep(due - now)
+                self.lags.append(max(0.0, time.time() - due))
+            before = message_counts(self.net)
+            self.dispatch(kind, dpid, values)
+            settle(self.app)
+            after = message_counts(self.net)
+            name = KIND_NAMES[kind]
+            self.events[name] = self.events.get(name, 0) + 1
+            sent = self.messages.setdefault(name, {})
+            for msg_name, count in after.items():
+                sent[msg_name] = (sent.get(msg_name, 0) + count -
+                                  before.get(msg_name, 0))
+        self.elapsed = time.time() - start
+
+    def report(self):
+        """ Return the results as a dict """
+        total = sum(self.events.values())
+        result = {
+            'events': total,
+            'recorded_seconds': self.recorded,
+            'replay_seconds': self.elapsed,
+            'events_per_second': total / self.elapsed if self.elapsed else 0,
+            'skipped': self.skipped,
+            'kinds': {},
+            'handlers': handler_stats(self.timings, self.net.errors),
+        }
+        if self.lags:
+            result['lag_ms'] = {
+                'p50': 1000 * percentile(self.lags, 0.5),
+                'p99': 1000 * percentile(self.lags, 0.99),
+                'max': 1000 * max(self.lags)}
+        for kind, count in self.events.items():
+            result['kinds'][kind] = {
+                'events': count,
+                'per_event': dict((name, float(sent) / count) for name, sent
+                                  in self.messages[kind].items())}
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay a controller event trace, no Mininet')
+    parser.add_argument('trace')
+    parser.add_argument('--app', default='controller', choices=sorted(APPS))
+    parser.add_argument('--speed', type=float, default=0,
+                        help='1 for the recorded pace, 0 as fast as '
+                             'possible')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='module setting of the app, e.g. '
+                             'FORWARDING_MODE=label')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show what the app prints')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--check', action='store_true',
+                        help='exit with status 1 if a handler raised')
+    args = parser.parse_args()
+    records = list(read_trace(args.trace))
+    options = parse_options(args.set)
+    if args.app == 'controller':
+        # Do not record the replay (maybe over the trace)
+        options.setdefault('EVENT_RECORD_FILE', None)
+    app = load_app(args.app, options)
+    replay = Replay(app)
+    stdout = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        replay.run(records, args.speed)
+    finally:
+        if sys.stdout is not stdout:
+            sys.stdout.close()
+            sys.stdout = stdout
+    app.stop()
+    result = replay.report()
+    result.update({'app': args.app, 'trace': args.trace,
+                   'speed': args.speed})
+    print('%s: %d events over %.2f s recorded, replayed in %.2f s '
+          '(%s), %.0f events/s, %d skipped' % (
+              args.trace, result['events'], result['recorded_seconds'],
+              result['replay_seconds'],
+              '%gx' % args.speed if args.speed else 'max speed',
+              result['events_per_second'], result['skipped']))
+    if 'lag_ms' in result:
+        print('  lag behind the recorded pace: p50 %.3f ms, p99 %.3f ms, '
+              'max %.3f ms' % (result['lag_ms']['p50'],
+                               result['lag_ms']['p99'],
+                               result['lag_ms']['max']))
+    print_kinds(result['kinds'])
+    print_handlers(result['handlers'])
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(result, out, indent=2, sort_keys=True)
+    if args.check and handler_errors(result['handlers']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
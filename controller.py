@@ -17,8 +17,7 @@ from ryu.controller.handler import MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.ofproto import ofproto_v1_3
 from ryu.lib import dpid as dpid_lib
-from ryu.lib.packet import packet
-from ryu.lib.packet import ethernet
+from ryu.lib import hub
 from ryu.lib.packet import ether_types
 # Used for topology discover
 from ryu.topology import event
@@ -27,10 +26,208 @@ from ryu.topology.api import get_link
 from ryu.topology.api import get_switch
 # NetworkX for Graphs
 import networkx as nx
+# Shortest path cache
+from path_cache import PathCache
+# Integer indexed graph with CSR routing (SPARSE_TOPOLOGY)
+from topology_store import TopologyStore
+# Switch routes, computed off the hub loop with ASYNC_ROUTES
+from route_worker import RouteWorker
+from route_worker import compute_routes
+from route_worker import route_changes
+from route_worker import snapshot as route_snapshot
+# Packets in routed by worker processes (PACKET_IN_WORKERS)
+from shard import ShardPool
+# Spanning tree updated link by link
+from spanning_tree import DynamicSpanningTree
+# Host MAC <-> (dpid, port) index
+from host_index import HostIndex
+# Controller side copy of the flow tables
+from flow_table import PendingInstalls
+from flow_table import ShadowFlowTable
+# Ethernet header parsing without decoding the whole packet
+from packet_header import ETH_HEADER_LEN
+from packet_header import parse_eth
+# Sampled and buffered logging for the packet in handler
+from event_log import EventLog
+# Binary trace of the events, replayed without Mininet (EVENT_RECORD_FILE)
+from event_trace import TraceRecorder
+# Per switch packet in rate limit
+from rate_limit import PacketInLimiter
+from rate_limit import TokenBucket
 # Python Standard Library (Python STL)
 # import copy
 from pprint import pprint
+import collections
+import heapq
 import logging
+import time
+
+# Forwarding state installed in the switches:
+# FORWARD_HOST: one flow per (in_port, eth_dst) on the switches of each
+#   path (see PROACTIVE_PATH_INSTALL and BIDIRECTIONAL_FLOWS).
+# FORWARD_PIPELINE: three tables. LOCATION_TABLE maps eth_dst to a tag of
+#   the egress switch of the host (in the metadata), SWITCH_TABLE forwards
+#   on the tag toward the egress switch and DELIVERY_TABLE (on the egress
+#   switch) outputs to the host port. A host move rewrites one
+#   LOCATION_TABLE entry per switch and the DELIVERY_TABLE entry on the
+#   edge switch, the SWITCH_TABLE entries only change with the topology.
+# FORWARD_LABEL: the ingress switch pushes a VLAN tag (the label of the
+#   egress switch of the host), the other switches forward on the label
+#   and the egress switch pops it and delivers by eth_dst. Core switches
+#   hold one flow per switch instead of one per (host, ingress port).
+#   Every switch holds a route to every other switch, whatever the
+#   traffic, so with few hosts it installs more flows than the host mode:
+#   on FinalTopo (benchmarks/bench_flow_count.py, 10 peers per host) 390
+#   label vs 254 host flows with 10 hosts, even at about 15 hosts, then
+#   455 vs 616 with 20 and 7321 vs 37601 with 1000.
+FORWARD_HOST = 'host'
+FORWARD_PIPELINE = 'pipeline'
+FORWARD_LABEL = 'label'
+FORWARDING_MODE = FORWARD_HOST
+LOCATION_TABLE = 0
+SWITCH_TABLE = 1
+DELIVERY_TABLE = 2
+PIPELINE_TAG_MASK = 0x00000000ffffffff
+# Label mode: the labels (VLAN IDs) of the switches are 1 to
+# MAX_SWITCH_LABEL, 0 is no VLAN and 0xfff is reserved. The label of a
+# switch that left is reused. When every label is taken, the hosts of a
+# switch without a label are reached with the host mode flows.
+MAX_SWITCH_LABEL = 0xffe
+# ECMP (pipeline and label modes): the route of a switch toward an egress
+# switch outputs to an OFPGT_SELECT group (ROUTE_GROUP_BASE + tag of the
+# egress) with a bucket per equal-cost next hop. The switch hashes each
+# flow to one bucket. Topology changes only modify the buckets.
+ECMP_FORWARDING = False
+# Fast failover (pipeline and label modes, without ECMP): the route group
+# is an OFPGT_FF group, the primary next hop and a backup next hop whose
+# own route to the egress does not cross the switch (so it does not use
+# the primary link). The switch uses the backup as soon as the primary
+# port goes down, before the controller recomputes the routes.
+FAST_FAILOVER = False
+ROUTE_GROUP_BASE = 0x1000
+# Keep the network graph in a TopologyStore (integer node IDs, routes
+# computed on CSR arrays by scipy.sparse.csgraph) instead of a networkx
+# DiGraph. Needs numpy and scipy, pays off on large topologies.
+SPARSE_TOPOLOGY = False
+# Compute the switch routes of the pipeline and label modes in a worker
+# process (one, a computation at a time) on a snapshot of the switch
+# graph, so a large topology does not stall the hub loop (echo requests,
+# the other datapaths). The result is applied on the hub loop, unless the
+# topology changed since the snapshot (topo_epoch): then it is dropped.
+# Only those routes are offloaded: the paths of the host mode are
+# computed on the hub loop, or by the packet in workers
+# (PACKET_IN_WORKERS).
+ASYNC_ROUTES = False
+# Install the flows on every switch of the path on the first packet in.
+# When False only the switch that raised the packet in gets a flow.
+PROACTIVE_PATH_INSTALL = True
+# Also install the reverse path (dst -> src) when a path is computed, the
+# reply traffic (TCP ACKs, HTTP streams) then does not raise a packet in
+BIDIRECTIONAL_FLOWS = True
+# Flows to hosts match eth_dst only, instead of (in_port, eth_dst). The
+# paths then follow the shortest path tree of each destination, so all
+# the sources agree on the next hop of a switch (no loops) and a switch
+# holds one flow per destination. Per in_port flows already installed
+# are consolidated (see consolidate_flows), and the dst only flows are
+# deleted when the mode is turned off (set_dst_only_flows).
+DST_ONLY_FLOWS = False
+# OFPGT_ALL group (one per switch) with the ports allowed by the spanning
+# tree. Floods are sent to this group instead of a list of ports.
+FLOOD_GROUP_ID = 1
+# Also install a flow sending broadcast frames to the flood group, so
+# broadcasts are flooded by the switches without a packet in
+FLOOD_IN_SWITCH = False
+# Flows to a host carry a cookie identifying the host (upper 32 bits),
+# so all of them are deleted from a switch with one cookie-masked delete.
+# The lower 32 bits hold the topology (path) epoch of the flow. The top
+# bit (COOKIE_HOST_FLAG) is set in the cookies of all the host flows, one
+# delete masked on it removes them all (a switch entering again).
+COOKIE_DST_SHIFT = 32
+COOKIE_DST_MASK = 0xffffffff00000000
+COOKIE_EPOCH_MASK = 0x00000000ffffffff
+COOKIE_HOST_FLAG = 0x8000000000000000
+# Flows to hosts expire after this many seconds without traffic (0 means
+# never). The switch reports it and the shadow flow table is updated.
+FLOW_IDLE_TIMEOUT = 60
+# Seconds a flow sent to a switch is considered in flight. Packets in for
+# the same (dpid, in_port, eth_dst) meanwhile only get a PacketOut.
+PENDING_INSTALL_WINDOW = 0.5
+# Make-before-break handover: a host whose port is deleted is kept (as
+# detached) with its flows, the old edge switch sends its frames to the
+# controller, which relays them to the ports added since then (pending
+# attachments). When the host MAC shows up on its new port the new paths
+# are installed first, then the old flows are removed. A host not seen
+# again within HANDOVER_TIMEOUT seconds is removed.
+MAKE_BEFORE_BREAK = False
+HANDOVER_TIMEOUT = 30
+# A new port sends every frame to the controller (a port trap) until a
+# host is learned there, for at most PORT_TRAP_TIMEOUT seconds. Only when
+# the flows do not match in_port (dst only flows, pipeline and label
+# modes) or for the make-before-break handover (pending attachments).
+PORT_TRAP_TIMEOUT = 60
+# A known host raising a packet in from another (dpid, port), without a
+# port delete first (e.g. a wireless re-association), is moved there at
+# once. Only packets in are checked: in the pipeline and label modes (and
+# with DST_ONLY_FLOWS) the frames of a host are forwarded whatever their
+# in_port, so the move is seen on its broadcasts (ARP, DHCP) or on a new
+# destination. Each host may be relocated RELOCATION_RATE times per
+# second (bursts of RELOCATION_BURST), so a flapping host does not thrash
+# the controller. Until LLDP has discovered the links, a switch port of a
+# link looks like a host port, and a flooded frame arriving there would
+# move its source host onto the link: no host is relocated to a port of a
+# switch that entered (or to a port added) less than RELOCATION_SETTLE
+# seconds ago.
+HOST_RELOCATION = True
+RELOCATION_RATE = 1.0
+RELOCATION_BURST = 3
+RELOCATION_SETTLE = 5.0
+# Packet in events are logged through a ring buffer written every
+# EVENT_LOG_INTERVAL seconds. Only 1 in EVENT_LOG_RATES[kind] events of
+# each kind is logged (0 logs none), except for EVENT_TRACE_SECONDS after
+# the controller receives SIGUSR1, when every event is logged. The
+# buffer is written on the hub loop too (event_log.py): only the
+# formatting leaves the handlers.
+EVENT_LOG_SIZE = 4096
+EVENT_LOG_INTERVAL = 1.0
+EVENT_LOG_RATES = {'packet_in': 100, 'flood': 100}
+EVENT_TRACE_SECONDS = 30
+# With PACKET_IN_RATE set, the table-miss flow goes through an OpenFlow
+# meter (when the switch supports meters), so a switch sends at most
+# PACKET_IN_RATE packets in per second (bursts of PACKET_IN_BURST). The
+# excess is dropped in the switch. The meter counters are polled every
+# METER_STATS_INTERVAL seconds. 0 (the default) installs no meter: a
+# dropped packet in is a lost first packet and a delayed path, only
+# worth it against a packet in storm.
+PACKET_IN_METER_ID = 1
+PACKET_IN_RATE = 0
+PACKET_IN_BURST = 100
+METER_STATS_INTERVAL = 10
+# Packets in from a switch above PACKET_IN_LIMIT_RATE per second (bursts
+# of PACKET_IN_LIMIT_BURST) are dropped by the controller before being
+# parsed. 0 (the default) disables the limit.
+PACKET_IN_LIMIT_RATE = 0
+PACKET_IN_LIMIT_BURST = 200
+# Host mode: the packets in to known hosts are routed by PACKET_IN_WORKERS
+# worker processes (0 routes them on the hub loop), each one with a
+# replica of the network graph that the controller updates. A packet in
+# goes to the worker of its destination MAC (SHARD_KEY 'dst') or of its
+# switch ('dpid'). The workers send back the FlowMods and the PacketOut
+# serialized, the controller records the flows in the shadow flow table
+# and writes the bytes to the switches. Results computed on a replica
+# older than the last path change (link down, host move) are dropped.
+# Experimental: it has not been measured faster than the hub loop
+# (benchmarks/bench_packet_in_shards.py). The workers take the path
+# computation off the controller process, but the packets in, the shadow
+# flow table and the socket writes stay on it, and the wall clock rate
+# drops with each worker added when there are fewer cores than processes.
+PACKET_IN_WORKERS = 0
+SHARD_KEY = 'dst'
+# Record the packets in, port status and topology events (switch enter,
+# link add/delete) in this binary trace file, to replay them without
+# Mininet (benchmarks/replay_trace.py). The records are buffered and
+# written every EVENT_RECORD_INTERVAL seconds. None records nothing.
+EVENT_RECORD_FILE = None
+EVENT_RECORD_INTERVAL = 1.0
 
 
 class SimpleSwitch13(app_manager.RyuApp):
@@ -39,12 +236,123 @@ class SimpleSwitch13(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.switches = []
+        # Datapath objects by dpid (to install flows along a path)
+        self.datapaths = {}
         self.dst_paths = {}
+        # Cookie id of each destination MAC
+        self.dst_ids = {}
+        # Flows to hosts installed in each switch
+        self.flows = ShadowFlowTable()
+        # Flows sent but maybe not installed yet
+        self.pending = PendingInstalls(PENDING_INSTALL_WINDOW)
+        # Incremented on every link change, stored in the flow cookies
+        self.topo_epoch = 0
+        # Flows installed for each (src, dst) pair: [(dpid, in_port), ...]
+        self.pair_flows = {}
+        # Pairs known for each host (as source or destination)
+        self.host_pairs = {}
+        # Number of pairs using each (dpid, in_port, eth_dst) flow
+        self.flow_refs = {}
+        # Flows to hosts match eth_dst only (in_port None)
+        self.dst_only_flows = DST_ONLY_FLOWS
         # Stores the network Graph
-        self.net = nx.DiGraph()
-        self.stp = nx.Graph()
+        if SPARSE_TOPOLOGY:
+            self.net = TopologyStore()
+        else:
+            self.net = nx.DiGraph()
+        # Spanning tree of the switches (used to flood without loops)
+        self.stp = DynamicSpanningTree()
+        # Ports of each switch and the ones in its flood group
+        self.switch_ports = {}
+        self.flood_ports = {}
+        # Where each host is attached: MAC <-> (dpid, port)
+        self.hosts = HostIndex()
+        # Switch ports used by links: (dpid, port) -> neighbour dpid
+        self.link_ports = {}
+        # New ports whose frames go to the controller until a host is
+        # learned there (pending attachments): (dpid, port)
+        self.port_traps = set()
+        # Hosts whose port was deleted: mac -> (dpid, port, time)
+        self.detached = {}
+        # Seconds from the port delete to the new paths, last handovers
+        self.handover_outages = collections.deque(maxlen=1000)
+        # Relocation token bucket of each host, relocations done/refused
+        self.relocation_buckets = {}
+        self.relocations = 0
+        self.relocations_refused = 0
+        # When each switch entered and each port was added (dpid, port)
+        self.switch_entered = {}
+        self.port_added = {}
+        # Cache of shortest paths between nodes of self.net
+        self.path_cache = PathCache()
+        # Pipeline mode: metadata tag of each switch, egress switch of each
+        # host (in its LOCATION_TABLE entries) and the SWITCH_TABLE entries
+        # of each switch: (dpid, egress dpid) -> out_port (None on egress)
+        self.switch_tags = {}
+        # Tags of the switches that left (a heap, reused first), next
+        # tag never used and the switches left without one
+        self.free_tags = []
+        self.next_tag = 1
+        self.untagged = set()
+        self.host_egress = {}
+        self.switch_routes = {}
+        # ECMP or fast failover: ports in the group of each
+        # (dpid, egress dpid), in the order of the buckets
+        self.route_groups = {}
+        # Routes computed off the hub loop (ASYNC_ROUTES), results of an
+        # old topology epoch dropped
+        self.route_worker = RouteWorker(self.routes_computed)
+        self.stale_routes = 0
+        # Packets in routed by the workers (PACKET_IN_WORKERS), replica
+        # version of the last path change and results dropped as stale
+        self.shards = None
+        self.shard_valid_from = 0
+        self.stale_packet_ins = 0
+        if PACKET_IN_WORKERS and FORWARDING_MODE == FORWARD_HOST:
+            self.shards = ShardPool(PACKET_IN_WORKERS, self.packet_in_routed,
+                                    self.shard_options())
         # Set Log Level
         self.logger.setLevel(logging.DEBUG)
+        # Packet in events log
+        self.event_log = EventLog(self.logger, EVENT_LOG_SIZE,
+                                  EVENT_LOG_INTERVAL)
+        self.event_log.register('packet_in',
+                                'dpid=%s src=%s dst=%s in_port=%s',
+                                EVENT_LOG_RATES.get('packet_in', 1))
+        self.event_log.register('flood', 'dpid=%s src=%s dst=%s in_port=%s',
+                                EVENT_LOG_RATES.get('flood', 1))
+        self.event_log.install_signal(EVENT_TRACE_SECONDS)
+        self.event_log.start()
+        # Events recorded for a replay
+        self.recorder = None
+        if EVENT_RECORD_FILE:
+            self.recorder = TraceRecorder(EVENT_RECORD_FILE,
+                                          EVENT_RECORD_INTERVAL)
+            self.recorder.start()
+        # Packets in admitted/dropped by the controller, per switch
+        self.limiter = None
+        if PACKET_IN_LIMIT_RATE:
+            self.limiter = PacketInLimiter(PACKET_IN_LIMIT_RATE,
+                                           PACKET_IN_LIMIT_BURST)
+        # Switches with the packet in meter, and its counters per switch
+        self.metered = set()
+        self.meter_stats = {}
+        self.meter_monitor = hub.spawn(self._meter_monitor)
+        if ((ECMP_FORWARDING or FAST_FAILOVER) and
+                FORWARDING_MODE == FORWARD_HOST):
+            self.logger.info('ECMP and fast failover need the pipeline or '
+                             'label mode, using single paths')
+        if ASYNC_ROUTES and FORWARDING_MODE == FORWARD_HOST:
+            self.logger.info('Async routes need the pipeline or label mode, '
+                             'use the packet in workers for the host mode')
+        if PACKET_IN_WORKERS and FORWARDING_MODE != FORWARD_HOST:
+            self.logger.info('Packet in workers need the host mode, routing '
+                             'the packets in on the hub loop')
+
+    def stop(self):
+        if self.recorder is not None:
+            self.recorder.close()
+        super(SimpleSwitch13, self).stop()
 
     # Utility function: lists all attributes in in object
     def ls(self, obj):
@@ -52,67 +360,1241 @@ class SimpleSwitch13(app_manager.RyuApp):
 
     # -------------------- Flow Manipulation --------------------
 
-    def add_flow(self, datapath, priority, match, actions):
+    def add_flow(self, datapath, priority, match, actions, cookie=0,
+                 idle_timeout=0, hard_timeout=0, flags=0, meter_id=None,
+                 table_id=0):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         inst = [parser.OFPInstructionActions(ofproto.OFPIT_APPLY_ACTIONS,
                                              actions)]
-        # Flow will expire in 5 seconds without traffic (unused)
-        mod = parser.OFPFlowMod(datapath=datapath, priority=priority,
-                                match=match, instructions=inst)
+        if meter_id is not None:
+            inst.insert(0, parser.OFPInstructionMeter(meter_id))
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=table_id,
+                                cookie=cookie, idle_timeout=idle_timeout,
+                                hard_timeout=hard_timeout, flags=flags,
+                                priority=priority, match=match,
+                                instructions=inst)
         datapath.send_msg(mod)
         # self.logger.debug('[ADD_FLOW] dpid=')
 
-    def delete_flow(self, datapath, eth_dst):
+    def dst_cookie(self, eth_dst):
+        """ Return the cookie of the flows to eth_dst """
+        dst_id = self.dst_ids.get(eth_dst)
+        if dst_id is None:
+            dst_id = self.dst_ids[eth_dst] = len(self.dst_ids) + 1
+        return COOKIE_HOST_FLAG | dst_id << COOKIE_DST_SHIFT
+
+    def add_dst_flow(self, datapath, in_port, eth_dst, out_port,
+                     cookie=None, buf=None):
+        """ Install a (in_port, eth_dst) flow and record it
+
+        Nothing is sent if the shadow flow table already has the same
+        flow from the current epoch. With in_port None the flow matches
+        eth_dst only and replaces the per in_port flows to eth_dst. buf
+        is the FlowMod already serialized (by a packet in worker) with
+        its cookie.
+        """
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-        # Create Match to delete flow
-        match = parser.OFPMatch(eth_dst=eth_dst)
-        mod = parser.OFPFlowMod(datapath,
+        if cookie is None:
+            cookie = (self.dst_cookie(eth_dst) |
+                      (self.topo_epoch & COOKIE_EPOCH_MASK))
+        if not self.flows.add(datapath.id, in_port, eth_dst, cookie,
+                              out_port):
+            return
+        # In flight only when a FlowMod is actually sent
+        self.pending.add(datapath.id, in_port, eth_dst, out_port)
+        if buf is not None:
+            datapath.send(buf)
+        else:
+            if in_port is None:
+                match = parser.OFPMatch(eth_dst=eth_dst)
+            else:
+                match = parser.OFPMatch(in_port=in_port, eth_dst=eth_dst)
+            actions = [parser.OFPActionOutput(out_port)]
+            self.add_flow(datapath, 1, match, actions, cookie=cookie,
+                          idle_timeout=FLOW_IDLE_TIMEOUT,
+                          flags=ofproto.OFPFF_SEND_FLOW_REM)
+        if in_port is None:
+            # The per in_port flows to eth_dst are redundant now
+            for entry in self.flows.dst_flows(eth_dst):
+                if entry.dpid == datapath.id and entry.in_port is not None:
+                    self.flows.remove(entry.dpid, entry.in_port, eth_dst)
+                    self.delete_flow_strict(datapath, entry.in_port,
+                                            eth_dst)
+
+    def delete_flow(self, datapath, eth_dst, table_id=0):
+        # Every flow to eth_dst, whatever its match, by its cookie
+        self.delete_cookie_flows(datapath, self.dst_cookie(eth_dst),
+                                 COOKIE_DST_MASK, table_id)
+
+    def delete_cookie_flows(self, datapath, cookie, cookie_mask,
+                            table_id=0):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        match = parser.OFPMatch()
+        mod = parser.OFPFlowMod(datapath, table_id=table_id,
+                                cookie=cookie, cookie_mask=cookie_mask,
                                 command=ofproto.OFPFC_DELETE,
                                 out_port=ofproto.OFPP_ANY,
                                 out_group=ofproto.OFPG_ANY,
                                 priority=1, match=match)
         datapath.send_msg(mod)
 
+    def delete_flow_strict(self, datapath, in_port, eth_dst):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        # Only the flow installed for this (in_port, eth_dst)
+        if in_port is None:
+            match = parser.OFPMatch(eth_dst=eth_dst)
+        else:
+            match = parser.OFPMatch(in_port=in_port, eth_dst=eth_dst)
+        mod = parser.OFPFlowMod(datapath,
+                                command=ofproto.OFPFC_DELETE_STRICT,
+                                out_port=ofproto.OFPP_ANY,
+                                out_group=ofproto.OFPG_ANY,
+                                priority=1, match=match)
+        datapath.send_msg(mod)
+
+    def install_path(self, path, dst, src=None):
+        """ Install flows to dst on every switch of path
+
+        path is [src_host, sw_1, ..., sw_k, dst_host]. Flows are installed
+        from the egress switch back to the ingress switch, so packets
+        forwarded by a new flow always find the next flow already there.
+        Returns the (dpid, in_port) of the flows installed, egress switch
+        first (in_port is None for dst only flows). src is the source of
+        the traffic when path[0] is not (a path from a switch).
+        """
+        if src is None:
+            src = path[0]
+        # The flows to dst still in flight may go the old way
+        self.pending.discard(dst)
+        installed = []
+        for i in range(len(path) - 2, 0, -1):
+            node = path[i]
+            datapath = self.datapaths.get(node)
+            if datapath is None:
+                continue
+            in_port = None
+            if not self.dst_only_flows:
+                in_port = self.net[node][path[i - 1]]['port']
+            out_port = self.net[node][path[i + 1]]['port']
+            entry = self.flows.get(node, in_port, dst)
+            self.add_dst_flow(datapath, in_port, dst, out_port)
+            if entry is not None and entry.out_port != out_port:
+                self.retrack_pairs(node, in_port, dst, installed, src)
+            installed.append((node, in_port))
+        return installed
+
+    def track_pair(self, src, dst, flows):
+        """ Record the flows installed for the traffic src -> dst
+
+        flows are (dpid, in_port), egress switch first (see
+        install_path).
+        """
+        key = (src, dst)
+        old = set(self.pair_flows.get(key, ()))
+        new = []
+        for flow in flows:
+            if flow not in new:
+                new.append(flow)
+        for dpid, in_port in set(new) - old:
+            entry = (dpid, in_port, dst)
+            self.flow_refs[entry] = self.flow_refs.get(entry, 0) + 1
+        for dpid, in_port in old - set(new):
+            self.release_flow(dpid, in_port, dst)
+        self.pair_flows[key] = new
+        self.host_pairs.setdefault(src, set()).add(key)
+        self.host_pairs.setdefault(dst, set()).add(key)
+
+    def pair_installed(self, src, dst):
+        """ Whether the shadow flow table has every flow of src -> dst """
+        flows = self.pair_flows.get((src, dst))
+        return flows is not None and all(
+            (dpid, in_port, dst) in self.flows for dpid, in_port in flows)
+
+    def retrack_pairs(self, dpid, in_port, dst, downstream, src):
+        """ Move the pairs of a flow to dst that got a new out_port
+
+        The flow (dpid, in_port) is shared by every pair to dst crossing
+        it, the path of src -> dst just replaced it. The traffic of the
+        other pairs follows that path from dpid now: their flows after
+        dpid become downstream (the flows installed after it, egress
+        switch first), so the ones they do not use anymore are released
+        and the ones they use are not deleted under them.
+        """
+        for key in list(self.host_pairs.get(dst, ())):
+            if key[1] != dst or key[0] == src:
+                continue
+            flows = self.pair_flows.get(key, ())
+            if (dpid, in_port) in flows:
+                i = flows.index((dpid, in_port))
+                self.track_pair(key[0], dst, downstream + flows[i:])
+
+    def release_flow(self, dpid, in_port, dst, delete=True):
+        """ Drop one reference to a flow, deleting it when unused """
+        entry = (dpid, in_port, dst)
+        refs = self.flow_refs.get(entry, 0) - 1
+        if refs > 0:
+            self.flow_refs[entry] = refs
+            return
+        self.flow_refs.pop(entry, None)
+        datapath = self.datapaths.get(dpid)
+        if (delete and datapath is not None and
+                self.flows.remove(dpid, in_port, dst) is not None):
+            self.delete_flow_strict(datapath, in_port, dst)
+
+    def untrack_host(self, mac):
+        """ Remove the flows of every pair with mac, in both directions
+
+        Flows to mac are not deleted here (the caller removes all flows
+        with eth_dst=mac), only the flows from mac to its peers.
+        """
+        for key in self.host_pairs.pop(mac, ()):
+            src, dst = key
+            peer = dst if src == mac else src
+            pairs = self.host_pairs.get(peer)
+            if pairs is not None:
+                pairs.discard(key)
+                if not pairs:
+                    del self.host_pairs[peer]
+            for dpid, in_port in self.pair_flows.pop(key, ()):
+                self.release_flow(dpid, in_port, dst, delete=(dst != mac))
+
+    def set_dst_only_flows(self, enabled):
+        """ Switch between per in_port and dst only flows to hosts """
+        self.dst_only_flows = enabled
+        self.publish(('dst_only', enabled))
+        if enabled:
+            self.consolidate_flows()
+        else:
+            self.delete_dst_only_flows()
+
+    def consolidate_flows(self):
+        """ Replace the per in_port flows to each host by dst only flows
+
+        The flows of a switch to the same host become one flow to the next
+        hop of the switch in the shortest path tree of the host.
+        """
+        for dst in list(self.flows.by_dst):
+            dpids = set(entry.dpid for entry in self.flows.dst_flows(dst)
+                        if entry.in_port is not None)
+            for dpid in dpids:
+                datapath = self.datapaths.get(dpid)
+                if datapath is None:
+                    continue
+                try:
+                    path = self.path_cache.get_tree_path(self.net, dpid, dst)
+                except Exception as e:
+                    self.logger.info(e)
+                    continue
+                out_port = self.net[dpid][path[1]]['port']
+                self.add_dst_flow(datapath, None, dst, out_port)
+        # The pairs now use the dst only flows
+        self.flow_refs = {}
+        for key, flows in self.pair_flows.items():
+            nodes = []
+            for dpid, _ in flows:
+                if (dpid, None) not in nodes:
+                    nodes.append((dpid, None))
+            flows = self.pair_flows[key] = nodes
+            for dpid, in_port in flows:
+                entry = (dpid, in_port, key[1])
+                self.flow_refs[entry] = self.flow_refs.get(entry, 0) + 1
+        self.logger.debug('Flows consolidated: %s', self.flows.stats())
+
+    def delete_dst_only_flows(self):
+        """ Delete the dst only flows to the hosts (mode turned off)
+
+        They would shadow the per in_port flows installed from now on
+        (same priority, overlapping match). The next packet of each pair
+        raises a packet in and gets per in_port flows. The label ingress
+        flows and the flows of the detached hosts are kept.
+        """
+        deleted = set()
+        for dst in list(self.flows.by_dst):
+            if dst in self.detached or (FORWARDING_MODE == FORWARD_LABEL and
+                                        self.tagged_dst(dst)):
+                continue
+            for entry in self.flows.dst_flows(dst):
+                if entry.in_port is not None:
+                    continue
+                if dst not in deleted:
+                    deleted.add(dst)
+                    # Not in flight anymore
+                    self.pending.discard(dst)
+                self.flows.remove(entry.dpid, None, dst)
+                datapath = self.datapaths.get(entry.dpid)
+                if datapath is not None:
+                    self.delete_flow_strict(datapath, None, dst)
+        # The pairs to those hosts lost their flows
+        for key, flows in self.pair_flows.items():
+            if key[1] in deleted:
+                self.pair_flows[key] = [(dpid, in_port) for dpid, in_port
+                                        in flows if in_port is not None]
+        for entry in [entry for entry in self.flow_refs
+                      if entry[1] is None and entry[2] in deleted]:
+            del self.flow_refs[entry]
+        self.logger.debug('Dst only flows deleted: %s', self.flows.stats())
+
+    # --------------- Multi-table pipeline / labels ---------------
+
+    def switch_tag(self, dpid):
+        """ Return the tag (metadata or VLAN label) of the switch dpid
+
+        None when every tag is taken (see MAX_SWITCH_LABEL).
+        """
+        tag = self.switch_tags.get(dpid)
+        if tag is not None:
+            return tag
+        if FORWARDING_MODE == FORWARD_LABEL:
+            last = MAX_SWITCH_LABEL
+        else:
+            last = PIPELINE_TAG_MASK
+        if self.free_tags:
+            tag = heapq.heappop(self.free_tags)
+        elif self.next_tag <= last:
+            tag = self.next_tag
+            self.next_tag += 1
+        else:
+            if dpid not in self.untagged:
+                self.untagged.add(dpid)
+                self.logger.error('No free tag for switch %s, its hosts '
+                                  'are reached with host flows', dpid)
+            return None
+        self.switch_tags[dpid] = tag
+        if dpid in self.untagged:
+            # Its hosts were reached with host flows until now
+            self.untagged.discard(dpid)
+            datapath = self.datapaths.get(dpid)
+            if datapath is not None:
+                self.set_delivery_flows(datapath)
+        return tag
+
+    def release_switch_tag(self, dpid):
+        """ Free the tag of a switch that left """
+        self.untagged.discard(dpid)
+        tag = self.switch_tags.pop(dpid, None)
+        if tag is not None:
+            heapq.heappush(self.free_tags, tag)
+
+    def tagged_dst(self, dst):
+        """ Whether the frames to dst use the pipeline or label flows
+
+        False for a host behind a switch without a tag, it is reached
+        with the host mode flows.
+        """
+        egress = self.host_egress.get(dst)
+        return egress is None or self.switch_tag(egress) is not None
+
+    def set_location_flow(self, datapath, mac, egress):
+        """ Tag the frames to mac with its egress switch (table 0) """
+        parser = datapath.ofproto_parser
+        match = parser.OFPMatch(eth_dst=mac)
+        inst = [parser.OFPInstructionWriteMetadata(self.switch_tag(egress),
+                                                   PIPELINE_TAG_MASK),
+                parser.OFPInstructionGotoTable(SWITCH_TABLE)]
+        # Same match and priority: replaces the previous location
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=LOCATION_TABLE,
+                                cookie=self.dst_cookie(mac), priority=1,
+                                match=match, instructions=inst)
+        datapath.send_msg(mod)
+
+    def route_match(self, datapath, egress):
+        """ Match of the frames going to the egress switch """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        tag = self.switch_tag(egress)
+        if FORWARDING_MODE == FORWARD_LABEL:
+            return 0, parser.OFPMatch(vlan_vid=(ofproto.OFPVID_PRESENT |
+                                                tag))
+        return SWITCH_TABLE, parser.OFPMatch(metadata=(tag,
+                                                       PIPELINE_TAG_MASK))
+
+    def set_route_flow(self, datapath, egress, out_port):
+        """ Forward the frames tagged with egress to out_port
+
+        On the egress switch itself (out_port None) the frames go to the
+        delivery table (pipeline) or to the delivery flows (labels).
+        """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if out_port is None and FORWARDING_MODE == FORWARD_LABEL:
+            return
+        table_id, match = self.route_match(datapath, egress)
+        if out_port is None:
+            inst = [parser.OFPInstructionGotoTable(DELIVERY_TABLE)]
+        else:
+            actions = self.route_actions(datapath, egress, out_port)
+            inst = [parser.OFPInstructionActions(
+                ofproto.OFPIT_APPLY_ACTIONS, actions)]
+        mod = parser.OFPFlowMod(datapath=datapath, table_id=table_id,
+                                priority=1, match=match, instructions=inst)
+        datapath.send_msg(mod)
+
+    def route_actions(self, datapath, egress, out_port):
+        """ Output toward egress: its route group, if any, or out_port """
+        parser = datapath.ofproto_parser
+        if (datapath.id, egress) in self.route_groups:
+            group_id = ROUTE_GROUP_BASE + self.switch_tag(egress)
+            return [parser.OFPActionGroup(group_id)]
+        return [parser.OFPActionOutput(out_port)]
+
+    def set_route_group(self, datapath, egress, ports):
+        """ Add (or modify the buckets of) the route group to egress
+
+        A select group over ports with ECMP, else a fast failover group
+        (ports are the primary and the backup next hops).
+        """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        key = (datapath.id, egress)
+        group_id = ROUTE_GROUP_BASE + self.switch_tag(egress)
+        if ECMP_FORWARDING:
+            group_type, weight = ofproto.OFPGT_SELECT, 1
+        else:
+            group_type, weight = ofproto.OFPGT_FF, 0
+        # The switch skips the buckets of the ports that are down
+        buckets = [parser.OFPBucket(weight=weight, watch_port=port,
+                                    actions=[parser.OFPActionOutput(port)])
+                   for port in ports]
+        if key in self.route_groups:
+            command = ofproto.OFPGC_MODIFY
+        else:
+            # A group left by a previous controller would make ADD fail
+            req = parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE,
+                                     group_type, group_id)
+            datapath.send_msg(req)
+            command = ofproto.OFPGC_ADD
+        req = parser.OFPGroupMod(datapath, command, group_type, group_id,
+                                 buckets)
+        datapath.send_msg(req)
+        self.route_groups[key] = ports
+
+    def delete_route_group(self, datapath, egress):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.route_groups.pop((datapath.id, egress), None)
+        req = parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE,
+                                 ofproto.OFPGT_ALL,
+                                 ROUTE_GROUP_BASE + self.switch_tag(egress))
+        datapath.send_msg(req)
+
+    def delete_route_flow(self, datapath, egress):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        table_id, match = self.route_match(datapath, egress)
+        mod = parser.OFPFlowMod(datapath, table_id=table_id,
+                                command=ofproto.OFPFC_DELETE_STRICT,
+                                out_port=ofproto.OFPP_ANY,
+                                out_group=ofproto.OFPG_ANY,
+                                priority=1, match=match)
+        datapath.send_msg(mod)
+
+    def delivery_match(self, datapath, mac):
+        """ Match of the frames to mac on its egress switch """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if FORWARDING_MODE == FORWARD_LABEL:
+            tag = self.switch_tag(datapath.id)
+            if tag is None:
+                # The host flows deliver the frames
+                return 0, None
+            return 0, parser.OFPMatch(vlan_vid=(ofproto.OFPVID_PRESENT |
+                                                tag), eth_dst=mac)
+        return DELIVERY_TABLE, parser.OFPMatch(eth_dst=mac)
+
+    def set_delivery_flow(self, datapath, mac, port):
+        """ Output the frames to mac on its port (popping the label) """
+        parser = datapath.ofproto_parser
+        table_id, match = self.delivery_match(datapath, mac)
+        if match is None:
+            return
+        actions = [parser.OFPActionOutput(port)]
+        if FORWARDING_MODE == FORWARD_LABEL:
+            actions.insert(0, parser.OFPActionPopVlan())
+        self.add_flow(datapath, 1, match, actions,
+                      cookie=self.dst_cookie(mac), table_id=table_id)
+
+    def set_delivery_flows(self, datapath):
+        """ Install the delivery flows of the hosts of a switch """
+        for (dpid, port), macs in self.hosts.by_port.items():
+            if dpid == datapath.id:
+                for mac in macs:
+                    self.set_delivery_flow(datapath, mac, port)
+
+    def delete_delivery_flow(self, datapath, mac):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        table_id, match = self.delivery_match(datapath, mac)
+        if match is None:
+            return
+        mod = parser.OFPFlowMod(datapath, table_id=table_id,
+                                command=ofproto.OFPFC_DELETE_STRICT,
+                                out_port=ofproto.OFPP_ANY,
+                                out_group=ofproto.OFPG_ANY,
+                                priority=1, match=match)
+        datapath.send_msg(mod)
+
+    def locate_host(self, mac, dpid, port):
+        """ Install the delivery flow of a host attached to (dpid, port)
+
+        In the pipeline the LOCATION_TABLE entries are rewritten too, only
+        when the host egress switch changed.
+        """
+        datapath = self.datapaths.get(dpid)
+        if datapath is not None:
+            self.set_delivery_flow(datapath, mac, port)
+        if self.host_egress.get(mac) == dpid:
+            return
+        self.host_egress[mac] = dpid
+        if FORWARDING_MODE != FORWARD_PIPELINE:
+            return
+        for datapath in self.datapaths.values():
+            self.set_location_flow(datapath, mac, dpid)
+
+    def unlocate_host(self, mac):
+        """ Remove the delivery flow of a host that left its port
+
+        The LOCATION_TABLE entries (or the ingress flows) are kept until
+        the host shows up again: meanwhile its frames reach the old edge
+        switch and miss the delivery flow.
+        """
+        location = self.hosts.location(mac)
+        if location is None:
+            return
+        datapath = self.datapaths.get(location[0])
+        if datapath is not None:
+            self.delete_delivery_flow(datapath, mac)
+
+    def update_routes(self):
+        """ Recompute the SWITCH_TABLE entries (see ASYNC_ROUTES) """
+        switches = frozenset(self.datapaths)
+        if not ASYNC_ROUTES:
+            self.apply_routes(*compute_routes(
+                self.net, switches, ECMP_FORWARDING, FAST_FAILOVER))
+            return
+        graph = route_snapshot(self.net, switches)
+        self.route_worker.submit(self.topo_epoch, compute_routes, graph,
+                                 switches, ECMP_FORWARDING, FAST_FAILOVER)
+
+    def routes_computed(self, epoch, result):
+        """ Apply the routes computed by the route worker
+
+        Routes computed on an older topology are dropped, the routes of
+        the current one were submitted when it changed.
+        """
+        if epoch != self.topo_epoch:
+            self.stale_routes += 1
+            self.logger.debug('Stale routes dropped: epoch %d (now %d)',
+                              epoch, self.topo_epoch)
+            return
+        self.apply_routes(*result)
+
+    def apply_routes(self, routes, groups):
+        """ Send the changes of the routes (see compute_routes) """
+        # None toward the switches without a tag (host flows reach them)
+        untagged = set(key[1] for key in routes
+                       if self.switch_tag(key[1]) is None)
+        if untagged:
+            routes = dict((key, port) for key, port in routes.items()
+                          if key[1] not in untagged)
+            groups = dict((key, ports) for key, ports in groups.items()
+                          if key[1] not in untagged)
+        changed, removed = route_changes(
+            self.switch_routes, routes, ECMP_FORWARDING or FAST_FAILOVER)
+        # The groups must exist before the flows using them
+        for key, ports in groups.items():
+            if self.route_groups.get(key) != ports:
+                self.set_route_group(self.datapaths[key[0]], key[1], ports)
+        for key in changed:
+            self.set_route_flow(self.datapaths[key[0]], key[1], routes[key])
+        for key in removed:
+            changed.add(key)
+            datapath = self.datapaths.get(key[0])
+            if datapath is not None:
+                self.delete_route_flow(datapath, key[1])
+        for key in [key for key in self.route_groups if key not in groups]:
+            datapath = self.datapaths.get(key[0])
+            if datapath is not None:
+                self.delete_route_group(datapath, key[1])
+            else:
+                del self.route_groups[key]
+        self.switch_routes = routes
+        # The tags of the switches that left are free again
+        for dpid in [dpid for dpid in self.switch_tags
+                     if dpid not in self.datapaths]:
+            self.release_switch_tag(dpid)
+        if FORWARDING_MODE == FORWARD_LABEL:
+            self.update_ingress_flows(changed)
+
+    def add_ingress_flow(self, datapath, dst):
+        """ Label the untagged frames to dst toward its egress switch
+
+        Returns the actions of the flow, None if there is no route.
+        """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        egress = self.host_egress.get(dst)
+        out_port = self.pipeline_out_port(dpid, dst)
+        if out_port is None:
+            return None
+        actions = [parser.OFPActionOutput(out_port)]
+        if egress != dpid:
+            tag = self.switch_tag(egress)
+            actions = self.route_actions(datapath, egress, out_port)
+            if (dpid, egress) in self.route_groups:
+                # The group, not out_port, chooses the port
+                out_port = None
+            actions[0:0] = [
+                parser.OFPActionPushVlan(ether_types.ETH_TYPE_8021Q),
+                parser.OFPActionSetField(vlan_vid=(ofproto.OFPVID_PRESENT |
+                                                   tag))]
+        # in_port None: the flow matches the frames from every port
+        cookie = (self.dst_cookie(dst) |
+                  (self.topo_epoch & COOKIE_EPOCH_MASK))
+        if self.flows.add(dpid, None, dst, cookie, out_port):
+            match = parser.OFPMatch(vlan_vid=ofproto.OFPVID_NONE,
+                                    eth_dst=dst)
+            self.add_flow(datapath, 1, match, actions, cookie=cookie,
+                          idle_timeout=FLOW_IDLE_TIMEOUT,
+                          flags=ofproto.OFPFF_SEND_FLOW_REM)
+        return actions
+
+    def delete_ingress_flow(self, datapath, dst):
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        match = parser.OFPMatch(vlan_vid=ofproto.OFPVID_NONE, eth_dst=dst)
+        mod = parser.OFPFlowMod(datapath,
+                                command=ofproto.OFPFC_DELETE_STRICT,
+                                out_port=ofproto.OFPP_ANY,
+                                out_group=ofproto.OFPG_ANY,
+                                priority=1, match=match)
+        datapath.send_msg(mod)
+
+    def update_ingress_flows(self, routes):
+        """ Redirect the ingress flows using the changed (dpid, egress) """
+        for dpid in set(key[0] for key in routes):
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            for key in list(self.flows.by_dpid.get(dpid, ())):
+                entry = self.flows.entries[key]
+                if (entry.in_port is not None or
+                        (dpid, self.host_egress.get(entry.eth_dst))
+                        not in routes):
+                    continue
+                if self.add_ingress_flow(datapath, entry.eth_dst) is None:
+                    # The egress switch is not reachable anymore
+                    self.flows.remove(dpid, None, entry.eth_dst)
+                    self.delete_ingress_flow(datapath, entry.eth_dst)
+
+    def label_actions(self, datapath, in_port, dst, tagged):
+        """ Actions forwarding a packet in to dst (label mode)
+
+        An untagged frame from a host installs the ingress flow of its
+        switch, a labelled frame is forwarded on its label.
+        """
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        if not tagged and (dpid, in_port) not in self.link_ports:
+            return self.add_ingress_flow(datapath, dst)
+        out_port = self.pipeline_out_port(dpid, dst)
+        if out_port is None:
+            return None
+        actions = [parser.OFPActionOutput(out_port)]
+        if tagged and self.host_egress.get(dst) == dpid:
+            actions.insert(0, parser.OFPActionPopVlan())
+        return actions
+
+    def pipeline_out_port(self, dpid, dst):
+        """ Port of dpid toward dst using the pipeline state (or None) """
+        egress = self.host_egress.get(dst)
+        if egress == dpid:
+            location = self.hosts.location(dst)
+            return location[1] if location is not None else None
+        return self.switch_routes.get((dpid, egress))
+
+    # ---------------------- Port traps -----------------------
+
+    def port_traps_needed(self):
+        """ Whether the new ports get a trap (see PORT_TRAP_TIMEOUT) """
+        return (FORWARDING_MODE != FORWARD_HOST or self.dst_only_flows or
+                MAKE_BEFORE_BREAK)
+
+    def add_port_trap(self, datapath, port):
+        """ Send every frame from a new port to the controller
+
+        Flows that do not match in_port (dst only, pipeline and label
+        flows) would forward the frames of a host that just arrived
+        without a packet in, so the host would never be learned. The
+        switch removes the trap after PORT_TRAP_TIMEOUT seconds.
+        """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        self.port_traps.add((datapath.id, port))
+        match = parser.OFPMatch(in_port=port)
+        actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
+                                          ofproto.OFPCML_NO_BUFFER)]
+        self.add_flow(datapath, 2, match, actions,
+                      hard_timeout=PORT_TRAP_TIMEOUT,
+                      flags=ofproto.OFPFF_SEND_FLOW_REM)
+
+    def remove_port_trap(self, dpid, port):
+        if (dpid, port) not in self.port_traps:
+            return
+        self.port_traps.discard((dpid, port))
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            return
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        match = parser.OFPMatch(in_port=port)
+        mod = parser.OFPFlowMod(datapath,
+                                command=ofproto.OFPFC_DELETE_STRICT,
+                                out_port=ofproto.OFPP_ANY,
+                                out_group=ofproto.OFPG_ANY,
+                                priority=2, match=match)
+        datapath.send_msg(mod)
+
+    # ----------------------- Flooding ------------------------
+
+    def allowed_flood_ports(self, dpid, ports):
+        """ Return the ports in ports not blocked by the spanning tree """
+        blocked = set()
+        if dpid in self.net:
+            for nbr in self.net.successors(dpid):
+                if nbr in self.stp and not self.stp.has_edge(dpid, nbr):
+                    blocked.add(self.net[dpid][nbr]['port'])
+        return frozenset(port for port in ports
+                         if port <= ofproto_v1_3.OFPP_MAX and
+                         port not in blocked)
+
+    def update_flood_group(self, datapath, ports=None):
+        """ Update the flood group of datapath if its ports changed """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        dpid = datapath.id
+        if ports is None:
+            ports = self.switch_ports.get(dpid, datapath.ports)
+        allowed = self.allowed_flood_ports(dpid, ports)
+        if self.flood_ports.get(dpid) == allowed:
+            return
+        buckets = [parser.OFPBucket(actions=[parser.OFPActionOutput(port)])
+                   for port in sorted(allowed)]
+        if dpid in self.flood_ports:
+            command = ofproto.OFPGC_MODIFY
+        else:
+            # A group left by a previous controller would make ADD fail
+            req = parser.OFPGroupMod(datapath, ofproto.OFPGC_DELETE,
+                                     ofproto.OFPGT_ALL, FLOOD_GROUP_ID)
+            datapath.send_msg(req)
+            command = ofproto.OFPGC_ADD
+        req = parser.OFPGroupMod(datapath, command, ofproto.OFPGT_ALL,
+                                 FLOOD_GROUP_ID, buckets)
+        datapath.send_msg(req)
+        if command == ofproto.OFPGC_ADD and FLOOD_IN_SWITCH:
+            match = parser.OFPMatch(eth_dst='ff:ff:ff:ff:ff:ff')
+            actions = [parser.OFPActionGroup(FLOOD_GROUP_ID)]
+            self.add_flow(datapath, 1, match, actions)
+        self.flood_ports[dpid] = allowed
+        self.logger.debug('Flood group: [dpid=%s] [ports=%s]',
+                          dpid, sorted(allowed))
+
+    def update_flood_groups(self, dpids):
+        """ Update the flood groups of the switches in dpids """
+        for dpid in dpids:
+            datapath = self.datapaths.get(dpid)
+            if datapath is not None:
+                self.update_flood_group(datapath)
+
     # ------------------ Topology Functions -------------------
     def add_switch(self, ev):
         switch = ev.switch
         self.switches.append(switch.dp)
         dpid = switch.dp.id
+        # Routes computed before the switch entered are stale
+        self.topo_epoch += 1
         # Adding switch node
         if dpid == 0:
             self.net.add_node('0', n_type='switch', has_host='false')
+            self.path_cache.invalidate_node('0')
+            self.stp.add_node('0')
+            self.publish(('switch', '0'), invalidates=False)
         else:
             self.net.add_node(dpid, n_type='switch', has_host='false')
+            self.path_cache.invalidate_node(dpid)
+            self.stp.add_node(dpid)
+            self.publish(('switch', dpid), invalidates=False)
+        self.datapaths[dpid] = switch.dp
+        self.switch_entered[dpid] = time.time()
+        # A reconnected switch keeps its flows (Open vSwitch does), the
+        # ones to hosts are not in the shadow flow table anymore: delete
+        # them by their cookie, in every table, before they get stale
+        self.delete_cookie_flows(switch.dp, COOKIE_HOST_FLAG,
+                                 COOKIE_HOST_FLAG, ofproto_v1_3.OFPTT_ALL)
+        self.flows.remove_dpid(dpid)
+        self.switch_ports[switch.dp.id] = set(switch.dp.ports.keys())
+        self.update_flood_group(switch.dp)
+        if FORWARDING_MODE != FORWARD_HOST:
+            for key in [key for key in self.switch_routes if key[0] == dpid]:
+                del self.switch_routes[key]
+            for key in [key for key in self.route_groups if key[0] == dpid]:
+                del self.route_groups[key]
+            if FORWARDING_MODE == FORWARD_PIPELINE:
+                for mac, egress in self.host_egress.items():
+                    self.set_location_flow(switch.dp, mac, egress)
+            self.set_delivery_flows(switch.dp)
+            self.update_routes()
+
+    def remove_switch(self, ev):
+        """ Forget a switch that disconnected (its links go next) """
+        datapath = ev.switch.dp
+        dpid = datapath.id
+        if self.datapaths.get(dpid) is not datapath:
+            return
+        del self.datapaths[dpid]
+        if datapath in self.switches:
+            self.switches.remove(datapath)
+        self.topo_epoch += 1
+        self.switch_ports.pop(dpid, None)
+        self.switch_entered.pop(dpid, None)
+        for key in [key for key in self.port_added if key[0] == dpid]:
+            del self.port_added[key]
+        # Sent again when it reconnects (the switch may have lost them)
+        self.flood_ports.pop(dpid, None)
+        self.metered.discard(dpid)
+        self.flows.remove_dpid(dpid)
+        self.port_traps = set(trap for trap in self.port_traps
+                              if trap[0] != dpid)
+        # Its hosts are gone with it
+        for (host_dpid, port), macs in list(self.hosts.by_port.items()):
+            if host_dpid == dpid:
+                for mac in sorted(macs):
+                    self.remove_host(mac)
+        for mac in [mac for mac, egress in self.host_egress.items()
+                    if egress == dpid]:
+            del self.host_egress[mac]
+        if FORWARDING_MODE != FORWARD_HOST:
+            # Drops its routes, then frees its tag
+            self.update_routes()
 
     # -------------------- Topology events --------------------
     @set_ev_cls(event.EventSwitchEnter, MAIN_DISPATCHER)
     def switch_enter_handler(self, ev):
+        if self.recorder is not None:
+            self.recorder.switch_enter(ev.switch)
         # self.logger.debug("[Event] -- SwitchEnter")
         # self.get_network_topology(ev)
         self.add_switch(ev)
 
+    @set_ev_cls(event.EventSwitchLeave, MAIN_DISPATCHER)
+    def switch_leave_handler(self, ev):
+        self.remove_switch(ev)
+
     @set_ev_cls(event.EventLinkAdd, MAIN_DISPATCHER)
     def link_add_handler(self, ev):
         link = ev.link
+        if self.recorder is not None:
+            self.recorder.link(link)
         src_dpid = link.src.dpid
         dst_dpid = link.dst.dpid
         src_port_no = link.src.port_no
         dst_port_no = link.dst.port_no
+        # Links are reported in both directions, only a new link (or a
+        # link with new ports) changes the shortest paths
+        if (self.net.has_edge(src_dpid, dst_dpid) and
+                self.net.has_edge(dst_dpid, src_dpid) and
+                self.net[src_dpid][dst_dpid]['port'] == src_port_no and
+                self.net[dst_dpid][src_dpid]['port'] == dst_port_no):
+            return
+        # A new link may shorten any cached path
+        self.path_cache.clear()
+        self.topo_epoch += 1
+        for u, v in ((src_dpid, dst_dpid), (dst_dpid, src_dpid)):
+            if self.net.has_edge(u, v):
+                self.link_ports.pop((u, self.net[u][v]['port']), None)
         # Adding a edge from source datapath to destination datapath
         # UpLink
         self.net.add_edge(src_dpid, dst_dpid, {'port': src_port_no})
+        self.link_ports[(src_dpid, src_port_no)] = dst_dpid
         # DownLink
         self.net.add_edge(dst_dpid, src_dpid, {'port': dst_port_no})
+        self.link_ports[(dst_dpid, dst_port_no)] = src_dpid
+        self.publish(('link', src_dpid, dst_dpid, src_port_no, dst_port_no),
+                     invalidates=False)
+        # No host behind the ports of a link
+        self.remove_port_trap(src_dpid, src_port_no)
+        self.remove_port_trap(dst_dpid, dst_port_no)
+        # The new link joins two trees or closes a loop
+        self.update_flood_groups(self.stp.add_edge(src_dpid, dst_dpid))
+        if FORWARDING_MODE != FORWARD_HOST:
+            self.update_routes()
+        # The pairs may have a shorter path now
+        self.reroute_pairs()
 
-    # -------------------- OpenFlow events --------------------
-    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
-    def switch_features_handler(self, ev):
-        datapath = ev.msg.datapath
+    @set_ev_cls(event.EventLinkDelete, MAIN_DISPATCHER)
+    def link_delete_handler(self, ev):
+        link = ev.link
+        if self.recorder is not None:
+            self.recorder.link(link, added=False)
+        src_dpid = link.src.dpid
+        dst_dpid = link.dst.dpid
+        # Reported in both directions (and maybe after the port status)
+        if (self.net.has_edge(src_dpid, dst_dpid) and
+                self.net[src_dpid][dst_dpid]['port'] == link.src.port_no):
+            self.logger.debug('Link Delete: [%s] -> [%s]', src_dpid,
+                              dst_dpid)
+            self.remove_link(src_dpid, dst_dpid)
+
+    def remove_link(self, src_dpid, dst_dpid):
+        """ Remove the link between two switches (both directions) """
+        self.topo_epoch += 1
+        ports = []
+        for u, v in ((src_dpid, dst_dpid), (dst_dpid, src_dpid)):
+            if self.net.has_edge(u, v):
+                ports.append((u, self.net[u][v]['port']))
+                self.link_ports.pop(ports[-1], None)
+                self.net.remove_edge(u, v)
+                self.path_cache.invalidate_edge(u, v)
+        self.publish(('unlink', src_dpid, dst_dpid))
+        # A blocked link may be needed to replace the removed one
+        self.update_flood_groups(self.stp.remove_edge(src_dpid, dst_dpid))
+        if FORWARDING_MODE != FORWARD_HOST:
+            self.update_routes()
+        self.reroute_flows(ports)
+
+    def pair_path(self, src, dst):
+        """ Path of the traffic src -> dst, None if there is none """
+        location = self.hosts.location(src)
+        if location is None or dst not in self.net:
+            return None
+        try:
+            if self.dst_only_flows:
+                return [src] + self.path_cache.get_tree_path(
+                    self.net, location[0], dst)
+            return self.path_cache.get(self.net, src, dst)
+        except nx.NetworkXNoPath:
+            return None
+
+    def reroute_flows(self, ports):
+        """ Move the flows that output to the (dpid, port) of a dead link
+
+        The pairs using them get a new path right away, the other flows
+        are deleted (their next packet raises a packet in). Otherwise the
+        flows would blackhole the traffic until their idle timeout. The
+        label ingress flows follow the switch routes instead.
+        """
+        labels = FORWARDING_MODE == FORWARD_LABEL
+        dead = set()
+        for dpid, port in ports:
+            for key in self.flows.by_dpid.get(dpid, ()):
+                if (labels and key[1] is None and
+                        self.tagged_dst(key[2])):
+                    continue
+                if self.flows.entries[key].out_port == port:
+                    dead.add(key)
+        if not dead:
+            return
+        # Their PacketOuts would go to the dead ports
+        for dst in set(key[2] for key in dead):
+            self.pending.discard(dst)
+        for (src, dst), flows in list(self.pair_flows.items()):
+            if not any((dpid, in_port, dst) in dead
+                       for dpid, in_port in flows):
+                continue
+            path = self.pair_path(src, dst)
+            if path is None:
+                self.logger.info('No path %s -> %s after link down',
+                                 src, dst)
+            self.track_pair(src, dst,
+                            self.install_path(path, dst) if path else [])
+        for dpid, in_port, dst in dead:
+            entry = self.flows.get(dpid, in_port, dst)
+            datapath = self.datapaths.get(dpid)
+            if (entry is not None and datapath is not None and
+                    (dpid, entry.out_port) in ports):
+                self.flows.remove(dpid, in_port, dst)
+                self.delete_flow_strict(datapath, in_port, dst)
+        self.delete_hop_flows(set(key[2] for key in dead))
+
+    def reroute_pairs(self):
+        """ Move the pairs whose path changed (e.g. a link came up)
+
+        Like reroute_flows on a link down: the new path is installed,
+        then the flows of the old one are released. The flows installed
+        hop by hop are deleted, their next packet raises a packet in.
+        """
+        for src, dst in list(self.pair_flows):
+            flows = self.pair_flows.get((src, dst))
+            path = self.pair_path(src, dst)
+            if flows is None or path is None:
+                continue
+            nodes = []
+            for i in range(len(path) - 2, 0, -1):
+                in_port = None
+                if not self.dst_only_flows:
+                    in_port = self.net[path[i]][path[i - 1]]['port']
+                if path[i] in self.datapaths:
+                    nodes.append((path[i], in_port))
+            if nodes != flows:
+                self.track_pair(src, dst, self.install_path(path, dst))
+        self.delete_hop_flows(list(self.flows.by_dst))
+
+    def delete_hop_flows(self, dsts):
+        """ Delete the flows to dsts that no pair tracks
+
+        Those are the flows installed one switch at a time (without
+        PROACTIVE_PATH_INSTALL) along a path that may not be the shortest
+        one anymore: a switch routing from its own packet in could send
+        the traffic back to them. The flows to the detached hosts and the
+        label ingress flows are kept.
+        """
+        labels = FORWARDING_MODE == FORWARD_LABEL
+        for dst in dsts:
+            if dst in self.detached:
+                continue
+            for entry in self.flows.dst_flows(dst):
+                key = entry.key
+                if key in self.flow_refs or (
+                        labels and key[1] is None and self.tagged_dst(dst)):
+                    continue
+                self.flows.remove(*key)
+                datapath = self.datapaths.get(entry.dpid)
+                if datapath is not None:
+                    self.delete_flow_strict(datapath, entry.in_port, dst)
+
+    def add_host(self, mac, dpid, port):
+        """ Add a host attached to (dpid, port) """
+        self.net.add_node(mac, n_type='host')
+        self.net.add_edge(mac, dpid, {'port': port})
+        self.net.add_edge(dpid, mac, {'port': port})
+        self.net.node[dpid]['has_host'] = 'true'
+        self.hosts.add(mac, dpid, port)
+        self.publish(('host', mac, dpid, port), invalidates=False)
+        if FORWARDING_MODE != FORWARD_HOST:
+            self.locate_host(mac, dpid, port)
+        self.logger.debug('Host added: [%s]->[dpid:%s][port=%d]',
+                          mac, dpid, port)
+
+    def remove_host(self, mac):
+        """ Remove a host and every flow to (or from) it """
+        self.pending.discard(mac)
+        # Deleting Flows from the switches that have flows to the host
+        for dpid in self.flows.remove_dst(mac):
+            switch = self.datapaths.get(dpid)
+            if switch is not None:
+                self.delete_flow(switch, mac)
+        # Removing the flows from the host to its peers
+        self.untrack_host(mac)
+        if FORWARDING_MODE != FORWARD_HOST:
+            self.unlocate_host(mac)
+        # Deleting host from NetworkX
+        self.net.remove_node(mac)
+        self.path_cache.invalidate_node(mac)
+        self.publish(('unhost', mac))
+        self.hosts.remove(mac)
+        self.relocation_buckets.pop(mac, None)
+
+    # ----------------------- Handover ------------------------
+    def detach_host(self, mac, dpid, port):
+        """ Keep a host whose port was deleted, it may show up elsewhere
+
+        The flows to the host stay, its old switch sends its frames to the
+        controller (see relay_to_attachments).
+        """
+        stamp = time.time()
+        self.hosts.remove(mac)
+        self.detached[mac] = (dpid, port, stamp)
+        datapath = self.datapaths.get(dpid)
+        if datapath is not None:
+            controller = datapath.ofproto.OFPP_CONTROLLER
+            if FORWARDING_MODE == FORWARD_HOST:
+                # Replaces the flows to mac of the switch
+                self.add_dst_flow(datapath, None, mac, controller)
+            else:
+                self.set_delivery_flow(datapath, mac, controller)
+        hub.spawn_after(HANDOVER_TIMEOUT, self.expire_detached, mac, stamp)
+
+    def expire_detached(self, mac, stamp):
+        """ Remove a host detached at stamp that did not show up again """
+        detached = self.detached.get(mac)
+        if detached is None or detached[2] != stamp:
+            return
+        del self.detached[mac]
+        datapath = self.datapaths.get(detached[0])
+        if FORWARDING_MODE != FORWARD_HOST and datapath is not None:
+            self.delete_delivery_flow(datapath, mac)
+        self.remove_host(mac)
+        self.logger.debug('Host gone: [%s]', mac)
+
+    def relay_to_attachments(self, msg, dst):
+        """ Send a frame to a detached host out of the pending attachments
+
+        The moved host may be behind one of the ports added since it left
+        (and not learned yet), its answer triggers the handover.
+        """
+        for dpid, port in self.port_traps:
+            datapath = self.datapaths.get(dpid)
+            if datapath is None:
+                continue
+            ofproto = datapath.ofproto
+            parser = datapath.ofproto_parser
+            actions = [parser.OFPActionOutput(port)]
+            out = parser.OFPPacketOut(datapath=datapath,
+                                      buffer_id=ofproto.OFP_NO_BUFFER,
+                                      in_port=ofproto.OFPP_CONTROLLER,
+                                      actions=actions, data=msg.data)
+            datapath.send_msg(out)
+
+    def handover(self, mac, dpid, port):
+        """ Move a detached host to (dpid, port) """
+        old_dpid, old_port, stamp = self.detached.pop(mac)
+        self.move_host(mac, old_dpid, dpid, port)
+        outage = time.time() - stamp
+        self.handover_outages.append(outage)
+        self.logger.debug('Handover: [%s] [dpid=%s][port=%s] -> '
+                          '[dpid=%s][port=%s] [%.3f s]', mac, old_dpid,
+                          old_port, dpid, port, outage)
+
+    def relocation_settled(self, dpid, port):
+        """ Whether LLDP had the time to find a link on (dpid, port)
+
+        See RELOCATION_SETTLE.
+        """
+        since = max(self.switch_entered.get(dpid, 0),
+                    self.port_added.get((dpid, port), 0))
+        return time.time() - since >= RELOCATION_SETTLE
+
+    def relocate(self, mac, dpid, port):
+        """ Move a host seen away from its location, if within its rate
+
+        Returns False when the relocation was refused.
+        """
+        bucket = self.relocation_buckets.get(mac)
+        if bucket is None:
+            bucket = self.relocation_buckets[mac] = TokenBucket(
+                RELOCATION_RATE, RELOCATION_BURST)
+        if not bucket.consume():
+            self.relocations_refused += 1
+            return False
+        old_dpid, old_port = self.hosts.location(mac)
+        self.relocations += 1
+        self.move_host(mac, old_dpid, dpid, port)
+        self.logger.debug('Host relocated: [%s] [dpid=%s][port=%s] -> '
+                          '[dpid=%s][port=%s]', mac, old_dpid, old_port,
+                          dpid, port)
+        return True
+
+    def move_host(self, mac, old_dpid, dpid, port):
+        """ Move a host from old_dpid to (dpid, port), make before break
+
+        The paths of every pair of the host are installed toward the new
+        location first, then the flows to mac off the new paths (the old
+        edge switch) are removed.
+        """
+        self.pending.discard(mac)
+        self.net.remove_node(mac)
+        self.path_cache.invalidate_node(mac)
+        self.publish(('unhost', mac))
+        # Installs the new delivery flow in the pipeline and label modes
+        self.add_host(mac, dpid, port)
+        if FORWARDING_MODE == FORWARD_HOST:
+            new = set()
+            for src, dst in list(self.host_pairs.get(mac, ())):
+                path = self.pair_path(src, dst)
+                flows = self.install_path(path, dst) if path else []
+                self.track_pair(src, dst, flows)
+                if dst == mac:
+                    new.update(flows)
+            for entry in self.flows.dst_flows(mac):
+                if (entry.dpid, entry.in_port) in new:
+                    continue
+                self.flows.remove(entry.dpid, entry.in_port, mac)
+                datapath = self.datapaths.get(entry.dpid)
+                if datapath is not None:
+                    self.delete_flow_strict(datapath, entry.in_port, mac)
+        else:
+            # Ingress flows labelled with the old egress switch
+            for entry in self.flows.dst_flows(mac):
+                self.flows.remove(entry.dpid, entry.in_port, mac)
+                datapath = self.datapaths.get(entry.dpid)
+                if (datapath is not None and
+                        self.add_ingress_flow(datapath, mac) is None):
+                    self.delete_ingress_flow(datapath, mac)
+            datapath = self.datapaths.get(old_dpid)
+            if old_dpid != dpid and datapath is not None:
+                self.delete_delivery_flow(datapath, mac)
+
+    # ------------------- Packet in workers -------------------
+    def shard_options(self):
+        """ Forwarding settings of the packet in workers (Replica) """
+        return {'dst_only': self.dst_only_flows,
+                'proactive': PROACTIVE_PATH_INSTALL,
+                'bidirectional': BIDIRECTIONAL_FLOWS,
+                'idle_timeout': FLOW_IDLE_TIMEOUT,
+                'sparse': SPARSE_TOPOLOGY}
+
+    def publish(self, op, invalidates=True):
+        """ Send a change of the network graph to the packet in workers
+
+        A change that invalidates paths (a link or a host removed) also
+        invalidates the results of the packets in routed before it.
+        """
+        if self.shards is None:
+            return
+        version = self.shards.publish(op)
+        if invalidates:
+            self.shard_valid_from = version
+
+    def packet_in_routed(self, result):
+        """ Install the flows and send the PacketOut built by a worker
+
+        result is (version, dpid, [(src, dst, flows)], PacketOut bytes,
+        error), see shard.Replica.route.
+        """
+        version, dpid, pairs, packet_out, error = result
+        if version < self.shard_valid_from:
+            self.stale_packet_ins += 1
+            return
+        if error is not None:
+            self.logger.info(error)
+            return
+        for i, (src, dst, flows) in enumerate(pairs):
+            installed = []
+            for node, in_port, out_port, cookie, buf in flows:
+                datapath = self.datapaths.get(node)
+                if datapath is None:
+                    continue
+                entry = self.flows.get(node, in_port, dst)
+                self.add_dst_flow(datapath, in_port, dst, out_port,
+                                  cookie, buf)
+                if entry is not None and entry.out_port != out_port:
+                    self.retrack_pairs(node, in_port, dst, installed, src)
+                installed.append((node, in_port))
+            # Like packet_in_handler: the pairs of the paths installed
+            if PROACTIVE_PATH_INSTALL or i > 0:
+                location = self.hosts.location(src)
+                if (i == 0 and installed and location is not None and
+                        installed[-1][0] != location[0]):
+                    # A path from the switch of the packet in (it was
+                    # not in the path of the pair)
+                    installed += self.pair_flows.get((src, dst), [])
+                self.track_pair(src, dst, installed)
+        datapath = self.datapaths.get(dpid)
+        if datapath is not None:
+            datapath.send(packet_out)
+
+    # ------------------- Packet in limits --------------------
+    def add_table_miss(self, datapath, meter_id=None):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
-
+        tables = [0]
+        if FORWARDING_MODE == FORWARD_PIPELINE:
+            # Frames to a host that left its edge switch
+            tables.append(DELIVERY_TABLE)
         # install table-miss flow entry
         #
         # We specify NO BUFFER to max_len of the output action due to
@@ -123,43 +1605,188 @@ class SimpleSwitch13(app_manager.RyuApp):
         match = parser.OFPMatch()
         actions = [parser.OFPActionOutput(ofproto.OFPP_CONTROLLER,
                                           ofproto.OFPCML_NO_BUFFER)]
-        self.add_flow(datapath, 0, match, actions)
+        for table_id in tables:
+            self.add_flow(datapath, 0, match, actions, meter_id=meter_id,
+                          table_id=table_id)
+
+    def add_packet_in_meter(self, datapath):
+        """ Install the packet in meter and meter the table-miss flow """
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        # A meter left by a previous controller would make ADD fail
+        req = parser.OFPMeterMod(datapath, command=ofproto.OFPMC_DELETE,
+                                 meter_id=PACKET_IN_METER_ID)
+        datapath.send_msg(req)
+        bands = [parser.OFPMeterBandDrop(rate=PACKET_IN_RATE,
+                                         burst_size=PACKET_IN_BURST)]
+        req = parser.OFPMeterMod(datapath, command=ofproto.OFPMC_ADD,
+                                 flags=(ofproto.OFPMF_PKTPS |
+                                        ofproto.OFPMF_BURST |
+                                        ofproto.OFPMF_STATS),
+                                 meter_id=PACKET_IN_METER_ID, bands=bands)
+        datapath.send_msg(req)
+        # Same match and priority: replaces the unmetered table-miss
+        self.add_table_miss(datapath, PACKET_IN_METER_ID)
+        self.metered.add(datapath.id)
+        self.logger.debug('Packet in meter: [dpid=%s] [rate=%d] [burst=%d]',
+                          datapath.id, PACKET_IN_RATE, PACKET_IN_BURST)
+
+    def _meter_monitor(self):
+        while True:
+            hub.sleep(METER_STATS_INTERVAL)
+            for dpid in list(self.metered):
+                datapath = self.datapaths.get(dpid)
+                if datapath is None:
+                    continue
+                parser = datapath.ofproto_parser
+                req = parser.OFPMeterStatsRequest(datapath, 0,
+                                                  PACKET_IN_METER_ID)
+                datapath.send_msg(req)
+            # Packets in absorbed by the flows in flight (last second)
+            self.logger.debug('Pending installs: %s', self.pending.stats())
+
+    def packet_in_stats(self):
+        """ Admitted and dropped packets in of each switch
+
+        'meter' has the switch counters (packets that hit the table-miss
+        and packets dropped by the meter band), 'controller' the packets
+        in admitted and dropped by the controller token bucket.
+        """
+        stats = {}
+        for dpid, counters in self.meter_stats.items():
+            stats.setdefault(dpid, {})['meter'] = dict(counters)
+        if self.limiter is not None:
+            for dpid, counters in self.limiter.stats().items():
+                stats.setdefault(dpid, {})['controller'] = counters
+        return stats
+
+    # -------------------- OpenFlow events --------------------
+    @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
+    def switch_features_handler(self, ev):
+        datapath = ev.msg.datapath
+        parser = datapath.ofproto_parser
+        self.metered.discard(datapath.id)
+        self.add_table_miss(datapath)
+        if not PACKET_IN_RATE:
+            return
+        # The meter is added once the switch reports meter support
+        req = parser.OFPMeterFeaturesStatsRequest(datapath, 0)
+        datapath.send_msg(req)
+
+    @set_ev_cls(ofp_event.EventOFPMeterFeaturesStatsReply,
+                [CONFIG_DISPATCHER, MAIN_DISPATCHER])
+    def meter_features_handler(self, ev):
+        datapath = ev.msg.datapath
+        ofproto = datapath.ofproto
+        for features in ev.msg.body:
+            if (features.max_meter > 0 and
+                    features.band_types & (1 << ofproto.OFPMBT_DROP)):
+                self.add_packet_in_meter(datapath)
+            else:
+                self.logger.info('Switch %s has no meters, the packet in '
+                                 'rate is only limited by the controller',
+                                 datapath.id)
+
+    @set_ev_cls(ofp_event.EventOFPMeterStatsReply, MAIN_DISPATCHER)
+    def meter_stats_handler(self, ev):
+        dpid = ev.msg.datapath.id
+        for stat in ev.msg.body:
+            if stat.meter_id != PACKET_IN_METER_ID:
+                continue
+            dropped = sum(band.packet_band_count for band in stat.band_stats)
+            self.meter_stats[dpid] = {
+                'admitted': stat.packet_in_count - dropped,
+                'dropped': dropped}
+        self.logger.debug('Packets in: [dpid=%s] %s', dpid,
+                          self.packet_in_stats().get(dpid))
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def flow_removed_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        # Deleted flows were already removed from the shadow table
+        if msg.reason == ofproto.OFPRR_DELETE:
+            return
+        if msg.priority == 2:
+            # A port trap timed out
+            self.port_traps.discard((msg.datapath.id,
+                                     msg.match.get('in_port')))
+            return
+        entry = self.flows.expire(msg.datapath.id, msg.match.get('in_port'),
+                                  msg.match.get('eth_dst'), msg.cookie)
+        if entry is not None:
+            self.logger.debug('Flow expired: [dpid=%s] [in_port=%s] '
+                              '[eth_dst=%s]', entry.dpid, entry.in_port,
+                              entry.eth_dst)
 
     @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
     def port_status_handler(self, ev):
         msg = ev.msg
+        if self.recorder is not None:
+            self.recorder.port_status(msg)
         reason = msg.reason
         datapath = msg.datapath
         ofproto = datapath.ofproto
         ofpport = msg.desc
         dpid = datapath.id
         dpid_str = dpid_lib.dpid_to_str(dpid)
-        # Detecting a host down (Possibly moving?)
+        # Keep the flood group in sync with the switch ports
+        if dpid in self.flood_ports:
+            ports = self.switch_ports.setdefault(dpid,
+                                                 set(datapath.ports.keys()))
+            if reason == ofproto.OFPPR_ADD:
+                ports.add(ofpport.port_no)
+            elif reason == ofproto.OFPPR_DELETE:
+                ports.discard(ofpport.port_no)
+            self.update_flood_group(datapath)
+        if reason == ofproto.OFPPR_ADD:
+            self.port_added[(dpid, ofpport.port_no)] = time.time()
+        if (reason == ofproto.OFPPR_ADD and self.port_traps_needed() and
+                (dpid, ofpport.port_no) not in self.link_ports):
+            # A host may be attached to the new port
+            self.add_port_trap(datapath, ofpport.port_no)
         if reason == ofproto.OFPPR_DELETE:
             port_no = ofpport.port_no
-            mac = ''
-            try:
-                mac = [dst for src, dst, attrib
-                       in self.net.edges_iter(data=True)
-                       if src == dpid and attrib['port'] == port_no][0]
-            except IndexError:
-                mac = ''
+            self.port_added.pop((dpid, port_no), None)
+            self.remove_port_trap(dpid, port_no)
+            # Detecting a link down
+            nbr = self.link_ports.get((dpid, port_no))
+            if nbr is not None:
+                self.logger.debug('Link Down: [dpid=%s] [port=%d]',
+                                  dpid_str, port_no)
+                self.remove_link(dpid, nbr)
+                return
+            # Detecting the hosts down (Possibly moving?), all the
+            # stations of an access point share its port
+            macs = self.hosts.host_at(dpid, port_no)
+            if not macs:
                 self.logger.info('There is not any known host')
-            # Deleting Flows from switches
-            if mac:
-                for switch in self.switches:
-                    # Removing
-                    self.delete_flow(switch, mac)
-                # Deleting host from NetworkX
-                self.net.remove_node(mac)
-                self.logger.debug('Host Down: [dpid=%s] [port=%d] [mac=%s]',
-                                  dpid_str, port_no, mac)
+            for mac in sorted(macs):
+                if MAKE_BEFORE_BREAK:
+                    self.detach_host(mac, dpid, port_no)
+                    self.logger.debug('Host Detached: [dpid=%s] [port=%d] '
+                                      '[mac=%s]', dpid_str, port_no, mac)
+                else:
+                    self.remove_host(mac)
+                    self.logger.debug('Host Down: [dpid=%s] [port=%d] '
+                                      '[mac=%s]', dpid_str, port_no, mac)
+            if macs and not MAKE_BEFORE_BREAK:
+                self.logger.debug('Path cache: %s', self.path_cache.stats())
             # pprint(self.net.nodes())
             # pprint(self.net.edges(data='port'))
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def packet_in_handler(self, ev):
 
+        # Recorded before the controller limit (applied again on replay)
+        if self.recorder is not None:
+            self.recorder.packet_in(ev.msg)
+
+        # Over the switch packet in rate: drop before parsing
+        if (self.limiter is not None and
+                not self.limiter.admit(ev.msg.datapath.id)):
+            return
+
         # Discards truncated packets
         # If you hit this you might want to increase
         # the "miss_send_length" of your switch
@@ -174,9 +1801,10 @@ class SimpleSwitch13(app_manager.RyuApp):
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
 
-        # Extract data from packets
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        # Extract the Ethernet header from the packet
+        eth = parse_eth(msg.data)
+        if eth is None:
+            return
 
         # Ignoring LLDP packet
         if eth.ethertype == ether_types.ETH_TYPE_LLDP:
@@ -187,39 +1815,154 @@ class SimpleSwitch13(app_manager.RyuApp):
         dpid = datapath.id
 
         # Logging Packet in event
-        self.logger.info("Packet in %s %s %s %s", dpid, src, dst, in_port)
+        self.event_log.log('packet_in', dpid, src, dst, in_port)
 
         # learn a mac address to avoid FLOOD next time.
-        if src not in self.net:
+        if (src in self.detached and
+                (dpid, in_port) not in self.link_ports):
+            # A moved host shows up on its new port
+            self.handover(src, dpid, in_port)
+        elif (HOST_RELOCATION and src in self.hosts and
+                self.hosts.location(src) != (dpid, in_port) and
+                (dpid, in_port) not in self.link_ports and
+                self.relocation_settled(dpid, in_port)):
+            # A known host sends from another port (no port delete seen)
+            if not self.relocate(src, dpid, in_port):
+                self.logger.debug('Relocation refused: [%s] [dpid=%s]'
+                                  '[port=%s]', src, dpid, in_port)
+        elif src not in self.net:
             # make sure it's a host address
             if "00:00:00" in src:
-                self.net.add_node(src, n_type='host')
-                self.net.add_edge(src, dpid, {'port': in_port})
-                self.net.add_edge(dpid, src, {'port': in_port})
-                self.net.node[dpid]['has_host'] = 'true'
+                self.add_host(src, dpid, in_port)
+        if ((dpid, in_port) in self.port_traps and
+                self.hosts.location(src) == (dpid, in_port)):
+            self.remove_port_trap(dpid, in_port)
+
+        if dst in self.detached:
+            self.relay_to_attachments(msg, dst)
+            return
+
+        # Key of the flows of this packet in the shadow flow table
+        flow_port = None if self.dst_only_flows else in_port
+
+        # The flow for this packet was just sent: only forward the packet
+        # (unless the reverse flows are missing, e.g. a new source of a
+        # dst only flow, or the shadow flow table does not have the flow
+        # anymore)
+        out_port = None
+        if not BIDIRECTIONAL_FLOWS or self.pair_installed(dst, src):
+            out_port = self.pending.lookup(dpid, flow_port, dst)
+        if out_port is not None:
+            entry = self.flows.get(dpid, flow_port, dst)
+            if entry is None or entry.out_port != out_port:
+                out_port = None
+        if out_port is not None:
+            data = None
+            if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+                data = msg.data
+            actions = [parser.OFPActionOutput(out_port)]
+            out = parser.OFPPacketOut(datapath=datapath,
+                                      buffer_id=msg.buffer_id, in_port=in_port,
+                                      actions=actions, data=data)
+            datapath.send_msg(out)
+            return
 
-            self.logger.debug('Host added: [%s]->[dpid:%s][port=%d]',
-                              src, dpid, in_port)
+        # A labelled frame (802.1Q tag) in the label mode
+        tagged = (FORWARDING_MODE == FORWARD_LABEL and
+                  eth.offset > ETH_HEADER_LEN)
+
+        # The pipeline (or label) flows to dst may not be installed yet:
+        # only forward the packet (installing the ingress label flow)
+        if (FORWARDING_MODE != FORWARD_HOST and dst in self.net and
+                self.tagged_dst(dst)):
+            if FORWARDING_MODE == FORWARD_LABEL:
+                actions = self.label_actions(datapath, in_port, dst, tagged)
+            else:
+                out_port = self.pipeline_out_port(dpid, dst)
+                actions = None
+                if out_port is not None:
+                    actions = [parser.OFPActionOutput(out_port)]
+            if actions is None:
+                self.logger.info('No route from switch %s to %s', dpid, dst)
+                return
+            data = None
+            if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+                data = msg.data
+            out = parser.OFPPacketOut(datapath=datapath,
+                                      buffer_id=msg.buffer_id, in_port=in_port,
+                                      actions=actions, data=data)
+            datapath.send_msg(out)
+            return
 
         # Try to get the destination from Network Graph
-        if dst in self.net.nodes() and src in self.net.nodes():
+        if dst in self.net and src in self.net:
+            if self.shards is not None:
+                # The paths and the messages are built by a worker
+                self.flows.remove(dpid, flow_port, dst)
+                data = None
+                if msg.buffer_id == ofproto.OFP_NO_BUFFER:
+                    data = msg.data
+                epoch = self.topo_epoch & COOKIE_EPOCH_MASK
+                cookies = (self.dst_cookie(dst) | epoch,
+                           self.dst_cookie(src) | epoch)
+                self.shards.dispatch(dst if SHARD_KEY == 'dst' else dpid,
+                                     (dpid, in_port, src, dst, msg.buffer_id,
+                                      data, cookies))
+                return
             try:
-                path = nx.shortest_path(self.net, src, dst)
+                if self.dst_only_flows:
+                    # From this switch along the tree of dst
+                    path = [src] + self.path_cache.get_tree_path(
+                        self.net, dpid, dst)
+                    reverse = self.path_cache.get_tree_path(self.net, dst,
+                                                            src)
+                else:
+                    path = self.path_cache.get(self.net, src, dst)
+                    reverse = path[::-1]
                 # Store the path to delete it later
                 # self.dst_paths[dst] = path
             except Exception as e:
                 self.logger.info(e)
                 # there isn't a path, nothing to do
                 return
+            # This packet in proves the switch does not have the flow
+            # (e.g. it expired and the FlowRemoved was lost)
+            self.flows.remove(dpid, flow_port, dst)
+            detour = dpid not in path
+            if detour:
+                # A flow of an older path (or of another source) sent the
+                # packet here: route it from this switch
+                prev = self.link_ports.get((dpid, in_port))
+                if prev is None:
+                    self.logger.info('Switch %s is not in the path %s -> '
+                                     '%s', dpid, src, dst)
+                    return
+                try:
+                    path = [prev] + self.path_cache.get(self.net, dpid, dst)
+                except Exception as e:
+                    self.logger.info(e)
+                    return
             # make a path flow to packet
             next_switch = path[path.index(dpid) + 1]
             # get the port for next hop in path
             out_port = self.net[dpid][next_switch]['port']
-
-            # Install a flow in switch to avoid pkt_in next time
             actions = [parser.OFPActionOutput(out_port)]
-            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
-            self.add_flow(datapath, 1, match, actions)
+
+            if PROACTIVE_PATH_INSTALL:
+                # Install the flows in all switches of the path, so the
+                # next switches do not raise a pkt_in for this packet
+                flows = self.install_path(path, dst, src)
+                if detour:
+                    # The flows before this switch still carry the pair
+                    flows += self.pair_flows.get((src, dst), [])
+                self.track_pair(src, dst, flows)
+            else:
+                # Install a flow in switch to avoid pkt_in next time
+                self.add_dst_flow(datapath, flow_port, dst, out_port)
+            if BIDIRECTIONAL_FLOWS:
+                # The reply follows the same path in the other direction
+                # (the tree of src with dst only flows)
+                self.track_pair(dst, src, self.install_path(reverse, src))
 
             # Forward packet to the next switch
             data = None
@@ -230,33 +1973,21 @@ class SimpleSwitch13(app_manager.RyuApp):
                                       actions=actions, data=data)
             datapath.send_msg(out)
         else:
-            # Unknow destination. Nothing to do
-            ports_to_send = []
-            # Get all ports on Datapath (Switch)
-            available_ports = [dp_port for dp_port in datapath.ports
-                               if dp_port < 1000000000]
-            # Compute forbidden ports by STP
-            mst = nx.minimum_spanning_tree(self.net.to_undirected())
-            edges_forb = [(s, d, port)
-                          for s, d, port in self.net.edges(data=True)
-                          if ((s, d) not in mst.edges() and
-                              (d, s) not in mst.edges())]
-            # Set of forbidden ports by Spanning Tree
-            forbidden_ports = [attrib['port'] for s, d, attrib in edges_forb
-                               if s == dpid]
-            # List of allowed ports (allowed by STP)
-            for p_aval in available_ports:
-                if p_aval not in forbidden_ports:
-                    ports_to_send.append(p_aval)
-
-            # Forward ARP request
-            actions = []
+            # Unknow destination. Flood using the spanning tree
+            self.event_log.log('flood', dpid, src, dst, in_port)
+            if dpid in self.flood_ports:
+                actions = [parser.OFPActionGroup(FLOOD_GROUP_ID)]
+            else:
+                # Flood group not installed yet (switch not entered)
+                actions = [parser.OFPActionOutput(p_flood) for p_flood
+                           in self.allowed_flood_ports(dpid,
+                                                       datapath.ports)]
+            if actions and tagged:
+                # Hosts do not know the labels
+                actions.insert(0, parser.OFPActionPopVlan())
             # If there are ports to send (without loop)
-            if ports_to_send:
-                for p_flood in ports_to_send:
-                    actions.append(parser.OFPActionOutput(p_flood))
+            if actions:
                 data = None
-
                 if msg.buffer_id == ofproto.OFP_NO_BUFFER:
                     data = msg.data
                 out = parser.OFPPacketOut(datapath=datapath,
@@ -38,6 +38,11 @@ class SimpleSwitch13(app_manager.RyuApp):
     def __init__(self, *args, **kwargs):
         super(SimpleSwitch13, self).__init__(*args, **kwargs)
         self.mac_to_port = {}
+        # Reverse indexes of mac_to_port
+        # (dpid, port) -> set of MACs learned on the port
+        self.port_to_mac = {}
+        # MAC -> set of dpids that learned it
+        self.mac_to_dpids = {}
         self.switches = []
         self.arp_table = {}
         self.sw_bcast = {}
@@ -165,12 +170,16 @@ class SimpleSwitch13(app_manager.RyuApp):
                     return True
         return False
 
+    def _learn_mac(self, dpid, mac_address, port):
+        """ Add MAC to mac_to_port and to its reverse indexes """
+        self.mac_to_port.setdefault(dpid, {})[mac_address] = port
+        self.port_to_mac.setdefault((dpid, port), set()).add(mac_address)
+        self.mac_to_dpids.setdefault(mac_address, set()).add(dpid)
+
     def _get_mac_by_datapath_port(self, dpid, port):
         """ Return the MAC address by Datapath ID and Path """
-        self.mac_to_port.setdefault(dpid, {})
-        for mac_address in self.mac_to_port[dpid]:
-            if self.mac_to_port[dpid][mac_address] == port:
-                return mac_address
+        for mac_address in self.port_to_mac.get((dpid, port), ()):
+            return mac_address
         return None
 
     @set_ev_cls(ofp_event.EventOFPSwitchFeatures, CONFIG_DISPATCHER)
@@ -230,7 +239,7 @@ class SimpleSwitch13(app_manager.RyuApp):
         # learn a mac address to avoid FLOOD next time.
         self.mac_to_port.setdefault(dpid, {})
         if src not in self.mac_to_port[dpid]:
-            self.mac_to_port[dpid][src] = in_port
+            self._learn_mac(dpid, src, in_port)
             self.logger.info('Mac2Port -- Adding [dpid=%s][mac=%s][port=%d]',
                              dpid, src, in_port)
             pprint(self.mac_to_port)
@@ -321,10 +330,12 @@ class SimpleSwitch13(app_manager.RyuApp):
 
 
     def clear_mac_to_port(self, mac):
-        for sw_dpid in self.mac_to_port.keys():
-            for mac_i in self.mac_to_port[sw_dpid].keys():
-                if mac_i == mac:
-                    del self.mac_to_port[sw_dpid][mac]
+        for sw_dpid in self.mac_to_dpids.pop(mac, ()):
+            port = self.mac_to_port[sw_dpid].pop(mac)
+            macs = self.port_to_mac[(sw_dpid, port)]
+            macs.discard(mac)
+            if not macs:
+                del self.port_to_mac[(sw_dpid, port)]
         pprint(self.mac_to_port)
 
 
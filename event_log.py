@@ -0,0 +1,131 @@
+"""
+    Sampled, buffered event logging for the packet in hot path.
+
+    Handlers call EventLog.log(kind, *values), which only appends a tuple
+    to an in-memory ring buffer (after a 1-in-N sampling per event kind).
+    A background green thread drains the buffer every interval and writes
+    all the formatted events with a single logger call. Sending SIGUSR1
+    to the controller logs every event (no sampling) for a few seconds.
+
+    Only the formatting and the write are taken out of the handlers: the
+    writer is a green thread of the hub loop (ryu-manager monkey patches
+    threading, so a plain thread would be one too), and while it drains,
+    the packets in wait. The stall is one formatted line per queued
+    event, at most size lines every interval; lower the sampling rates
+    rather than the interval to shorten it.
+"""
+import collections
+import signal
+import time
+
+from ryu.lib import hub
+
+
+class EventLog(object):
+    """ Ring buffer of structured events drained by a writer green
+    thread """
+
+    def __init__(self, logger, size=4096, interval=1.0):
+        self.logger = logger
+        self.interval = interval
+        # (time, kind, values)
+        self.buffer = collections.deque(maxlen=size)
+        # kind -> format of the values
+        self.formats = {'trace': 'tracing for %s seconds'}
+        # kind -> log 1 event in rate (0 disables the kind)
+        self.rates = {}
+        # kind -> events seen (for the sampling)
+        self.seen = {}
+        # Log everything until this time
+        self.trace_until = 0
+        # Counters
+        self.logged = 0
+        self.overwritten = 0
+        self.writer = None
+
+    def register(self, kind, fmt, rate=1):
+        """ Declare an event kind, its values format and sampling rate """
+        self.formats[kind] = fmt
+        self.rates[kind] = rate
+        self.seen.setdefault(kind, 0)
+
+    def set_rate(self, kind, rate):
+        self.rates[kind] = rate
+
+    def sampled(self, kind):
+        """ Count one event of kind, True if it must be logged
+
+        Use it (with record) when the values are costly to compute.
+        """
+        seen = self.seen[kind] = self.seen.get(kind, 0) + 1
+        if self.trace_until:
+            if time.time() < self.trace_until:
+                return True
+            self.trace_until = 0
+        rate = self.rates.get(kind, 1)
+        return bool(rate) and seen % rate == 0
+
+    def log(self, kind, *values):
+        """ Queue an event if it is sampled (or tracing is on) """
+        if self.sampled(kind):
+            self.record(kind, *values)
+
+    def record(self, kind, *values):
+        """ Queue an event (no sampling) """
+        if len(self.buffer) == self.buffer.maxlen:
+            self.overwritten += 1
+        self.buffer.append((time.time(), kind, values))
+
+    def trace(self, seconds):
+        """ Log every event, without sampling, for some seconds
+
+        Safe to call from a signal handler: it only queues an event.
+        """
+        self.trace_until = time.time() + seconds
+        self.record('trace', seconds)
+
+    def install_signal(self, seconds, signum=signal.SIGUSR1):
+        """ Turn tracing on for some seconds when signum is received """
+        try:
+            signal.signal(signum, lambda *args: self.trace(seconds))
+        except ValueError:
+            # Not in the main thread (e.g. in a test), no signal
+            self.logger.debug('Event log: signal handler not installed')
+
+    def drain(self):
+        """ Write the queued events, returns the number written
+
+        Runs on the hub loop, blocking the other green threads until the
+        logger returns.
+        """
+        lines = []
+        buf = self.buffer
+        while buf:
+            stamp, kind, values = buf.popleft()
+            fmt = self.formats.get(kind)
+            if fmt is None:
+                text = ' '.join(str(value) for value in values)
+            else:
+                text = fmt % values
+            lines.append('%.6f %s %s' % (stamp, kind, text))
+        if lines:
+            self.logged += len(lines)
+            self.logger.info('\n'.join(lines))
+        return len(lines)
+
+    def start(self):
+        """ Start the writer green thread """
+        if self.writer is None:
+            self.writer = hub.spawn(self._writer)
+        return self.writer
+
+    def _writer(self):
+        while True:
+            hub.sleep(self.interval)
+            self.drain()
+
+    def stats(self):
+        return {'queued': len(self.buffer),
+                'logged': self.logged,
+                'overwritten': self.overwritten,
+                'seen': dict(self.seen)}
@@ -0,0 +1,160 @@
+"""
+    Compact binary trace of the events seen by the controller: packets
+    in, port status, switch enter and link add/delete. The trace is
+    replayed without Mininet by benchmarks/replay_trace.py.
+
+    TraceRecorder packs each event into a timestamped record and appends
+    it to an in-memory list, so the handlers do no I/O. A background green
+    thread writes the queued records every interval seconds with a single
+    write call, or as soon as buffer_size bytes are queued.
+
+    File: MAGIC, then the records. Each one is a RECORD header (time,
+    kind, dpid, payload length) followed by the payload of its kind:
+        PACKET_IN: PACKET_IN_FIELDS, then the frame (msg.data)
+        PORT_STATUS: PORT_STATUS_FIELDS
+        SWITCH_ENTER: the port numbers of the switch (uint32 each)
+        LINK_ADD, LINK_DELETE: LINK_FIELDS (dpid is the source switch)
+"""
+import struct
+import time
+
+from ryu.lib import hub
+
+MAGIC = b'RYUTRACE\x00\x01'
+# time, kind, dpid, payload length
+RECORD = struct.Struct('!dBQH')
+# buffer_id, total_len, in_port, reason, table_id, cookie
+PACKET_IN_FIELDS = struct.Struct('!IHIBBQ')
+# reason, port_no, config, state
+PORT_STATUS_FIELDS = struct.Struct('!BIII')
+# src port_no, dst dpid, dst port_no
+LINK_FIELDS = struct.Struct('!IQI')
+PORT_NO = struct.Struct('!I')
+PACKET_IN = 1
+PORT_STATUS = 2
+SWITCH_ENTER = 3
+LINK_ADD = 4
+LINK_DELETE = 5
+KIND_NAMES = {PACKET_IN: 'packet_in', PORT_STATUS: 'port_status',
+              SWITCH_ENTER: 'switch_enter', LINK_ADD: 'link_add',
+              LINK_DELETE: 'link_delete'}
+
+
+class TraceRecorder(object):
+    """ Buffered writer of the trace records """
+
+    def __init__(self, path, interval=1.0, buffer_size=1 << 20):
+        self.path = path
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.out = open(path, 'wb')
+        self.out.write(MAGIC)
+        # Packed records not written yet, and their size
+        self.chunks = []
+        self.queued = 0
+        # Counters
+        self.records = 0
+        self.written = len(MAGIC)
+        self.writer = None
+
+    def record(self, kind, dpid, payload=b''):
+        """ Queue a record of kind (payload already packed) """
+        self.chunks.append(RECORD.pack(time.time(), kind, dpid,
+                                       len(payload)))
+        self.chunks.append(payload)
+        self.queued += RECORD.size + len(payload)
+        self.records += 1
+        if self.queued >= self.buffer_size:
+            self.flush()
+
+    def packet_in(self, msg):
+        self.record(PACKET_IN, msg.datapath.id, PACKET_IN_FIELDS.pack(
+            msg.buffer_id, msg.total_len, msg.match['in_port'], msg.reason,
+            msg.table_id, msg.cookie) + bytes(msg.data or b''))
+
+    def port_status(self, msg):
+        desc = msg.desc
+        self.record(PORT_STATUS, msg.datapath.id, PORT_STATUS_FIELDS.pack(
+            msg.reason, desc.port_no, desc.config, desc.state))
+
+    def switch_enter(self, switch):
+        datapath = switch.dp
+        self.record(SWITCH_ENTER, datapath.id, b''.join(
+            PORT_NO.pack(port_no) for port_no in sorted(datapath.ports)))
+
+    def link(self, link, added=True):
+        self.record(LINK_ADD if added else LINK_DELETE, link.src.dpid,
+                    LINK_FIELDS.pack(link.src.port_no, link.dst.dpid,
+                                     link.dst.port_no))
+
+    def flush(self):
+        """ Write the queued records, returns the bytes written """
+        if not self.chunks or self.out is None:
+            return 0
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.queued = 0
+        self.out.write(data)
+        self.out.flush()
+        self.written += len(data)
+        return len(data)
+
+    def start(self):
+        """ Start the writer green thread """
+        if self.writer is None:
+            self.writer = hub.spawn(self._writer)
+        return self.writer
+
+    def _writer(self):
+        while self.out is not None:
+            hub.sleep(self.interval)
+            self.flush()
+
+    def close(self):
+        """ Write the queued records and close the file """
+        if self.out is None:
+            return
+        self.flush()
+        self.out.close()
+        self.out = None
+
+    def stats(self):
+        return {'path': self.path,
+                'records': self.records,
+                'queued': self.queued,
+                'written': self.written}
+
+
+def decode(kind, payload):
+    """ Return the values of a record payload (see the module doc) """
+    if kind == PACKET_IN:
+        size = PACKET_IN_FIELDS.size
+        return PACKET_IN_FIELDS.unpack(payload[:size]) + (payload[size:],)
+    if kind == PORT_STATUS:
+        return PORT_STATUS_FIELDS.unpack(payload)
+    if kind == SWITCH_ENTER:
+        return struct.unpack('!%dI' % (len(payload) // PORT_NO.size),
+                             payload)
+    if kind in (LINK_ADD, LINK_DELETE):
+        return LINK_FIELDS.unpack(payload)
+    raise ValueError('Unknown trace record kind %s' % kind)
+
+
+def read_trace(path):
+    """ Yield the (time, kind, dpid, values) records of a trace file
+
+    A record cut short (the controller killed while writing) ends the
+    trace.
+    """
+    with open(path, 'rb') as trace:
+        data = trace.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('%s is not an event trace' % path)
+    offset = len(MAGIC)
+    while offset + RECORD.size <= len(data):
+        stamp, kind, dpid, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        yield stamp, kind, dpid, decode(kind, data[offset:offset + length])
+        offset += length
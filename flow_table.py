@@ -0,0 +1,230 @@
+"""
+    Controller side copy (shadow) of the switches flow tables.
+
+    Holds every per destination flow installed by the controller
+    (controller.py), indexed by switch, by destination and by cookie. It
+    is kept in sync by the controller deletes and by the
+    EventOFPFlowRemoved messages of flows that expire.
+"""
+import collections
+import time
+
+
+class FlowEntry(object):
+    """ One flow installed in a switch """
+    __slots__ = ('dpid', 'in_port', 'eth_dst', 'cookie', 'out_port')
+
+    def __init__(self, dpid, in_port, eth_dst, cookie, out_port):
+        self.dpid = dpid
+        self.in_port = in_port
+        self.eth_dst = eth_dst
+        self.cookie = cookie
+        self.out_port = out_port
+
+    @property
+    def key(self):
+        return (self.dpid, self.in_port, self.eth_dst)
+
+
+class ShadowFlowTable(object):
+    """ Flows installed in each switch, indexed by dpid, dst and cookie """
+
+    def __init__(self):
+        # (dpid, in_port, eth_dst) -> FlowEntry
+        self.entries = {}
+        # Indexes: value -> set of keys
+        self.by_dpid = {}
+        self.by_dst = {}
+        self.by_cookie = {}
+        # Counters
+        self.installs = 0
+        self.duplicates = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, dpid, in_port, eth_dst):
+        return self.entries.get((dpid, in_port, eth_dst))
+
+    def add(self, dpid, in_port, eth_dst, cookie, out_port):
+        """ Record a flow, returns False if the same flow is installed
+
+        A False return means the FlowMod does not need to be sent.
+        """
+        key = (dpid, in_port, eth_dst)
+        entry = self.entries.get(key)
+        if (entry is not None and entry.cookie == cookie and
+                entry.out_port == out_port):
+            self.duplicates += 1
+            return False
+        if entry is not None:
+            self._unindex(entry)
+        entry = FlowEntry(dpid, in_port, eth_dst, cookie, out_port)
+        self.entries[key] = entry
+        self.by_dpid.setdefault(dpid, set()).add(key)
+        self.by_dst.setdefault(eth_dst, set()).add(key)
+        self.by_cookie.setdefault(cookie, set()).add(key)
+        self.installs += 1
+        return True
+
+    def _unindex(self, entry):
+        key = entry.key
+        for index, value in ((self.by_dpid, entry.dpid),
+                             (self.by_dst, entry.eth_dst),
+                             (self.by_cookie, entry.cookie)):
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def remove(self, dpid, in_port, eth_dst, cookie=None):
+        """ Forget a flow (only if it has cookie, when given) """
+        entry = self.entries.get((dpid, in_port, eth_dst))
+        if entry is None or (cookie is not None and entry.cookie != cookie):
+            return None
+        del self.entries[entry.key]
+        self._unindex(entry)
+        return entry
+
+    def expire(self, dpid, in_port, eth_dst, cookie):
+        """ Forget a flow removed by the switch (idle/hard timeout) """
+        entry = self.remove(dpid, in_port, eth_dst, cookie)
+        if entry is not None:
+            self.expired += 1
+        return entry
+
+    def remove_dst(self, eth_dst):
+        """ Forget every flow to eth_dst, returns the dpids that had one """
+        dpids = set()
+        for key in list(self.by_dst.get(eth_dst, ())):
+            dpids.add(self.remove(*key).dpid)
+        return dpids
+
+    def remove_dpid(self, dpid):
+        """ Forget every flow of a switch """
+        for key in list(self.by_dpid.get(dpid, ())):
+            self.remove(*key)
+
+    def dst_flows(self, eth_dst):
+        """ Return the flows to eth_dst """
+        return [self.entries[key] for key in self.by_dst.get(eth_dst, ())]
+
+    def cookie_flows(self, cookie, mask=0xffffffffffffffff):
+        """ Return the flows whose cookie matches cookie under mask """
+        if mask == 0xffffffffffffffff:
+            keys = self.by_cookie.get(cookie, ())
+            return [self.entries[key] for key in keys]
+        return [self.entries[key]
+                for value, keys in self.by_cookie.items()
+                if value & mask == cookie & mask for key in keys]
+
+    def count(self, dpid):
+        """ Number of flows installed in a switch """
+        return len(self.by_dpid.get(dpid, ()))
+
+    def stats(self):
+        """ Return the table counters and the occupancy of each switch """
+        return {'entries': len(self.entries),
+                'installs': self.installs,
+                'duplicates': self.duplicates,
+                'expired': self.expired,
+                'per_switch': dict((dpid, len(keys))
+                                   for dpid, keys in self.by_dpid.items())}
+
+
+class PendingInstalls(object):
+    """ Flows just sent to the switches, possibly not installed yet
+
+    Until a FlowMod lands, the next packets to the same destination still
+    raise packets in. Inside the window those packets only need a
+    PacketOut with the output port already chosen.
+    """
+
+    def __init__(self, window=0.5):
+        self.window = window
+        # (dpid, in_port, eth_dst) -> (expire time, out_port)
+        self.pending = {}
+        # eth_dst -> keys of its pending flows
+        self.by_dst = {}
+        # (expire time, key) in insertion order, to drop old entries
+        self._expire = collections.deque()
+        # Counters
+        self.absorbed = 0
+        self._second = 0
+        self._second_count = 0
+        self.absorbed_last_second = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def _purge(self, now):
+        expire = self._expire
+        while expire and expire[0][0] <= now:
+            deadline, key = expire.popleft()
+            entry = self.pending.get(key)
+            if entry is not None and entry[0] == deadline:
+                self._remove(key)
+
+    def _remove(self, key):
+        del self.pending[key]
+        keys = self.by_dst[key[2]]
+        keys.discard(key)
+        if not keys:
+            del self.by_dst[key[2]]
+
+    def add(self, dpid, in_port, eth_dst, out_port, now=None):
+        """ Record a flow sent to a switch """
+        if now is None:
+            now = time.time()
+        self._purge(now)
+        key = (dpid, in_port, eth_dst)
+        deadline = now + self.window
+        self.pending[key] = (deadline, out_port)
+        self.by_dst.setdefault(eth_dst, set()).add(key)
+        self._expire.append((deadline, key))
+
+    def lookup(self, dpid, in_port, eth_dst, now=None):
+        """ Return the out_port of a pending flow (or None)
+
+        A hit counts as one packet in absorbed.
+        """
+        if now is None:
+            now = time.time()
+        entry = self.pending.get((dpid, in_port, eth_dst))
+        if entry is None or entry[0] <= now:
+            return None
+        self.absorbed += 1
+        second = int(now)
+        if second != self._second:
+            self.absorbed_last_second = (self._second_count
+                                         if second == self._second + 1
+                                         else 0)
+            self._second = second
+            self._second_count = 0
+        self._second_count += 1
+        return entry[1]
+
+    def discard(self, eth_dst):
+        """ Forget the pending flows to eth_dst (e.g. the host moved) """
+        for key in self.by_dst.pop(eth_dst, ()):
+            del self.pending[key]
+
+    def stats(self, now=None):
+        """ Return the counters, absorbed_per_second is the last second """
+        if now is None:
+            now = time.time()
+        second = int(now)
+        if second == self._second:
+            per_second = self.absorbed_last_second
+        elif second == self._second + 1:
+            per_second = self._second_count
+        else:
+            per_second = 0
+        return {'pending': len(self.pending),
+                'absorbed': self.absorbed,
+                'absorbed_per_second': per_second}
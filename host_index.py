@@ -0,0 +1,49 @@
+"""
+    Host location index used by the SDN controller (controller.py).
+
+    Maps every known host MAC to the (dpid, port) where it is attached and
+    back, so port events find the hosts on a port without scanning the
+    network graph. Several hosts may share a port (the stations behind a
+    wifi access point).
+"""
+
+
+class HostIndex(object):
+    """ Bidirectional index host MAC <-> (dpid, port) """
+
+    def __init__(self):
+        # mac -> (dpid, port)
+        self.by_mac = {}
+        # (dpid, port) -> set of MACs
+        self.by_port = {}
+
+    def __contains__(self, mac):
+        return mac in self.by_mac
+
+    def __len__(self):
+        return len(self.by_mac)
+
+    def add(self, mac, dpid, port):
+        """ Record mac at (dpid, port), forgetting its old location """
+        self.remove(mac)
+        location = (dpid, port)
+        self.by_mac[mac] = location
+        self.by_port.setdefault(location, set()).add(mac)
+
+    def remove(self, mac):
+        """ Forget mac, returns its last (dpid, port) or None """
+        location = self.by_mac.pop(mac, None)
+        if location is not None:
+            macs = self.by_port[location]
+            macs.discard(mac)
+            if not macs:
+                del self.by_port[location]
+        return location
+
+    def location(self, mac):
+        """ Return the (dpid, port) of mac or None """
+        return self.by_mac.get(mac)
+
+    def host_at(self, dpid, port):
+        """ Return the set of MACs attached to (dpid, port) (a copy) """
+        return set(self.by_port.get((dpid, port), ()))
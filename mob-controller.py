@@ -2,8 +2,6 @@ from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import CONFIG_DISPATCHER, MAIN_DISPATCHER
 from ryu.controller.handler import set_ev_cls
-from ryu.lib.packet import ethernet
-from ryu.lib.packet import packet
 from ryu.ofproto import ofproto_v1_3
 from ryu.ofproto.ether import ETH_TYPE_LLDP
 # Used for Topology Discover
@@ -13,10 +11,19 @@ from ryu.topology.api import get_link
 from ryu.topology.api import get_switch
 # Used to process graphs
 import networkx as nx
+# Ethernet header parsing without decoding the whole packet
+from packet_header import parse_eth
+# Sampled and buffered logging for the packet in handler
+from event_log import EventLog
 # Debug only
-import pprint
 import copy
 
+# Only 1 in EVENT_LOG_RATES[kind] packet in events is logged (0: none),
+# send SIGUSR1 to log all of them for EVENT_TRACE_SECONDS
+EVENT_LOG_RATES = {'packet_in': 100, 'path': 100, 'flood': 100,
+                   'edges': 0}
+EVENT_TRACE_SECONDS = 30
+
 
 class SimpleSwitch13(app_manager.RyuApp):
     OFP_VERSIONS = [ofproto_v1_3.OFP_VERSION]
@@ -27,6 +34,18 @@ class SimpleSwitch13(app_manager.RyuApp):
         self.topology_api_app = self
         # Internal representation of Network
         self.net = nx.DiGraph()
+        # Packet in events log
+        self.event_log = EventLog(self.logger)
+        self.event_log.register('packet_in',
+                                'dpid=%s src=%s dst=%s in_port=%s',
+                                EVENT_LOG_RATES['packet_in'])
+        self.event_log.register('path', 'dpid=%s dst=%s path=%s',
+                                EVENT_LOG_RATES['path'])
+        self.event_log.register('flood', 'dpid=%s dst=%s',
+                                EVENT_LOG_RATES['flood'])
+        self.event_log.register('edges', 'edges=%s', EVENT_LOG_RATES['edges'])
+        self.event_log.install_signal(EVENT_TRACE_SECONDS)
+        self.event_log.start()
 
     def add_flow(self, datapath, in_port, dst, actions):
         ofproto = datapath.ofproto
@@ -73,7 +92,6 @@ class SimpleSwitch13(app_manager.RyuApp):
                                                  priority=0,
                                                  instructions=inst)
         datapath.send_msg(mod)
-        self.add_flow(datapath, 0, match, actions)
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
@@ -83,9 +101,10 @@ class SimpleSwitch13(app_manager.RyuApp):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         in_port = msg.match['in_port']
-        # Getting packet and ether frame
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocols(ethernet.ethernet)[0]
+        # Getting ether frame header
+        eth = parse_eth(msg.data)
+        if eth is None:
+            return
         # Getting source, destination and DatapathID
         dst = eth.dst
         src = eth.src
@@ -97,8 +116,7 @@ class SimpleSwitch13(app_manager.RyuApp):
             return
 
         # Loggin packet in messages
-        self.logger.info("OFP -- EventOFPPacketIn")
-        self.logger.info("... Packet in %s %s %s %s", dpid, src, dst, in_port)
+        self.event_log.log('packet_in', dpid, src, dst, in_port)
 
         # Adding nodes to NetworkX Object
         # If the source is not in the Graph, add it to graph
@@ -110,16 +128,24 @@ class SimpleSwitch13(app_manager.RyuApp):
 
         # If destination host is on graph, grab the next hop,
 
-        self.logger.info("Nx -- Searching for " + dst)
-        if dst in self.net.nodes():
-            self.logger.info("Nx -- Found " + dst)
-            pprint.pprint(self.net.edges())
-            path = nx.shortest_path(self.net, src, dst)
+        if dst in self.net:
+            if self.event_log.sampled('edges'):
+                self.event_log.record('edges', self.net.edges())
+            try:
+                path = nx.shortest_path(self.net, src, dst)
+                if dpid not in path:
+                    # src moved since it was learned: its frame left the
+                    # path from there, route it from this switch
+                    path = nx.shortest_path(self.net, dpid, dst)
+            except nx.NetworkXException as e:
+                self.logger.info(e)
+                return
+            self.event_log.log('path', dpid, dst, path)
             next_hop = path[path.index(dpid) + 1]
             out_port = self.net[dpid][next_hop]['port']
         else:
             # Destination not in graph, need FLOOD the packet
-            self.logger.info(dst + " destination IS not in Net. FLOOD")
+            self.event_log.log('flood', dpid, dst)
             out_port = ofproto.OFPP_FLOOD
 
         actions = [parser.OFPActionOutput(out_port)]
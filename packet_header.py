@@ -0,0 +1,62 @@
+"""
+    Fast parsing of the headers used by the packet in handlers.
+
+    ryu.lib.packet.packet.Packet(msg.data) decodes every protocol layer
+    of the frame, but the controllers only look at the Ethernet addresses
+    and type (and at the ARP fields for ARP frames). These functions read
+    only those fields, in place, from the packet in data (str, bytes,
+    bytearray or memoryview). Use ryu.lib.packet when a full decode (or a
+    new packet) is needed.
+"""
+import collections
+import struct
+
+ETH_TYPE_ARP = 0x0806
+ETH_TYPE_IPV6 = 0x86dd
+ETH_TYPE_LLDP = 0x88cc
+ETH_TYPE_8021Q = 0x8100
+
+# dst (6 bytes), src (6 bytes), ethertype
+_ETH = struct.Struct('!6B6BH')
+ETH_HEADER_LEN = _ETH.size
+_VLAN_TYPE = struct.Struct('!H')
+# hwtype, proto, hlen, plen, opcode, src_mac, src_ip, dst_mac, dst_ip
+_ARP = struct.Struct('!HHBBH6B4B6B4B')
+_MAC = '%02x:%02x:%02x:%02x:%02x:%02x'
+_IP = '%d.%d.%d.%d'
+
+EthHeader = collections.namedtuple('EthHeader',
+                                   'dst src ethertype offset')
+ArpHeader = collections.namedtuple('ArpHeader',
+                                   'opcode src_mac src_ip dst_mac dst_ip')
+
+
+def parse_eth(data):
+    """ Return the EthHeader of a frame, or None if it is too short
+
+    A 802.1Q tag is skipped: ethertype is the type of the payload and
+    offset is where the payload starts.
+    """
+    if len(data) < _ETH.size:
+        return None
+    fields = _ETH.unpack_from(data, 0)
+    ethertype = fields[12]
+    offset = _ETH.size
+    if ethertype == ETH_TYPE_8021Q:
+        if len(data) < offset + 4:
+            return None
+        ethertype = _VLAN_TYPE.unpack_from(data, offset + 2)[0]
+        offset += 4
+    return EthHeader(_MAC % fields[0:6], _MAC % fields[6:12], ethertype,
+                     offset)
+
+
+def parse_arp(data, offset):
+    """ Return the ArpHeader (IPv4 over Ethernet) at offset, or None """
+    if len(data) < offset + _ARP.size:
+        return None
+    fields = _ARP.unpack_from(data, offset)
+    if fields[2] != 6 or fields[3] != 4:
+        return None
+    return ArpHeader(fields[4], _MAC % fields[5:11], _IP % fields[11:15],
+                     _MAC % fields[15:21], _IP % fields[21:25])
@@ -0,0 +1,133 @@
+"""
+    Shortest path cache used by the SDN controller (controller.py).
+
+    Keeps the result of nx.shortest_path for each (src, dst) pair and an
+    index from every node to the cached paths crossing it, so topology
+    events only drop the paths they can actually affect. Shortest path
+    trees toward a destination (the paths of every node to it, which
+    agree on the next hop of each node) are cached too.
+"""
+import networkx as nx
+
+from topology_store import shortest_path
+
+
+class PathCache(object):
+    """ Shortest path cache keyed by (src, dst) """
+
+    def __init__(self):
+        # (src, dst) -> path (list of nodes)
+        self.paths = {}
+        # node -> set of (src, dst) keys whose path crosses the node
+        self.by_node = {}
+        # dst -> {node: path from node to dst}
+        self.trees = {}
+        # dst -> {node: number of tree paths whose next hop is node}
+        self.tree_hops = {}
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, graph, src, dst):
+        """ Return the shortest path from src to dst in graph.
+
+        Raises the same exceptions as nx.shortest_path when there is no
+        path. The returned list is shared with the cache, do not change it.
+        """
+        key = (src, dst)
+        path = self.paths.get(key)
+        if path is not None:
+            self.hits += 1
+            return path
+        self.misses += 1
+        path = shortest_path(graph, src, dst)
+        self.paths[key] = path
+        for node in path:
+            self.by_node.setdefault(node, set()).add(key)
+        return path
+
+    def get_tree_path(self, graph, src, dst):
+        """ Return the path from src to dst in the shortest path tree of dst
+
+        Every path returned for the same dst follows the same tree, so a
+        switch always has a single next hop toward dst. Raises
+        nx.NetworkXNoPath when src does not reach dst.
+        """
+        tree = self.trees.get(dst)
+        if tree is not None and src in tree:
+            self.hits += 1
+            return tree[src]
+        self.misses += 1
+        if dst not in graph:
+            raise nx.NetworkXNoPath('Target %s is not in G' % (dst,))
+        tree = self.trees[dst] = shortest_path(graph, target=dst)
+        hops = self.tree_hops[dst] = {}
+        for path in tree.values():
+            if len(path) > 2:
+                hops[path[1]] = hops.get(path[1], 0) + 1
+        if src not in tree:
+            raise nx.NetworkXNoPath('No path between %s and %s.' %
+                                    (src, dst))
+        return tree[src]
+
+    def _drop_tree(self, dst):
+        if self.trees.pop(dst, None) is not None:
+            self.invalidations += 1
+            del self.tree_hops[dst]
+
+    def _drop(self, key):
+        path = self.paths.pop(key, None)
+        if path is None:
+            return
+        self.invalidations += 1
+        for node in path:
+            keys = self.by_node.get(node)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_node[node]
+
+    def invalidate_node(self, node):
+        """ Drop every cached path that starts, ends or passes by node """
+        for key in list(self.by_node.get(node, ())):
+            self._drop(key)
+        for dst, tree in list(self.trees.items()):
+            if dst == node or self.tree_hops[dst].get(node):
+                self._drop_tree(dst)
+            elif node in tree:
+                # A leaf of the tree (e.g. a host): only its own path
+                path = tree.pop(node)
+                if len(path) > 2:
+                    self.tree_hops[dst][path[1]] -= 1
+
+    def invalidate_edge(self, u, v):
+        """ Drop every cached path that uses the edge u -> v """
+        keys = self.by_node.get(u, set()) & self.by_node.get(v, set())
+        for key in keys:
+            path = self.paths[key]
+            i = path.index(u)
+            if i + 1 < len(path) and path[i + 1] == v:
+                self._drop(key)
+        for dst, tree in list(self.trees.items()):
+            path = tree.get(u)
+            if path is not None and len(path) > 1 and path[1] == v:
+                self._drop_tree(dst)
+
+    def clear(self):
+        """ Drop all cached paths (e.g. a new link may shorten any path) """
+        self.invalidations += len(self.paths) + len(self.trees)
+        self.paths.clear()
+        self.by_node.clear()
+        self.trees.clear()
+        self.tree_hops.clear()
+
+    def stats(self):
+        """ Return the cache counters """
+        lookups = self.hits + self.misses
+        return {'entries': len(self.paths),
+                'trees': len(self.trees),
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'hit_ratio': float(self.hits) / lookups if lookups else 0.0}
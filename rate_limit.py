@@ -0,0 +1,60 @@
+"""
+    Token buckets to limit event rates in the controller.
+
+    PacketInLimiter keeps one bucket per switch and drops the packets in
+    above the configured rate before they are parsed.
+"""
+import time
+
+
+class TokenBucket(object):
+    """ rate tokens per second, up to burst tokens saved """
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.stamp = time.time() if now is None else now
+
+    def consume(self, now=None, tokens=1):
+        """ Take tokens from the bucket, False if there are not enough """
+        if now is None:
+            now = time.time()
+        elapsed = now - self.stamp
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.stamp = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class PacketInLimiter(object):
+    """ One token bucket per switch, with admitted/dropped counters """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.admitted = {}
+        self.dropped = {}
+
+    def admit(self, dpid, now=None):
+        """ True if a packet in from dpid is within the rate """
+        bucket = self.buckets.get(dpid)
+        if bucket is None:
+            bucket = self.buckets[dpid] = TokenBucket(self.rate, self.burst,
+                                                      now)
+        if bucket.consume(now):
+            self.admitted[dpid] = self.admitted.get(dpid, 0) + 1
+            return True
+        self.dropped[dpid] = self.dropped.get(dpid, 0) + 1
+        return False
+
+    def stats(self):
+        """ Return {dpid: {'admitted': n, 'dropped': n}} """
+        return dict((dpid, {'admitted': self.admitted.get(dpid, 0),
+                            'dropped': self.dropped.get(dpid, 0)})
+                    for dpid in self.buckets)
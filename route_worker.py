@@ -0,0 +1,244 @@
+"""
+    Switch route computation of the SDN controller (controller.py) and
+    the worker running it off the Ryu hub loop (ASYNC_ROUTES). Only the
+    routes of the pipeline and label modes go there, the host mode paths
+    can be computed by the packet in workers of shard.py instead
+    (PACKET_IN_WORKERS).
+
+    compute_routes only reads the graph it is given, so it can run in a
+    worker process on a snapshot of the switch graph while the hub keeps
+    serving the datapaths. RouteWorker runs one computation at a time: a
+    computation submitted meanwhile waits, replacing any older one still
+    waiting (only the newest topology matters).
+"""
+import multiprocessing
+import traceback
+
+from ryu.lib import hub
+
+from topology_store import shortest_path
+from topology_store import shortest_path_length
+
+try:
+    from eventlet.hubs import trampoline
+except ImportError:
+    trampoline = None
+
+
+def ecmp_next_hops(graph, switches, egress):
+    """ Ports of every switch on a shortest path to egress
+
+    Returns {dpid: sorted ports}, the egress itself excluded.
+    """
+    # Distance from every node to egress (one BFS)
+    dist = shortest_path_length(graph, target=egress)
+    hops = {}
+    for node, length in dist.items():
+        if node == egress or node not in switches:
+            continue
+        hops[node] = tuple(sorted(
+            graph[node][nbr]['port']
+            for nbr in graph.successors(node)
+            if dist.get(nbr) == length - 1))
+    return hops
+
+
+def failover_next_hops(graph, switches, egress, paths):
+    """ Primary and backup ports of every switch toward egress
+
+    paths are the shortest paths of every node to egress. The backup
+    is the neighbour (other than the primary next hop) with the
+    shortest path to egress that does not cross the switch, a loop
+    free alternate. Returns {dpid: (primary, backup) or (primary,)}.
+    """
+    hops = {}
+    for node, path in paths.items():
+        if node == egress or node not in switches:
+            continue
+        ports = (graph[node][path[1]]['port'],)
+        backups = [(len(paths[nbr]), graph[node][nbr]['port'])
+                   for nbr in graph.successors(node)
+                   if nbr != path[1] and nbr in switches and
+                   nbr in paths and node not in paths[nbr]]
+        if backups:
+            ports += (min(backups)[1],)
+        hops[node] = ports
+    return hops
+
+
+def compute_routes(graph, switches, ecmp=False, failover=False):
+    """ Route of every switch toward every other switch
+
+    Returns (routes, groups): routes maps (dpid, egress) to the out port
+    (None on the egress itself), groups maps (dpid, egress) to the ports
+    of its ECMP or fast failover group.
+    """
+    routes = {}
+    groups = {}
+    for egress in switches:
+        if egress not in graph:
+            continue
+        routes[(egress, egress)] = None
+        if ecmp:
+            for node, ports in ecmp_next_hops(graph, switches,
+                                              egress).items():
+                # The first port forwards the packets out
+                routes[(node, egress)] = ports[0]
+                groups[(node, egress)] = ports
+            continue
+        # Shortest paths from every node to egress (one BFS)
+        paths = shortest_path(graph, target=egress)
+        if failover:
+            for node, ports in failover_next_hops(graph, switches, egress,
+                                                  paths).items():
+                routes[(node, egress)] = ports[0]
+                groups[(node, egress)] = ports
+            continue
+        for node, path in paths.items():
+            if node in switches and node != egress:
+                routes[(node, egress)] = graph[node][path[1]]['port']
+    return routes, groups
+
+
+def route_changes(current, routes, grouped=False):
+    """ Keys of routes whose flow differs from current, keys removed
+
+    With groups (ECMP or fast failover) the flows output to the group of
+    the route, only a route added (or changed to or from the egress)
+    changes the flow.
+    """
+    # No routes.items(): a list of every route on Python 2
+    if grouped:
+        changed = set(key for key in routes
+                      if key not in current or
+                      (current[key] is None) != (routes[key] is None))
+    else:
+        changed = set(key for key in routes
+                      if key not in current or current[key] != routes[key])
+    removed = [key for key in current if key not in routes]
+    return changed, removed
+
+
+def snapshot(graph, switches):
+    """ Copy of the switch to switch edges of graph (same graph type)
+
+    Hosts are leaves, they do not change the routes between switches.
+    The copy is never changed, the worker can read it while the
+    controller updates graph.
+    """
+    copy = graph.__class__()
+    for dpid in switches:
+        if dpid in graph:
+            copy.add_node(dpid)
+    for dpid in switches:
+        if dpid not in graph:
+            continue
+        for nbr in graph.successors(dpid):
+            if nbr in copy:
+                copy.add_edge(dpid, nbr, {'port': graph[dpid][nbr]['port']})
+    return copy
+
+
+def _serve(conn):
+    """ Worker process: run (function, args) from conn, send the result """
+    while True:
+        try:
+            function, args = conn.recv()
+        except EOFError:
+            return
+        try:
+            conn.send((True, function(*args)))
+        except Exception:
+            conn.send((False, traceback.format_exc()))
+
+
+class RouteWorker(object):
+    """ Runs function(*args) in a worker process, one at a time
+
+    callback(epoch, result) is called on the hub loop. The hub only
+    waits for the result (a green wait on the pipe): a process, unlike a
+    thread, does not take the GIL from the hub while it computes. The
+    function and its arguments must be picklable. Without eventlet (or
+    with process False) the computation runs in a green thread. When
+    the worker process dies, the computation it lost runs in the green
+    thread and the next one starts a new worker.
+    """
+
+    def __init__(self, callback, process=True):
+        self.callback = callback
+        self.process = process and trampoline is not None
+        self.conn = None
+        self.worker = None
+        self.busy = False
+        # (epoch, function, args) waiting for the running computation
+        self.waiting = None
+        # Counters
+        self.submitted = 0
+        self.completed = 0
+        self.superseded = 0
+        self.restarts = 0
+
+    def submit(self, epoch, function, *args):
+        """ Queue a computation, replacing the one waiting (if any) """
+        self.submitted += 1
+        if self.waiting is not None:
+            self.superseded += 1
+        self.waiting = (epoch, function, args)
+        if not self.busy:
+            self.busy = True
+            hub.spawn(self._run)
+
+    def _start(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.worker = multiprocessing.Process(target=_serve, args=(child,))
+        # Ends with the controller
+        self.worker.daemon = True
+        self.worker.start()
+        child.close()
+
+    def _execute(self, function, args):
+        if not self.process:
+            return function(*args)
+        if self.conn is None:
+            self._start()
+        try:
+            self.conn.send((function, args))
+            trampoline(self.conn.fileno(), read=True)
+            ok, result = self.conn.recv()
+        except (EOFError, IOError):
+            # The worker died (killed, out of memory): the next
+            # computation starts a new one, this one is not lost
+            self.close()
+            self.restarts += 1
+            return function(*args)
+        if not ok:
+            raise RuntimeError('Route worker failed:\n' + result)
+        return result
+
+    def _run(self):
+        try:
+            while self.waiting is not None:
+                epoch, function, args = self.waiting
+                self.waiting = None
+                result = self._execute(function, args)
+                self.completed += 1
+                self.callback(epoch, result)
+        finally:
+            self.busy = False
+
+    def close(self):
+        """ End the worker process (it exits on the closed pipe) """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.worker is not None:
+            self.worker.join(0)
+            self.worker = None
+
+    def stats(self):
+        """ Return the worker counters """
+        return {'submitted': self.submitted,
+                'completed': self.completed,
+                'superseded': self.superseded,
+                'restarts': self.restarts,
+                'busy': self.busy}
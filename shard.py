@@ -0,0 +1,417 @@
+"""
+    Packet in processing sharded across worker processes (controller.py,
+    see PACKET_IN_WORKERS).
+
+    The controller process stays the only writer of the topology and of
+    the host locations: every change is published to the workers as a
+    numbered update (the replica version). Each worker keeps a replica,
+    a network graph and its path cache, and serves the packets in
+    dispatched to it by a hash of the destination MAC (or of the dpid):
+    it computes the paths and builds and serializes the FlowMods and the
+    PacketOut. The controller only records the flows in its shadow flow
+    table and writes the bytes to the datapath connection of each switch
+    (Datapath.send), so the path computations and the message encoding
+    run in parallel.
+
+    Updates and packets in share the pipe of each worker, a packet in is
+    always served by a replica with every update published before it.
+"""
+import multiprocessing
+import os
+import traceback
+
+import networkx as nx
+from ryu.lib import hub
+from ryu.ofproto import ofproto_v1_3
+from ryu.ofproto import ofproto_v1_3_parser
+
+from path_cache import PathCache
+from topology_store import TopologyStore
+
+try:
+    from eventlet.hubs import trampoline
+except ImportError:
+    trampoline = None
+
+# Messages queued for a worker before they are sent without waiting for
+# the hub loop to flush them
+BATCH_SIZE = 64
+# Flows remembered by a worker as already returned (then forgotten)
+SENT_FLOWS_MAX = 100000
+
+
+def cpu_time():
+    """ CPU seconds (user and system) used by this process """
+    times = os.times()
+    return times[0] + times[1]
+
+
+class _Datapath(object):
+    """ What the OpenFlow parser needs of a datapath to build messages """
+
+    ofproto = ofproto_v1_3
+    ofproto_parser = ofproto_v1_3_parser
+
+    def __init__(self, dpid):
+        self.id = dpid
+
+
+def serialize(msg):
+    """ Return the bytes of an OpenFlow message (the switch gets xid 0) """
+    msg.set_xid(0)
+    msg.serialize()
+    return bytes(msg.buf)
+
+
+class Replica(object):
+    """ Copy of the network graph kept by a worker, routes packets in
+
+    The options are the forwarding settings of the controller:
+    dst_only (DST_ONLY_FLOWS), proactive (PROACTIVE_PATH_INSTALL),
+    bidirectional (BIDIRECTIONAL_FLOWS), idle_timeout (FLOW_IDLE_TIMEOUT)
+    and sparse (SPARSE_TOPOLOGY).
+    """
+
+    def __init__(self, dst_only=False, proactive=True, bidirectional=True,
+                 idle_timeout=0, sparse=False):
+        self.net = TopologyStore() if sparse else nx.DiGraph()
+        self.path_cache = PathCache()
+        self.dst_only = dst_only
+        self.proactive = proactive
+        self.bidirectional = bidirectional
+        self.idle_timeout = idle_timeout
+        # Version of the last update applied
+        self.version = 0
+        self.datapaths = {}
+        # (dpid, port) -> dpid of the switch at the other end of the link
+        self.link_ports = {}
+        # Flows already returned, by dst: {(dpid, in_port, out_port,
+        # cookie)}
+        self.sent = {}
+        self.sent_count = 0
+
+    def apply(self, version, op):
+        """ Apply an update published by the controller
+
+        op is one of:
+            ('switch', dpid)
+            ('link', src_dpid, dst_dpid, src_port, dst_port)
+            ('unlink', src_dpid, dst_dpid)
+            ('host', mac, dpid, port)
+            ('unhost', mac)
+            ('dst_only', enabled)
+        """
+        kind = op[0]
+        net = self.net
+        if kind == 'switch':
+            net.add_node(op[1])
+            self.path_cache.invalidate_node(op[1])
+        elif kind == 'link':
+            _, src, dst, src_port, dst_port = op
+            net.add_edge(src, dst, {'port': src_port})
+            net.add_edge(dst, src, {'port': dst_port})
+            self.link_ports[(src, src_port)] = dst
+            self.link_ports[(dst, dst_port)] = src
+            # A new link may shorten any cached path
+            self.path_cache.clear()
+        elif kind == 'unlink':
+            for u, v in ((op[1], op[2]), (op[2], op[1])):
+                if net.has_edge(u, v):
+                    self.link_ports.pop((u, net[u][v]['port']), None)
+                    net.remove_edge(u, v)
+                    self.path_cache.invalidate_edge(u, v)
+        elif kind == 'host':
+            _, mac, dpid, port = op
+            if mac in net:
+                net.remove_node(mac)
+                self.path_cache.invalidate_node(mac)
+            net.add_edge(mac, dpid, {'port': port})
+            net.add_edge(dpid, mac, {'port': port})
+        elif kind == 'unhost':
+            # Its flows are deleted
+            self.sent_count -= len(self.sent.pop(op[1], ()))
+            if op[1] in net:
+                net.remove_node(op[1])
+                self.path_cache.invalidate_node(op[1])
+        elif kind == 'dst_only':
+            self.dst_only = op[1]
+        else:
+            raise ValueError('Unknown update %r' % (op,))
+        self.version = version
+
+    def datapath(self, dpid):
+        datapath = self.datapaths.get(dpid)
+        if datapath is None:
+            datapath = self.datapaths[dpid] = _Datapath(dpid)
+        return datapath
+
+    def flow_mod(self, dpid, in_port, dst, out_port, cookie):
+        """ Bytes of the FlowMod of a flow to dst (see add_dst_flow) """
+        datapath = self.datapath(dpid)
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+        if in_port is None:
+            match = parser.OFPMatch(eth_dst=dst)
+        else:
+            match = parser.OFPMatch(in_port=in_port, eth_dst=dst)
+        inst = [parser.OFPInstructionActions(
+            ofproto.OFPIT_APPLY_ACTIONS, [parser.OFPActionOutput(out_port)])]
+        mod = parser.OFPFlowMod(datapath=datapath, cookie=cookie,
+                                idle_timeout=self.idle_timeout,
+                                flags=ofproto.OFPFF_SEND_FLOW_REM,
+                                priority=1, match=match, instructions=inst)
+        return serialize(mod)
+
+    def path_flows(self, path, dst, cookie, ingress, only=False):
+        """ Flows to dst on the switches of path, egress switch first
+
+        Returns [(dpid, in_port, out_port, cookie, FlowMod bytes)], only
+        the flow of the ingress switch when only is True. The bytes are
+        None for a flow returned before (the controller has it in its
+        shadow flow table, or builds the FlowMod itself), except on the
+        ingress switch: its packet in proves the flow is missing.
+        """
+        flows = []
+        net = self.net
+        if self.sent_count > SENT_FLOWS_MAX:
+            self.sent.clear()
+            self.sent_count = 0
+        sent = self.sent.setdefault(dst, set())
+        for i in range(len(path) - 2, 0, -1):
+            node = path[i]
+            if only and node != ingress:
+                continue
+            in_port = None
+            if not self.dst_only:
+                in_port = net[node][path[i - 1]]['port']
+            out_port = net[node][path[i + 1]]['port']
+            key = (node, in_port, out_port, cookie)
+            buf = None
+            if node == ingress or key not in sent:
+                if key not in sent:
+                    sent.add(key)
+                    self.sent_count += 1
+                buf = self.flow_mod(node, in_port, dst, out_port, cookie)
+            flows.append((node, in_port, out_port, cookie, buf))
+        return flows
+
+    def route(self, dpid, in_port, src, dst, buffer_id, data, cookies):
+        """ Route a packet in from src to dst (like packet_in_handler)
+
+        cookies are the flow cookies of dst and src. Returns (version,
+        dpid, [(src, dst, flows)], PacketOut bytes, error): the flows of
+        each direction (see path_flows) and the PacketOut of the packet,
+        or the reason of the failure.
+        """
+        net = self.net
+        try:
+            if self.dst_only:
+                path = [src] + self.path_cache.get_tree_path(net, dpid,
+                                                             dst)
+                reverse = self.path_cache.get_tree_path(net, dst, src)
+            else:
+                path = self.path_cache.get(net, src, dst)
+                reverse = path[::-1]
+            if dpid not in path:
+                # Sent here by a flow of another path: from this switch
+                prev = self.link_ports.get((dpid, in_port))
+                if prev is None:
+                    return (self.version, dpid, [], None,
+                            'Switch %s is not in the path %s -> %s' %
+                            (dpid, src, dst))
+                path = [prev] + self.path_cache.get(net, dpid, dst)
+        except Exception as e:
+            return self.version, dpid, [], None, str(e)
+        out_port = net[dpid][path[path.index(dpid) + 1]]['port']
+        flows = self.path_flows(path, dst, cookies[0], dpid,
+                                not self.proactive)
+        pairs = [(src, dst, flows)]
+        if self.bidirectional:
+            pairs.append((dst, src, self.path_flows(reverse, src,
+                                                    cookies[1], None)))
+        datapath = self.datapath(dpid)
+        parser = datapath.ofproto_parser
+        out = parser.OFPPacketOut(datapath=datapath, buffer_id=buffer_id,
+                                  in_port=in_port,
+                                  actions=[parser.OFPActionOutput(out_port)],
+                                  data=data)
+        return self.version, dpid, pairs, serialize(out), None
+
+
+def _serve(conn, options):
+    """ Worker process: apply the updates and route the packets in
+
+    Each message from conn is a list of ('update', (version, op)),
+    ('route', args) and ('stop', None); the routes are sent back as (CPU
+    seconds, results), results None after a stop.
+    """
+    replica = Replica(**options)
+    while True:
+        try:
+            messages = conn.recv()
+        except EOFError:
+            return
+        results = []
+        for kind, args in messages:
+            if kind == 'update':
+                replica.apply(*args)
+                continue
+            if kind == 'stop':
+                conn.send((cpu_time(), None))
+                return
+            try:
+                results.append(replica.route(*args))
+            except Exception:
+                results.append((replica.version, args[0], [], None,
+                                traceback.format_exc()))
+        if results:
+            conn.send((cpu_time(), results))
+
+
+class ShardPool(object):
+    """ Packets in routed by workers holding replicas of the topology
+
+    callback(result) is called on the hub loop with the result of each
+    packet in (see Replica.route). With process False (or without
+    eventlet) one replica routes the packets in synchronously, for the
+    tests.
+    """
+
+    def __init__(self, workers, callback, options=None, process=True):
+        self.callback = callback
+        self.options = options or {}
+        self.process = process and trampoline is not None
+        self.version = 0
+        # Messages waiting for a flush, per worker
+        self.outboxes = []
+        self.conns = []
+        self.flush_scheduled = False
+        # Set when results come back (see wait)
+        self.progress = hub.Event()
+        self.dead = False
+        self.replica = None
+        if not self.process:
+            self.replica = Replica(**self.options)
+            workers = 1
+        for _ in range(workers):
+            self.outboxes.append([])
+            if self.process:
+                self._start()
+        # CPU seconds used by each worker (last reported)
+        self.cpu = [0.0] * workers
+        # Counters
+        self.dispatched = [0] * workers
+        self.completed = 0
+
+    def __len__(self):
+        return len(self.outboxes)
+
+    def _start(self):
+        conn, child = multiprocessing.Pipe()
+        worker = multiprocessing.Process(target=_serve,
+                                         args=(child, self.options))
+        # Ends with the controller
+        worker.daemon = True
+        worker.start()
+        child.close()
+        self.conns.append(conn)
+        hub.spawn(self._read, len(self.conns) - 1)
+
+    def publish(self, op):
+        """ Send an update to every worker, returns its version """
+        self.version += 1
+        if self.replica is not None:
+            self.replica.apply(self.version, op)
+            return self.version
+        for index in range(len(self.outboxes)):
+            self._queue(index, ('update', (self.version, op)))
+        return self.version
+
+    def dispatch(self, key, args):
+        """ Route a packet in (Replica.route args) on the worker of key """
+        if self.replica is not None:
+            self.dispatched[0] += 1
+            self.completed += 1
+            self.callback(self.replica.route(*args))
+            return
+        index = hash(key) % len(self.outboxes)
+        self.dispatched[index] += 1
+        self._queue(index, ('route', args))
+
+    def _queue(self, index, message):
+        outbox = self.outboxes[index]
+        outbox.append(message)
+        if len(outbox) >= BATCH_SIZE:
+            self._send(index)
+        elif not self.flush_scheduled:
+            # Sent once the hub loop runs other green threads
+            self.flush_scheduled = True
+            hub.spawn(self.flush)
+
+    def _send(self, index):
+        outbox = self.outboxes[index]
+        if outbox and self.conns:
+            self.outboxes[index] = []
+            self.conns[index].send(outbox)
+
+    def flush(self):
+        """ Send the queued messages to the workers """
+        self.flush_scheduled = False
+        for index in range(len(self.outboxes)):
+            self._send(index)
+
+    def _read(self, index):
+        conn = self.conns[index]
+        while True:
+            try:
+                trampoline(conn.fileno(), read=True)
+                while conn.poll():
+                    self.cpu[index], results = conn.recv()
+                    if results is None:
+                        # The worker stopped (see close)
+                        conn.close()
+                        return
+                    for result in results:
+                        self.completed += 1
+                        self.callback(result)
+                    self.progress.set()
+            except (EOFError, IOError):
+                # The worker died
+                self.dead = True
+                self.progress.set()
+                return
+
+    @property
+    def pending(self):
+        """ Packets in dispatched and not routed yet """
+        return sum(self.dispatched) - self.completed
+
+    def wait(self, pending=0):
+        """ Wait (on the hub loop) until at most pending packets in are
+        not routed yet """
+        self.flush()
+        while self.pending > pending:
+            if self.dead:
+                raise RuntimeError('A packet in worker died')
+            self.progress.clear()
+            self.progress.wait()
+
+    def close(self):
+        """ Stop the worker processes, after the messages queued
+
+        The readers close the pipes when the workers answer the stop (a
+        pipe is not closed while the hub waits on it).
+        """
+        for index in range(len(self.conns)):
+            self.outboxes[index].append(('stop', None))
+            self._send(index)
+        self.conns = []
+
+    def stats(self):
+        """ Return the pool counters """
+        return {'workers': len(self.outboxes),
+                'version': self.version,
+                'dispatched': list(self.dispatched),
+                'completed': self.completed,
+                'pending': self.pending,
+                'cpu': list(self.cpu)}
@@ -0,0 +1,127 @@
+"""
+    Spanning tree of the switches, updated edge by edge.
+
+    The controller used to rebuild the whole tree with
+    nx.minimum_spanning_tree on every topology change. Here a new edge
+    joins two components or becomes a blocked (non tree) edge, and
+    removing a tree edge searches for a replacement edge only on the
+    smaller side of the cut. Every update returns the nodes whose tree
+    edges changed, i.e. the switches whose flood ports must be updated.
+"""
+
+
+class DynamicSpanningTree(object):
+    """ Spanning forest of an undirected graph """
+
+    def __init__(self):
+        # node -> set of neighbours (all edges)
+        self.adj = {}
+        # node -> set of neighbours in the tree
+        self.tree = {}
+        # node -> component id, component id -> set of nodes
+        self.comp = {}
+        self.members = {}
+        self._next_comp = 0
+
+    def __contains__(self, node):
+        return node in self.adj
+
+    def has_edge(self, u, v):
+        """ True if u - v is an edge of the spanning tree """
+        return v in self.tree.get(u, ())
+
+    def edges(self):
+        """ Return the tree edges """
+        return [(u, v) for u in self.tree for v in self.tree[u] if u < v]
+
+    def add_node(self, node):
+        if node in self.adj:
+            return
+        self.adj[node] = set()
+        self.tree[node] = set()
+        self.comp[node] = self._next_comp
+        self.members[self._next_comp] = set([node])
+        self._next_comp += 1
+
+    def remove_node(self, node):
+        """ Remove node and its edges, returns the changed nodes """
+        changed = set()
+        for nbr in list(self.adj.get(node, ())):
+            changed |= self.remove_edge(node, nbr)
+        if node in self.adj:
+            comp = self.comp.pop(node)
+            del self.members[comp]
+            del self.adj[node]
+            del self.tree[node]
+        changed.discard(node)
+        return changed
+
+    def add_edge(self, u, v):
+        """ Add the edge u - v, returns the changed nodes """
+        self.add_node(u)
+        self.add_node(v)
+        if v in self.adj[u]:
+            return set()
+        self.adj[u].add(v)
+        self.adj[v].add(u)
+        cu, cv = self.comp[u], self.comp[v]
+        if cu != cv:
+            # Joins two trees: relabel the smaller one
+            if len(self.members[cu]) < len(self.members[cv]):
+                cu, cv = cv, cu
+            for node in self.members[cv]:
+                self.comp[node] = cu
+            self.members[cu] |= self.members.pop(cv)
+            self.tree[u].add(v)
+            self.tree[v].add(u)
+        # Either a new tree edge or a new blocked edge: both ends change
+        return set([u, v])
+
+    def remove_edge(self, u, v):
+        """ Remove the edge u - v, returns the changed nodes """
+        if v not in self.adj.get(u, ()):
+            return set()
+        self.adj[u].discard(v)
+        self.adj[v].discard(u)
+        changed = set([u, v])
+        if v not in self.tree[u]:
+            return changed
+        self.tree[u].discard(v)
+        self.tree[v].discard(u)
+        side = self._smaller_side(u, v)
+        # Look for a blocked edge crossing the cut to replace u - v
+        for node in side:
+            for nbr in self.adj[node]:
+                if nbr not in side and nbr not in self.tree[node]:
+                    self.tree[node].add(nbr)
+                    self.tree[nbr].add(node)
+                    changed.add(node)
+                    changed.add(nbr)
+                    return changed
+        # No replacement: the smaller side is a new component
+        old = self.comp[u]
+        self.members[old] -= side
+        new = self._next_comp
+        self._next_comp += 1
+        self.members[new] = side
+        for node in side:
+            self.comp[node] = new
+        return changed
+
+    def _smaller_side(self, u, v):
+        """ Nodes of the smaller of the two trees holding u and v
+
+        Both trees are explored one node at a time, so the cost is
+        bounded by the size of the smaller tree.
+        """
+        seen = (set([u]), set([v]))
+        stacks = ([u], [v])
+        while True:
+            for i in (0, 1):
+                if not stacks[i]:
+                    return seen[i]
+                node = stacks[i].pop()
+                for nbr in self.tree[node]:
+                    if nbr not in seen[i]:
+                        seen[i].add(nbr)
+                        stacks[i].append(nbr)
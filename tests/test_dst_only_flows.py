@@ -0,0 +1,47 @@
+"""
+    Turning the dst only flows (controller.py DST_ONLY_FLOWS) on and off
+    at run time.
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+from controller_case import ControllerCase
+
+
+def dst_only_flows(net):
+    """ (dpid, eth_dst) of the priority 1 flows matching eth_dst only """
+    return set((dpid, entry.eth_dst)
+               for dpid, datapath in net.dps.items()
+               for table in datapath.tables.values()
+               for entry in table.values()
+               if entry.priority == 1 and entry.match == (
+                   ('eth_dst', entry.eth_dst),))
+
+
+class DstOnlyFlowsTest(ControllerCase):
+
+    def test_on_then_off(self):
+        app, net = self.start_network(DST_ONLY_FLOWS=False)
+        self.assertDelivered(net)
+        self.assertEqual(dst_only_flows(net), set())
+        app.set_dst_only_flows(True)
+        consolidated = dst_only_flows(net)
+        self.assertTrue(consolidated)
+        self.assertDelivered(net)
+        app.set_dst_only_flows(False)
+        # Neither in the switches nor in the shadow flow table
+        self.assertEqual(dst_only_flows(net), set())
+        self.assertEqual([key for key in app.flows.entries
+                          if key[1] is None], [])
+        self.assertEqual([entry for entry in app.flow_refs
+                          if entry[1] is None], [])
+        # The traffic gets per in_port flows again
+        self.assertDelivered(net)
+        self.assertEqual(dst_only_flows(net), set())
+        self.assertTrue(app.flows.entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+    Broadcasts of controller.py: the flood groups of the spanning tree,
+    kept up to date when links go down and up (FLOOD_IN_SWITCH floods
+    them in the switches, without packets in).
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+from controller_case import ControllerCase
+from test_forwarding import switch_links
+
+BROADCAST = 'ff:ff:ff:ff:ff:ff'
+
+
+class FloodingTest(ControllerCase):
+
+    def assertFloodedOnce(self, net):
+        """ A broadcast of every host reaches every other host once """
+        for host in self.hosts:
+            others = [other for other in self.hosts if other != host]
+            self.assertEqual(sorted(net.send(host, BROADCAST)), others,
+                             host)
+            self.assertEqual(net.dropped, 0)
+
+    def links_down_and_up(self, **settings):
+        app, net = self.start_network(**settings)
+        self.assertFloodedOnce(net)
+        # A link of the spanning tree and another one, then both back
+        links = switch_links(net)
+        tree = [link for link in links if app.stp.has_edge(*link)]
+        other = [link for link in links if link not in tree]
+        ports = []
+        for u, v in tree[0], other[0]:
+            ports.append((u, v) + net.link_down(u, v))
+            self.assertFloodedOnce(net)
+        for u, v, u_port, v_port in ports:
+            net.link_up(u, u_port, v, v_port)
+            self.assertFloodedOnce(net)
+        return net
+
+    def test_flood_groups(self):
+        self.links_down_and_up()
+
+    def test_flood_in_switch(self):
+        net = self.links_down_and_up(FLOOD_IN_SWITCH=True)
+        net.packet_ins = 0
+        self.assertFloodedOnce(net)
+        self.assertEqual(net.packet_ins, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
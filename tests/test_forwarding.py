@@ -0,0 +1,130 @@
+"""
+    End to end delivery of the forwarding modes of controller.py while
+    links go down and up again and hosts move.
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import random
+import unittest
+
+import networkx as nx
+
+import controller
+from controller_case import ControllerCase
+from fake_network import FINAL_TOPO_APS
+from fake_network import FINAL_TOPO_SWITCHES
+
+
+def switch_links(net):
+    """ The (u, v) links up between two switches (not access points) """
+    return sorted(set((u, v) for (u, _), (v, _) in net.links.items()
+                      if u < v and u in FINAL_TOPO_SWITCHES and
+                      v in FINAL_TOPO_SWITCHES))
+
+
+def connected_without(net, link):
+    """ Whether the switches stay connected without link """
+    graph = nx.Graph(switch_links(net))
+    graph.remove_edge(*link)
+    return nx.is_connected(graph)
+
+
+class ForwardingTest(ControllerCase):
+
+    def churn(self, steps=30, seed=7, **settings):
+        """ Links go down and up and hosts move, every host reaching
+        every other one after each change
+
+        With the seed 7 a path overwrites a flow shared with the path of
+        another source. Returns the app.
+        """
+        app, net = self.start_network(**settings)
+        self.assertDelivered(net)
+        rnd = random.Random(seed)
+        down = []
+        for _ in range(steps):
+            action = rnd.choice(['down', 'up', 'move'])
+            links = [link for link in switch_links(net)
+                     if connected_without(net, link)]
+            if action == 'down' and links:
+                link = rnd.choice(links)
+                ports = net.link_down(*link)
+                down.append((link[0], ports[0], link[1], ports[1]))
+            elif action == 'up' and down:
+                net.link_up(*down.pop(rnd.randrange(len(down))))
+            else:
+                # The host announces itself from its new access point
+                host = rnd.choice(self.hosts)
+                net.move(host, rnd.choice(FINAL_TOPO_APS))
+                net.send(host, 'ff:ff:ff:ff:ff:ff')
+            self.assertDelivered(net)
+        return app
+
+    def test_pending_after_link_down(self):
+        app, net = self.start_network()
+        self.assertDelivered(net)
+        net.link_down(1, 2)
+        # The flows still in flight are the ones of the shadow flow table
+        self.assertTrue(app.pending.pending)
+        for key, (_, out_port) in app.pending.pending.items():
+            entry = app.flows.get(*key)
+            self.assertIsNotNone(entry, key)
+            self.assertEqual(entry.out_port, out_port)
+
+    def test_link_up_moves_pairs(self):
+        app, net = self.start_network()
+        ports = net.link_down(1, 2)
+        self.assertDelivered(net)
+        net.link_up(1, ports[0], 2, ports[1])
+        # Every pair is on its shortest path again
+        for (src, dst), flows in app.pair_flows.items():
+            path = app.pair_path(src, dst)
+            self.assertEqual([dpid for dpid, _ in flows], path[-2:0:-1])
+        self.assertDelivered(net)
+
+    def test_host(self):
+        self.churn()
+
+    def test_dst_only(self):
+        self.churn(DST_ONLY_FLOWS=True)
+
+    def test_not_proactive(self):
+        self.churn(PROACTIVE_PATH_INSTALL=False)
+
+    def test_not_bidirectional(self):
+        self.churn(BIDIRECTIONAL_FLOWS=False)
+
+    def test_make_before_break(self):
+        self.churn(MAKE_BEFORE_BREAK=True)
+
+    def test_pipeline(self):
+        self.churn(FORWARDING_MODE=controller.FORWARD_PIPELINE)
+
+    def test_label(self):
+        self.churn(FORWARDING_MODE=controller.FORWARD_LABEL)
+
+    def test_label_fast_failover(self):
+        self.churn(FORWARDING_MODE=controller.FORWARD_LABEL,
+                   FAST_FAILOVER=True)
+
+    def test_pipeline_ecmp(self):
+        self.churn(FORWARDING_MODE=controller.FORWARD_PIPELINE,
+                   ECMP_FORWARDING=True)
+
+    def test_sparse_topology(self):
+        self.churn(FORWARDING_MODE=controller.FORWARD_LABEL,
+                   SPARSE_TOPOLOGY=True)
+
+    def test_packet_in_workers(self):
+        app = self.churn(PACKET_IN_WORKERS=2)
+        self.assertTrue(app.shards.stats()['completed'])
+
+    def test_async_routes(self):
+        app = self.churn(FORWARDING_MODE=controller.FORWARD_PIPELINE,
+                         ASYNC_ROUTES=True)
+        self.assertTrue(app.route_worker.stats()['completed'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+"""
+    Host relocation from the packets in (controller.py HOST_RELOCATION)
+    while the links of a new switch are not discovered yet.
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+import controller
+from controller_case import ControllerCase
+from fake_network import Packet
+
+NEW_DPID = 0x2000
+
+
+class HostRelocationTest(ControllerCase):
+
+    def test_not_onto_undiscovered_link(self):
+        app, net = self.start_network(HOST_RELOCATION=True)
+        host = self.hosts[0]
+        location = app.hosts.location(host)
+        # Port 1 of the new switch goes to a switch, LLDP did not find
+        # the link yet: a flooded frame of host arrives there
+        datapath = net.add_switch(NEW_DPID, [1, 2])
+        net.packet_in(datapath, 1, Packet(host, 'ff:ff:ff:ff:ff:ff'))
+        self.assertEqual(app.hosts.location(host), location)
+        self.assertEqual(app.relocations, 0)
+        # Later, a frame of host on that port is a move
+        app.switch_entered[NEW_DPID] -= controller.RELOCATION_SETTLE
+        net.packet_in(datapath, 2, Packet(host, 'ff:ff:ff:ff:ff:ff'))
+        self.assertEqual(app.hosts.location(host), (NEW_DPID, 2))
+        self.assertEqual(app.relocations, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+    Labels of the switches in the label forwarding mode (controller.py
+    MAX_SWITCH_LABEL).
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+import controller
+from controller_case import ControllerCase
+
+
+class LabelTagTest(ControllerCase):
+
+    def test_labels_run_out(self):
+        app = self.start(FORWARDING_MODE=controller.FORWARD_LABEL)
+        for dpid in range(1, controller.MAX_SWITCH_LABEL + 1):
+            app.switch_tag(dpid)
+        tags = set(app.switch_tags.values())
+        self.assertEqual(tags, set(range(1, 0xfff)))
+        self.assertIsNone(app.switch_tag(0x10000))
+        self.assertEqual(app.untagged, set([0x10000]))
+        # The label of a switch that left is reused
+        app.release_switch_tag(7)
+        self.assertEqual(app.switch_tag(0x10000), 7)
+        self.assertEqual(app.untagged, set())
+
+    def test_host_flows_without_label(self):
+        app, net = self.start_network(FORWARDING_MODE=controller.FORWARD_LABEL,
+                                      MAX_SWITCH_LABEL=4)
+        self.assertEqual(sorted(app.switch_tags.values()), [1, 2, 3, 4])
+        self.assertEqual(len(app.untagged), len(net.dps) - 4)
+        self.assertDelivered(net)
+
+    def test_label_reused_after_switch_leave(self):
+        app, net = self.start_network(FORWARDING_MODE=controller.FORWARD_LABEL,
+                                      MAX_SWITCH_LABEL=4)
+        untagged = len(app.untagged)
+        dpid = min(app.switch_tags)
+        tag = app.switch_tags[dpid]
+        net.remove_switch(dpid)
+        self.assertNotIn(dpid, app.switch_tags)
+        self.assertIn(tag, app.switch_tags.values())
+        self.assertEqual(len(app.untagged), untagged - 1)
+        self.assertDelivered(net)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+    Packet in rate protection of controller.py: the table-miss meter
+    (PACKET_IN_RATE) and the controller token bucket
+    (PACKET_IN_LIMIT_RATE), both off by default.
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+from ryu.controller import ofp_event
+
+from controller_case import ControllerCase
+from fake_network import FINAL_TOPO_APS
+from fake_network import Packet
+
+
+def meter_features_reply(datapath):
+    """ The reply of a switch with drop band meters """
+    ofproto = datapath.ofproto
+    parser = datapath.ofproto_parser
+    features = parser.OFPMeterFeaturesStats(
+        max_meter=64, band_types=1 << ofproto.OFPMBT_DROP, capabilities=0,
+        max_bands=1, max_color=0)
+    msg = parser.OFPMeterFeaturesStatsReply(datapath)
+    msg.body = [features]
+    return ofp_event.EventOFPMeterFeaturesStatsReply(msg)
+
+
+class PacketInLimitTest(ControllerCase):
+
+    def test_off_by_default(self):
+        app, net = self.start_network()
+        for datapath in net.dps.values():
+            self.assertNotIn('OFPMeterFeaturesStatsRequest', datapath.counts)
+        self.assertIsNone(app.limiter)
+        self.assertDelivered(net)
+
+    def test_meter(self):
+        app, net = self.start_network(PACKET_IN_RATE=1000)
+        datapath = net.dps[FINAL_TOPO_APS[0]]
+        self.assertEqual(datapath.counts['OFPMeterFeaturesStatsRequest'], 1)
+        net.dispatch(meter_features_reply(datapath))
+        self.assertEqual(app.metered, set([datapath.id]))
+        # Delete the meter of a previous controller, then add it
+        self.assertEqual(datapath.counts['OFPMeterMod'], 2)
+        self.assertDelivered(net)
+
+    def test_limiter(self):
+        app, net = self.start_network(PACKET_IN_LIMIT_RATE=1,
+                                      PACKET_IN_LIMIT_BURST=5)
+        datapath = net.dps[FINAL_TOPO_APS[0]]
+        before = app.packet_in_stats()[datapath.id]['controller']
+        # A full bucket, then a storm within a second: the burst passes
+        app.limiter.buckets.clear()
+        for _ in range(20):
+            net.packet_in(datapath, 1, Packet(self.hosts[0],
+                                              'ff:ff:ff:ff:ff:ff'))
+        after = app.packet_in_stats()[datapath.id]['controller']
+        admitted = after['admitted'] - before['admitted']
+        self.assertIn(admitted, (5, 6))
+        self.assertEqual(after['dropped'] - before['dropped'], 20 - admitted)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+    Host mode path installation of controller.py: the whole path on the
+    first packet in (PROACTIVE_PATH_INSTALL), the reverse path with it
+    (BIDIRECTIONAL_FLOWS) and the flows deleted when a host moves.
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+import controller
+from controller_case import ControllerCase
+
+
+def dst_flows(app, net, dst):
+    """ The (dpid, table, priority, match) of the flows toward dst """
+    cookie = app.dst_cookie(dst) & controller.COOKIE_DST_MASK
+    return set((dpid, table_id) + key
+               for dpid, datapath in net.dps.items()
+               for table_id, table in datapath.tables.items()
+               for key, entry in table.items()
+               if entry.cookie & controller.COOKIE_DST_MASK == cookie)
+
+
+class PathInstallTest(ControllerCase):
+
+    def first_packet(self, **settings):
+        """ Controller round trips of the first packet between the two
+        hosts farthest apart, then of the reply and of the next one """
+        app, net = self.start_network(**settings)
+        src, dst = self.hosts[0], self.hosts[-1]
+        trips = []
+        for a, b in [(src, dst), (dst, src), (src, dst)]:
+            self.assertEqual(net.send(a, b), [b])
+            trips.append(net.trips[b])
+        return app, trips
+
+    def test_whole_path(self):
+        app, trips = self.first_packet()
+        self.assertEqual(trips, [1, 0, 0])
+
+    def test_hop_by_hop(self):
+        app, trips = self.first_packet(PROACTIVE_PATH_INSTALL=False)
+        # One packet in per switch of the path
+        path = app.pair_path(self.hosts[0], self.hosts[-1])
+        self.assertEqual(trips, [len(path) - 2, 0, 0])
+
+    def test_not_bidirectional(self):
+        app, trips = self.first_packet(BIDIRECTIONAL_FLOWS=False)
+        self.assertEqual(trips, [1, 1, 0])
+
+    def test_move_deletes_only_its_flows(self):
+        app, net = self.start_network()
+        self.assertDelivered(net)
+        host, other = self.hosts[0], self.hosts[1]
+        # The flows toward other of the pairs of the other sources
+        kept = set(flow for (src, dst), flows in app.pair_flows.items()
+                   if dst == other and src != host for flow in flows)
+        self.assertTrue(dst_flows(app, net, host))
+        net.move(host, net.hosts[other][0])
+        net.send(host, 'ff:ff:ff:ff:ff:ff')
+        self.assertEqual(dst_flows(app, net, host), set())
+        self.assertTrue(kept)
+        self.assertEqual(set((dpid, dict(match)['in_port']) for dpid, _, _,
+                             match in dst_flows(app, net, other)), kept)
+        self.assertDelivered(net)
+
+
+if __name__ == '__main__':
+    unittest.main()
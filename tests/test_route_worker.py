@@ -0,0 +1,53 @@
+"""
+    The route worker process of controller.py (ASYNC_ROUTES,
+    route_worker.py RouteWorker).
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import os
+import signal
+import unittest
+
+from ryu.lib import hub
+
+import controller_case  # noqa: the repository modules on sys.path
+from route_worker import RouteWorker
+
+
+def add(a, b):
+    return a + b
+
+
+class RouteWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.results = []
+        self.worker = RouteWorker(
+            lambda epoch, result: self.results.append((epoch, result)))
+
+    def tearDown(self):
+        self.worker.close()
+
+    def run_worker(self, epoch, *args):
+        """ Submit add(*args) and wait for its callback """
+        self.worker.submit(epoch, add, *args)
+        while self.worker.busy:
+            hub.sleep(0.01)
+
+    def test_worker_killed(self):
+        self.run_worker(1, 1, 2)
+        os.kill(self.worker.worker.pid, signal.SIGKILL)
+        self.worker.worker.join()
+        # The lost computation still calls back, then a new worker runs
+        # the next one
+        self.run_worker(2, 2, 3)
+        self.assertEqual(self.worker.restarts, 1)
+        self.run_worker(3, 3, 4)
+        self.assertTrue(self.worker.worker.is_alive())
+        self.assertEqual(self.results, [(1, 3), (2, 5), (3, 7)])
+        self.assertEqual(self.worker.restarts, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
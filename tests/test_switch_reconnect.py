@@ -0,0 +1,96 @@
+"""
+    A switch leaving and entering again (controller.py add_switch and
+    remove_switch).
+
+    Run from the repository root:
+        python -m unittest discover tests
+"""
+import unittest
+
+import controller
+from controller_case import ControllerCase
+from fake_network import FINAL_TOPO_APS
+
+
+def record_msgs(datapath, msg_class):
+    """ Return the list the msg_class messages sent to datapath are
+    appended to """
+    sent = []
+    send_msg = datapath.send_msg
+
+    def record(msg):
+        if isinstance(msg, msg_class):
+            sent.append(msg)
+        send_msg(msg)
+    datapath.send_msg = record
+    return sent
+
+
+class SwitchReconnectTest(ControllerCase):
+
+    def leave_and_enter(self, net, dpid):
+        """ The switch dpid leaves and enters again, keeping its tables
+        (like Open vSwitch). Returns the GroupMods it got when entering,
+        its links and its hosts (see relink). """
+        datapath = net.dps[dpid]
+        links = [(u, u_port, v, v_port) for (u, u_port), (v, v_port)
+                 in sorted(net.links.items()) if u == dpid]
+        hosts = [host for host, location in net.hosts.items()
+                 if location[0] == dpid]
+        net.remove_switch(dpid)
+        sent = record_msgs(datapath, datapath.ofproto_parser.OFPGroupMod)
+        net.dps[dpid] = datapath
+        net.switch_enter(datapath)
+        return sent, links, hosts
+
+    def relink(self, net, dpid, links, hosts):
+        """ The links and hosts of a switch that entered again """
+        for u, u_port, v, v_port in links:
+            net.add_link(u, u_port, v, v_port)
+        for host in hosts:
+            net.attach(host, dpid)
+            net.send(host, 'ff:ff:ff:ff:ff:ff')
+
+    def reconnect(self, net, dpid):
+        """ The switch dpid leaves and enters again with its links and
+        hosts. Returns the GroupMods it got when entering. """
+        sent, links, hosts = self.leave_and_enter(net, dpid)
+        self.relink(net, dpid, links, hosts)
+        return sent
+
+    def test_flood_group_added_again(self):
+        app, net = self.start_network()
+        # An access point: its only link is never blocked, so its flood
+        # ports are the same after the reconnection
+        dpid = FINAL_TOPO_APS[0]
+        sent = self.reconnect(net, dpid)
+        ofproto = net.dps[dpid].ofproto
+        self.assertIn((ofproto.OFPGC_ADD, controller.FLOOD_GROUP_ID),
+                      [(msg.command, msg.group_id) for msg in sent])
+        self.assertIn(controller.FLOOD_GROUP_ID, net.dps[dpid].groups)
+        self.assertDelivered(net)
+
+    def test_stale_host_flows_deleted(self):
+        app, net = self.start_network()
+        self.assertDelivered(net)
+        dpid = max(net.dps, key=app.flows.count)
+        datapath = net.dps[dpid]
+        flow_mods = record_msgs(datapath, datapath.ofproto_parser.OFPFlowMod)
+        _, links, hosts = self.leave_and_enter(net, dpid)
+        # The flows of the previous connection are gone with the shadow
+        # flow table entries (before its links bring paths back), with
+        # one delete whatever the number of hosts
+        deletes = [msg for msg in flow_mods
+                   if msg.command == datapath.ofproto.OFPFC_DELETE]
+        self.assertEqual(len(deletes), 1)
+        host_flows = [entry for table in net.dps[dpid].tables.values()
+                      for entry in table.values()
+                      if entry.cookie & controller.COOKIE_DST_MASK]
+        self.assertEqual(host_flows, [])
+        self.assertEqual(app.flows.count(dpid), 0)
+        self.relink(net, dpid, links, hosts)
+        self.assertDelivered(net)
+
+
+if __name__ == '__main__':
+    unittest.main()
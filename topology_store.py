@@ -0,0 +1,438 @@
+"""
+    Integer indexed topology store used by the SDN controller
+    (controller.py, see SPARSE_TOPOLOGY).
+
+    Every node key (switch dpid or host MAC) gets a small integer ID. The
+    edges are kept as one {neighbour ID: port} dict per node. The routes
+    from (or to) every node run on CSR adjacency arrays (NumPy) with
+    scipy.sparse.csgraph: one breadth first search in C instead of the
+    Python loops of networkx. The CSR arrays are rebuilt on the first
+    such query after a change. The path of a single pair is a
+    bidirectional breadth first search in Python on the neighbour dicts,
+    it stops when the two frontiers meet.
+
+    The part of the networkx.DiGraph API used by the controller is kept
+    (add_node, add_edge with a 'port', store[u][v]['port'], node[n], ...)
+    and shortest_path / shortest_path_length below accept either graph.
+    store[u][v] is a live view of the edge: writing its 'port' changes
+    the edge, writing another attribute raises TypeError.
+"""
+import networkx as nx
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from scipy.sparse import csgraph
+except ImportError:
+    np = None
+
+
+class TopologyStore(object):
+    """ Directed graph of integer node IDs with a port on every edge """
+
+    def __init__(self):
+        if np is None:
+            raise ImportError('TopologyStore needs numpy and scipy')
+        # key -> ID and ID -> key (None for a free ID)
+        self.ids = {}
+        self.keys = []
+        self.free = []
+        # ID -> {successor ID: port}, ID -> set of predecessor IDs
+        self.succ = []
+        self.pred = []
+        # ID -> node attributes
+        self.attrs = []
+        self.node = _Nodes(self)
+        # CSR adjacency (and its transpose), None when out of date
+        self._csr = None
+        self._csr_t = None
+        self.rebuilds = 0
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __getitem__(self, key):
+        return _Adjacency(self, self.ids[key])
+
+    def nodes(self):
+        return list(self.ids)
+
+    def edges(self, data=None):
+        """ Return the (u, v) edges, (u, v, port) with data='port' """
+        edges = []
+        for uid, nbrs in enumerate(self.succ):
+            if nbrs is None:
+                continue
+            u = self.keys[uid]
+            for vid, port in nbrs.items():
+                if data == 'port':
+                    edges.append((u, self.keys[vid], port))
+                else:
+                    edges.append((u, self.keys[vid]))
+        return edges
+
+    def number_of_nodes(self):
+        return len(self.ids)
+
+    def number_of_edges(self):
+        return sum(len(nbrs) for nbrs in self.succ if nbrs is not None)
+
+    def _changed(self):
+        self._csr = None
+        self._csr_t = None
+
+    def add_node(self, key, attr_dict=None, **attr):
+        uid = self.ids.get(key)
+        if uid is None:
+            if self.free:
+                uid = self.free.pop()
+                self.keys[uid] = key
+                self.succ[uid] = {}
+                self.pred[uid] = set()
+                self.attrs[uid] = {}
+            else:
+                uid = len(self.keys)
+                self.keys.append(key)
+                self.succ.append({})
+                self.pred.append(set())
+                self.attrs.append({})
+            self.ids[key] = uid
+            self._changed()
+        if attr_dict:
+            self.attrs[uid].update(attr_dict)
+        self.attrs[uid].update(attr)
+        return uid
+
+    def remove_node(self, key):
+        uid = self.ids.pop(key, None)
+        if uid is None:
+            raise nx.NetworkXError('The node %s is not in the graph.' %
+                                   (key,))
+        for vid in self.succ[uid]:
+            self.pred[vid].discard(uid)
+        for vid in self.pred[uid]:
+            del self.succ[vid][uid]
+        self.keys[uid] = None
+        self.succ[uid] = None
+        self.pred[uid] = None
+        self.attrs[uid] = None
+        self.free.append(uid)
+        self._changed()
+
+    def add_edge(self, u, v, attr_dict=None, **attr):
+        """ Add the edge u -> v, only its 'port' attribute is kept """
+        if attr_dict:
+            attr = dict(attr_dict, **attr)
+        uid = self.add_node(u)
+        vid = self.add_node(v)
+        if vid not in self.succ[uid]:
+            self.pred[vid].add(uid)
+            self._changed()
+        self.succ[uid][vid] = attr.get('port')
+
+    def remove_edge(self, u, v):
+        uid = self.ids.get(u)
+        vid = self.ids.get(v)
+        if uid is None or vid not in self.succ[uid]:
+            raise nx.NetworkXError('The edge %s-%s not in graph.' % (u, v))
+        del self.succ[uid][vid]
+        self.pred[vid].discard(uid)
+        self._changed()
+
+    def has_edge(self, u, v):
+        uid = self.ids.get(u)
+        return uid is not None and self.ids.get(v) in self.succ[uid]
+
+    def successors(self, key):
+        keys = self.keys
+        return [keys[vid] for vid in self.succ[self.ids[key]]]
+
+    neighbors = successors
+
+    def port(self, u, v):
+        """ Return the port of u toward v """
+        return self.succ[self.ids[u]][self.ids[v]]
+
+    # ------------------------ Routing ------------------------
+    def csr(self):
+        """ Return the CSR adjacency matrix (rows and columns are IDs) """
+        if self._csr is None:
+            size = len(self.keys)
+            indptr = np.zeros(size + 1, dtype=np.int32)
+            indptr[1:] = np.cumsum([len(nbrs) if nbrs is not None else 0
+                                    for nbrs in self.succ])
+            indices = np.empty(indptr[-1], dtype=np.int32)
+            for uid, nbrs in enumerate(self.succ):
+                if nbrs:
+                    indices[indptr[uid]:indptr[uid + 1]] = sorted(nbrs)
+            data = np.ones(len(indices), dtype=np.float64)
+            self._csr = csr_matrix((data, indices, indptr),
+                                   shape=(size, size))
+            self.rebuilds += 1
+        return self._csr
+
+    def csr_transpose(self):
+        """ Return the CSR matrix of the reversed edges """
+        if self._csr_t is None:
+            self._csr_t = self.csr().transpose().tocsr()
+        return self._csr_t
+
+    def _bfs(self, key, reverse=False):
+        """ BFS from key, returns (IDs in BFS order, predecessor IDs)
+
+        On the reversed edges the predecessor of a node is its next hop
+        toward key.
+        """
+        graph = self.csr_transpose() if reverse else self.csr()
+        return csgraph.breadth_first_order(graph, self.ids[key],
+                                           directed=True,
+                                           return_predecessors=True)
+
+    def _paths(self, order, preds, root):
+        """ Path of every node of a BFS from its root """
+        keys = self.keys
+        order = order.tolist()
+        preds = preds.tolist()
+        paths = {order[0]: [root]}
+        for uid in order[1:]:
+            paths[uid] = paths[preds[uid]] + [keys[uid]]
+        return paths
+
+    def _depths(self, order, preds):
+        """ Hop count of every node of a BFS from its root
+
+        Pointer jumping: each pass doubles the hops covered by anc, so
+        only log(depth) vectorized passes are needed.
+        """
+        root = order[0]
+        anc = preds[order]
+        anc[0] = root
+        # Position of each ID in order
+        pos = np.empty(len(self.keys), dtype=np.int32)
+        pos[order] = np.arange(len(order), dtype=np.int32)
+        anc = pos[anc]
+        depth = np.ones(len(order), dtype=np.int32)
+        depth[0] = 0
+        while anc.any():
+            depth += depth[anc]
+            anc = anc[anc]
+        return depth
+
+    def _bidirectional(self, sid, tid):
+        """ Path of IDs from sid to tid, None when there is none
+
+        A single pair search stops as soon as the two frontiers meet, so
+        it is cheaper than a full BFS from Python.
+        """
+        if sid == tid:
+            return [sid]
+        succ = self.succ
+        pred = self.pred
+        # ID -> previous ID (forward), ID -> next ID (backward)
+        before = {sid: None}
+        after = {tid: None}
+        forward = [sid]
+        backward = [tid]
+        while forward and backward:
+            if len(forward) <= len(backward):
+                frontier = []
+                for uid in forward:
+                    for vid in succ[uid]:
+                        if vid not in before:
+                            before[vid] = uid
+                            frontier.append(vid)
+                            if vid in after:
+                                return self._join(before, after, vid)
+                forward = frontier
+            else:
+                frontier = []
+                for uid in backward:
+                    for vid in pred[uid]:
+                        if vid not in after:
+                            after[vid] = uid
+                            frontier.append(vid)
+                            if vid in before:
+                                return self._join(before, after, vid)
+                backward = frontier
+        return None
+
+    @staticmethod
+    def _join(before, after, meet):
+        path = []
+        uid = meet
+        while uid is not None:
+            path.append(uid)
+            uid = before[uid]
+        path.reverse()
+        uid = after[meet]
+        while uid is not None:
+            path.append(uid)
+            uid = after[uid]
+        return path
+
+    def shortest_path(self, source=None, target=None):
+        """ Same results as nx.shortest_path (without weights)
+
+        source and target: the path (a list of keys). Only target: the
+        path of every node to target. Only source: the path from source
+        to every node. Raises nx.NetworkXNoPath when there is no path.
+        """
+        if source is not None and target is not None:
+            if source not in self.ids or target not in self.ids:
+                raise nx.NetworkXNoPath('Node %s or %s is not in G' %
+                                        (source, target))
+            path = self._bidirectional(self.ids[source], self.ids[target])
+            if path is None:
+                raise nx.NetworkXNoPath('No path between %s and %s.' %
+                                        (source, target))
+            keys = self.keys
+            return [keys[uid] for uid in path]
+        if target is not None:
+            if target not in self.ids:
+                raise nx.NetworkXNoPath('Target %s is not in G' % (target,))
+            order, preds = self._bfs(target, reverse=True)
+            paths = self._paths(order, preds, target)
+            keys = self.keys
+            # The paths were built from target, each one is reversed
+            return dict((keys[uid], path[::-1])
+                        for uid, path in paths.items())
+        if source is None:
+            raise ValueError('source or target is needed')
+        if source not in self.ids:
+            raise nx.NetworkXNoPath('Source %s is not in G' % (source,))
+        order, preds = self._bfs(source)
+        keys = self.keys
+        return dict((keys[uid], path) for uid, path in
+                    self._paths(order, preds, source).items())
+
+    def shortest_path_length(self, source=None, target=None):
+        """ Same results as nx.shortest_path_length (without weights) """
+        if source is not None and target is not None:
+            return len(self.shortest_path(source, target)) - 1
+        key = source if source is not None else target
+        if key not in self.ids:
+            raise nx.NetworkXNoPath('Node %s is not in G' % (key,))
+        order, preds = self._bfs(key, reverse=source is None)
+        keys = self.keys
+        return dict(zip([keys[uid] for uid in order.tolist()],
+                        self._depths(order, preds).tolist()))
+
+    def distance_matrix(self):
+        """ All pairs hop counts, indexed by ID (inf when no path) """
+        return csgraph.shortest_path(self.csr(), directed=True,
+                                     unweighted=True)
+
+    def nbytes(self):
+        """ Bytes of the CSR arrays """
+        if self._csr is None:
+            return 0
+        total = sum(array.nbytes for array in (
+            self._csr.data, self._csr.indices, self._csr.indptr))
+        if self._csr_t is not None:
+            total += sum(array.nbytes for array in (
+                self._csr_t.data, self._csr_t.indices, self._csr_t.indptr))
+        return total
+
+
+class _Nodes(object):
+    """ store.node[key] -> attribute dict (like DiGraph.node) """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, key):
+        return self.store.attrs[self.store.ids[key]]
+
+    def __contains__(self, key):
+        return key in self.store.ids
+
+    def __iter__(self):
+        return iter(self.store.ids)
+
+
+class _Adjacency(object):
+    """ store[u][v] -> the edge u -> v (like DiGraph[u][v]) """
+
+    def __init__(self, store, uid):
+        self.store = store
+        self.uid = uid
+
+    def __getitem__(self, key):
+        vid = self.store.ids[key]
+        if vid not in self.store.succ[self.uid]:
+            raise KeyError(key)
+        return _Edge(self.store, self.uid, vid)
+
+    def __contains__(self, key):
+        return self.store.ids.get(key) in self.store.succ[self.uid]
+
+    def __iter__(self):
+        keys = self.store.keys
+        return iter([keys[vid] for vid in self.store.succ[self.uid]])
+
+    def __len__(self):
+        return len(self.store.succ[self.uid])
+
+
+class _Edge(object):
+    """ Attributes of the edge uid -> vid, read and written in the store
+
+    Only 'port' is kept (see TopologyStore.add_edge).
+    """
+
+    def __init__(self, store, uid, vid):
+        self.store = store
+        self.uid = uid
+        self.vid = vid
+
+    def __getitem__(self, key):
+        if key != 'port':
+            raise KeyError(key)
+        return self.store.succ[self.uid][self.vid]
+
+    def __setitem__(self, key, value):
+        if key != 'port':
+            raise TypeError('TopologyStore edges only keep a port, not %r' %
+                            (key,))
+        self.store.succ[self.uid][self.vid] = value
+
+    def __contains__(self, key):
+        return key == 'port'
+
+    def __iter__(self):
+        return iter(['port'])
+
+    def __len__(self):
+        return 1
+
+    def get(self, key, default=None):
+        return self['port'] if key == 'port' else default
+
+    def items(self):
+        return [('port', self['port'])]
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def shortest_path(graph, source=None, target=None):
+    """ nx.shortest_path on a DiGraph or a TopologyStore """
+    if isinstance(graph, TopologyStore):
+        return graph.shortest_path(source, target)
+    return nx.shortest_path(graph, source, target)
+
+
+def shortest_path_length(graph, source=None, target=None):
+    """ nx.shortest_path_length on a DiGraph or a TopologyStore """
+    if isinstance(graph, TopologyStore):
+        return graph.shortest_path_length(source, target)
+    return nx.shortest_path_length(graph, source, target)
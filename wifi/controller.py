@@ -72,6 +72,15 @@ class SimpleSwitch13(app_manager.RyuApp):
         datapath.send_msg(mod)
         self.logger.debug('Deleting Flow: dpid=[%s]', datapath.id)
 
+    # -------------------- Path Selection ---------------------
+
+    def get_path(self, src, dst):
+        """ Path (list of nodes) from src to dst used for the new flows
+
+        Raises the nx.shortest_path exceptions when there is no path.
+        """
+        return nx.shortest_path(self.net, src, dst)
+
     # ------------------ Topology Functions -------------------
     def add_switch(self, ev):
         switch = ev.switch
@@ -202,7 +211,10 @@ class SimpleSwitch13(app_manager.RyuApp):
         # Try to get the destination from Network Graph
         if dst in self.net.nodes() and src in self.net.nodes():
             try:
-                path = nx.shortest_path(self.net, src, dst)
+                path = self.get_path(src, dst)
+                if dpid not in path:
+                    # The frame left the path of src (e.g. it changed)
+                    path = self.get_path(dpid, dst)
                 # Store the path to delete it later
                 # self.dst_paths[dst] = path
             except Exception as e:
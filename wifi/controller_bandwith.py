@@ -18,8 +18,10 @@ from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER
 from ryu.controller.handler import set_ev_cls
 from ryu.lib import hub
 from ryu.lib import dpid as dpid_lib
+from ryu.topology import event
 
 import matplotlib.pyplot as plt
+import networkx as nx
 import time
 
 # Update interval for Bandwith graph (seconds)
@@ -31,6 +33,23 @@ GRAPH_YLIMIT = 20
 GRAPH_XLABEL = 'Time (seconds)'
 GRAPH_YLABEL = 'Bandwith (Mbps)'
 GRAPH_DPID = '0000000000001009'
+# Congestion aware paths: the port stats of every switch are polled each
+# GRAPH_UPDATE_INTERVAL seconds and turned into the load (bit/s, moving
+# average) and utilization of the links in self.net. New flows take the
+# path with the lowest cost, a link costs 1 + CONGESTION_WEIGHT * util.
+LINK_CAPACITY = 10 * 1000 * 1000
+LOAD_SMOOTHING = 0.5
+CONGESTION_WEIGHT = 4.0
+# The path of a (src, dst) pair only changes to a path cheaper by more
+# than REROUTE_HYSTERESIS (fraction of the cost), so routes do not flap
+# (get_path decides, also when the load changes or a link is added). The
+# path is only forgotten (the next one is the cheapest) when a link of it
+# goes down.
+REROUTE_HYSTERESIS = 0.2
+# Also move the flows entering the network above ELEPHANT_RATE bit/s to
+# a less loaded path (uses the flow stats)
+ELEPHANT_REROUTE = False
+ELEPHANT_RATE = 1000 * 1000
 
 
 class SimpleMonitor13(SimpleSwitch13):
@@ -55,6 +74,13 @@ class SimpleMonitor13(SimpleSwitch13):
         self.axes.set_ylabel = GRAPH_YLABEL
         self.line, = self.axes.plot(self.xdata, self.ydata, 'r-')
         self.graph_time_step = 0
+        # Last tx counters: (dpid, port) -> (time, tx_bytes)
+        self.port_bytes = {}
+        # Last flow counters: (dpid, in_port, eth_dst) -> (time, bytes)
+        self.flow_bytes = {}
+        # Path of each (src, dst) pair, and the pairs using each link
+        self.paths = {}
+        self.link_paths = {}
 
     @set_ev_cls(ofp_event.EventOFPStateChange,
                 [MAIN_DISPATCHER, DEAD_DISPATCHER])
@@ -71,9 +97,9 @@ class SimpleMonitor13(SimpleSwitch13):
 
     def _monitor(self):
         while True:
+            # Every switch: the link loads are needed for the paths
             for dp in self.datapaths.values():
-                if (dpid_lib.dpid_to_str(dp.id) == GRAPH_DPID):
-                    self._request_stats(dp)
+                self._request_stats(dp)
             hub.sleep(GRAPH_UPDATE_INTERVAL)
 
     def _request_stats(self, datapath):
@@ -81,16 +107,126 @@ class SimpleMonitor13(SimpleSwitch13):
         ofproto = datapath.ofproto
         parser = datapath.ofproto_parser
         # Requesting Flow Stats
-        req = parser.OFPFlowStatsRequest(datapath)
-        datapath.send_msg(req)
+        if ELEPHANT_REROUTE:
+            req = parser.OFPFlowStatsRequest(datapath)
+            datapath.send_msg(req)
         # Requesting Port Stats
         req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_ANY)
         datapath.send_msg(req)
 
+    # ------------------ Congestion aware paths -------------------
+
+    def update_link_load(self, dpid, port_no, tx_bytes, now):
+        """ Update the load of the link leaving dpid by port_no """
+        key = (dpid, port_no)
+        last = self.port_bytes.get(key)
+        self.port_bytes[key] = (now, tx_bytes)
+        if last is None or now <= last[0] or tx_bytes < last[1]:
+            # First sample (or counters reset)
+            return
+        if dpid not in self.net:
+            # Stats of a switch not in the graph yet
+            return
+        rate = (tx_bytes - last[1]) * 8 / (now - last[0])
+        for nbr in self.net.successors(dpid):
+            attrib = self.net[dpid][nbr]
+            if attrib.get('port') != port_no:
+                continue
+            load = attrib.get('load', rate)
+            load += LOAD_SMOOTHING * (rate - load)
+            attrib['load'] = load
+            attrib['util'] = min(load / LINK_CAPACITY, 1.0)
+            attrib['cost'] = 1 + CONGESTION_WEIGHT * attrib['util']
+
+    def set_path(self, key, path):
+        """ Record the path of the (src, dst) pair key """
+        self.forget_path(key)
+        self.paths[key] = path
+        for link in zip(path, path[1:]):
+            self.link_paths.setdefault(link, set()).add(key)
+
+    def forget_path(self, key):
+        path = self.paths.pop(key, None)
+        if path is None:
+            return
+        for link in zip(path, path[1:]):
+            keys = self.link_paths.get(link)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.link_paths[link]
+
+    def forget_paths(self, u, v):
+        """ Forget the paths of the pairs using the link u -> v """
+        for key in list(self.link_paths.get((u, v), ())):
+            self.forget_path(key)
+
+    def path_cost(self, path):
+        """ Cost of a path, None if one of its links is gone """
+        cost = 0.0
+        for u, v in zip(path, path[1:]):
+            if not self.net.has_edge(u, v):
+                return None
+            cost += self.net[u][v].get('cost', 1)
+        return cost
+
+    def get_path(self, src, dst):
+        """ Least loaded path, the current one while not much worse """
+        best = nx.shortest_path(self.net, src, dst, weight='cost')
+        key = (src, dst)
+        current = self.paths.get(key)
+        if current is not None and current != best:
+            cost = self.path_cost(current)
+            if (cost is not None and cost <=
+                    self.path_cost(best) * (1 + REROUTE_HYSTERESIS)):
+                return current
+            self.logger.info('Path changed: %s -> %s %s', src, dst, best)
+        self.set_path(key, best)
+        return best
+
+    def pair_path(self, src, dst):
+        """ Path of the traffic src -> dst (see get_path), None if there
+        is none. The pairs rerouted on a link change take it too. """
+        if self.hosts.location(src) is None or dst not in self.net:
+            return None
+        try:
+            return self.get_path(src, dst)
+        except nx.NetworkXException:
+            return None
+
+    def reroute_elephant(self, dpid, in_port, dst, rate):
+        """ Move the flow of the host behind (dpid, in_port) to dst """
+        src = None
+        for nbr in self.net.successors(dpid):
+            if (self.net[dpid][nbr].get('port') == in_port and
+                    self.net.node[nbr].get('n_type') == 'host'):
+                src = nbr
+        if src is None or dst not in self.net:
+            # Not entering the network here
+            return
+        old = self.paths.get((src, dst))
+        try:
+            path = self.get_path(src, dst)
+        except nx.NetworkXException as e:
+            self.logger.info(e)
+            return
+        if path != old:
+            self.logger.info('Elephant %s -> %s (%d bit/s): %s',
+                             src, dst, rate, path)
+            self.track_pair(src, dst, self.install_path(path, dst))
+
+    @set_ev_cls(event.EventLinkDelete, MAIN_DISPATCHER)
+    def link_delete_handler(self, ev):
+        super(SimpleMonitor13, self).link_delete_handler(ev)
+        # The pairs of the link take the cheapest path next
+        self.forget_paths(ev.link.src.dpid, ev.link.dst.dpid)
+
     @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
     def flow_stats_reply_handler(self, ev):
         """ Handler for Flow Stats request """
         body = ev.msg.body
+        dpid = ev.msg.datapath.id
+        now = time.time()
         # self.logger.info('datapath         '
         #                  'in-port  eth-dst           '
         #                  'out-port packets  bytes')
@@ -105,13 +241,26 @@ class SimpleMonitor13(SimpleSwitch13):
             #                  stat.match['in_port'], stat.match['eth_dst'],
             #                  stat.instructions[0].actions[0].port,
             #                  stat.packet_count, stat.byte_count)
-            pass
+            in_port = stat.match['in_port']
+            dst = stat.match['eth_dst']
+            key = (dpid, in_port, dst)
+            last = self.flow_bytes.get(key)
+            self.flow_bytes[key] = (now, stat.byte_count)
+            if last is None or now <= last[0] or stat.byte_count < last[1]:
+                continue
+            rate = (stat.byte_count - last[1]) * 8 / (now - last[0])
+            if rate > ELEPHANT_RATE:
+                self.reroute_elephant(dpid, in_port, dst, rate)
 
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
     def port_stats_reply_handler(self, ev):
         """ Handler for Port Stats request """
         body = ev.msg.body
         dpid_str = dpid_lib.dpid_to_str(ev.msg.datapath.id)
+        now = time.time()
+        for stat in body:
+            self.update_link_load(ev.msg.datapath.id, stat.port_no,
+                                  stat.tx_bytes, now)
         # self.logger.info('datapath         port     '
         #                  'rx-pkts  rx-bytes rx-error '
         #                  'tx-pkts  tx-bytes tx-error')